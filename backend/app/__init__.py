@@ -5,6 +5,8 @@ from flask_cors import CORS
 from dotenv import load_dotenv
 import os
 
+from .database import DEFAULT_DATABASE_URL, engine_options, configure_engine
+
 # Load .env file
 load_dotenv()
 
@@ -21,15 +23,19 @@ def create_app():
     # Use SQLite for development if DATABASE_URL is not set
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
-        database_url = "sqlite:///exampulseai.db"
+        database_url = DEFAULT_DATABASE_URL
     
     app.config["SQLALCHEMY_DATABASE_URI"] = database_url
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    # Pool sizing / SQLite PRAGMAs from DB_* and SQLITE_* env vars (see app/database.py)
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = engine_options(database_url)
 
     # Initialize extensions
     CORS(app, origins=ALLOWED_ORIGINS)
     socketio.init_app(app)
     db.init_app(app)
+    with app.app_context():
+        configure_engine(db.engine)
     
     # Register blueprints
     from .routes.auth import auth_bp
@@ -44,10 +50,41 @@ def create_app():
 
     # Ensure socket handlers are imported
     from .sockets import handlers  # noqa: F401
+    from .sockets.scoring import scoring_queue
+    scoring_queue.init_app(app)
+    from .services.baseline_capture import calibration_queue
+    calibration_queue.init_app(app)
+    from .services.model_retrainer import model_retrainer
+    model_retrainer.init_app(app)
 
     # Health check endpoint
     @app.route('/api/health', methods=['GET'])
     def health_check():
         return {'status': 'healthy', 'message': 'ExamPulse AI Backend is running'}, 200
 
+    # Real-time fan-out, scoring, rule engine, cache, calibration, similarity index and retraining metrics
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        from .sockets.broadcaster import broadcaster
+        from .services import rule_engine
+        from .services.exam_policy import policy_cache
+        from .services.answer_key import answer_keys
+        from .services.risk_decay import tracker as risk_tracker
+        from .services.personal_models import personal_models
+        from .services.baseline_capture import calibration_queue
+        from .services.similarity_index import similarity_index
+        from .services.model_retrainer import model_retrainer
+        return {
+            'broadcaster': broadcaster.metrics(),
+            'scoring': scoring_queue.metrics(),
+            'rules': rule_engine.metrics(),
+            'policies': policy_cache.metrics(),
+            'answer_keys': answer_keys.metrics(),
+            'risk_decay': risk_tracker.metrics(),
+            'personal_models': personal_models.metrics(),
+            'calibration': calibration_queue.metrics(),
+            'similarity': similarity_index.metrics(),
+            'retraining': model_retrainer.metrics()
+        }, 200
+
     return app
@@ -0,0 +1,120 @@
+# app/database.py
+"""
+Database engine configuration
+
+Builds SQLAlchemy engine options from environment variables:
+- PostgreSQL: connection pool size / overflow / timeout, pre-ping and recycle
+- SQLite: WAL journal, busy timeout and synchronous level, applied as PRAGMAs
+  on every new connection so concurrent socket handlers queue on the writer
+  lock instead of failing with "database is locked"
+"""
+import os
+
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+DEFAULT_DATABASE_URL = "sqlite:///exampulseai.db"
+
+SQLITE_JOURNAL_MODES = {'DELETE', 'TRUNCATE', 'PERSIST', 'MEMORY', 'WAL', 'OFF'}
+SQLITE_SYNCHRONOUS_LEVELS = {'OFF', 'NORMAL', 'FULL', 'EXTRA'}
+
+
+def _env_int(env, name, default):
+    value = env.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+
+
+def _env_bool(env, name, default):
+    value = env.get(name)
+    if value in (None, ''):
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def _env_choice(env, name, default, choices):
+    value = (env.get(name) or default).strip().upper()
+    if value not in choices:
+        raise ValueError(f"{name} must be one of {sorted(choices)}, got {value!r}")
+    return value
+
+
+def is_sqlite(database_url):
+    return make_url(database_url).get_backend_name() == 'sqlite'
+
+
+def is_sqlite_memory(database_url):
+    return is_sqlite(database_url) and make_url(database_url).database in (None, '', ':memory:')
+
+
+def sqlite_settings(env=None):
+    """PRAGMA values for SQLite connections"""
+    env = os.environ if env is None else env
+    return {
+        'journal_mode': _env_choice(env, 'SQLITE_JOURNAL_MODE', 'WAL', SQLITE_JOURNAL_MODES),
+        'busy_timeout_ms': _env_int(env, 'SQLITE_BUSY_TIMEOUT_MS', 5000),
+        'synchronous': _env_choice(env, 'SQLITE_SYNCHRONOUS', 'NORMAL', SQLITE_SYNCHRONOUS_LEVELS),
+    }
+
+
+def engine_options(database_url, env=None):
+    """SQLALCHEMY_ENGINE_OPTIONS for the given database URL"""
+    env = os.environ if env is None else env
+    options = {
+        'pool_pre_ping': _env_bool(env, 'DB_POOL_PRE_PING', True),
+        'pool_recycle': _env_int(env, 'DB_POOL_RECYCLE', 1800),
+    }
+
+    if is_sqlite(database_url):
+        settings = sqlite_settings(env)
+        options['connect_args'] = {
+            # pysqlite's own lock wait, in seconds; matches the busy_timeout PRAGMA
+            'timeout': settings['busy_timeout_ms'] / 1000.0,
+            # Pooled connections are handed between socket handler threads
+            'check_same_thread': False,
+        }
+        if is_sqlite_memory(database_url):
+            # In-memory databases use a single-connection pool; sizing options don't apply
+            return options
+    else:
+        options['pool_timeout'] = _env_int(env, 'DB_POOL_TIMEOUT', 30)
+
+    options['pool_size'] = _env_int(env, 'DB_POOL_SIZE', 10)
+    options['max_overflow'] = _env_int(env, 'DB_MAX_OVERFLOW', 20)
+    return options
+
+
+def configure_engine(engine, env=None):
+    """Attach per-connection setup (SQLite PRAGMAs) to an engine"""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    settings = sqlite_settings(env)
+    in_memory = is_sqlite_memory(str(engine.url))
+
+    @event.listens_for(engine, 'connect')
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            if not in_memory:
+                cursor.execute(f"PRAGMA journal_mode={settings['journal_mode']}")
+            cursor.execute(f"PRAGMA busy_timeout={settings['busy_timeout_ms']}")
+            cursor.execute(f"PRAGMA synchronous={settings['synchronous']}")
+        finally:
+            cursor.close()
+
+
+def describe_engine(engine):
+    """Effective settings, for startup logging and benchmarks"""
+    info = {'dialect': engine.dialect.name, 'pool': type(engine.pool).__name__}
+    if hasattr(engine.pool, 'size'):
+        info['pool_size'] = engine.pool.size()
+    if engine.dialect.name == 'sqlite':
+        with engine.connect() as conn:
+            for pragma in ('journal_mode', 'busy_timeout', 'synchronous'):
+                info[pragma] = conn.exec_driver_sql(f'PRAGMA {pragma}').scalar()
+    return info
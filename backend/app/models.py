@@ -1,7 +1,13 @@
 from . import db
 from datetime import datetime
+import numpy as np
 from sqlalchemy import Text
-import json
+from sqlalchemy.dialects.postgresql import JSONB
+
+from .services import baseline_utils
+
+# Native JSONB on PostgreSQL; SQLite stores JSON text and SQLAlchemy handles (de)serialization
+JSONType = db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql')
 
 class User(db.Model):
     __tablename__ = "users"
@@ -15,7 +21,7 @@ class User(db.Model):
     semester = db.Column(db.String(50), nullable=True)
     phone = db.Column(db.String(20), nullable=True)
     role = db.Column(db.String(20), default='student', nullable=False)  # 'student' or 'proctor'
-    accommodations = db.Column(Text, nullable=True)  # JSON string for SQLite compatibility
+    accommodations = db.Column(JSONType, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
     
@@ -54,7 +60,7 @@ class Exam(db.Model):
     monitoring_sensitivity = db.Column(db.String(20), default='medium')  # low, medium, high
     allow_tab_switch = db.Column(db.Boolean, default=False)
     allow_copy_paste = db.Column(db.Boolean, default=False)
-    questions = db.Column(Text, nullable=True)  # JSON string of questions
+    questions = db.Column(JSONType, nullable=True)  # list of questions
     status = db.Column(db.String(20), default='scheduled')  # scheduled, active, completed
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now())
@@ -87,21 +93,40 @@ class ExamSession(db.Model):
     __tablename__ = "exam_sessions"
     
     id = db.Column(db.Integer, primary_key=True)
-    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False, index=True)
+    # exam_id is indexed as the leading column of ix_exam_sessions_lookup
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     started_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     submitted_at = db.Column(db.DateTime, nullable=True)
     time_taken_seconds = db.Column(db.Integer, nullable=True)
-    answers = db.Column(Text, nullable=True)  # JSON string of answers
+    answers = db.Column(JSONType, nullable=True)  # {question_index: answer}
     score = db.Column(db.Float, nullable=True)
     risk_score = db.Column(db.Float, default=0.0)
     integrity_score = db.Column(db.Float, default=1.0)
     status = db.Column(db.String(20), default='in_progress')  # in_progress, submitted, flagged
     flagged_incidents_count = db.Column(db.Integer, default=0)
+    # Highest behavior_batch sequence stored for this session (duplicate batches are skipped)
+    last_batch_seq = db.Column(db.BigInteger, nullable=True)
+    # Highest client event seq stored for this session (replayed events at or below it are skipped)
+    last_event_seq = db.Column(db.BigInteger, nullable=True)
+    # Scored behavior as little-endian float32: the 40 extractor features and the
+    # answer time per question (services/similarity_index.py)
+    feature_vector = db.Column(db.LargeBinary, nullable=True)
+    answer_timings = db.Column(db.LargeBinary, nullable=True)
+    
+    __table_args__ = (
+        # Hot path: filter_by(exam_id=..., user_id=..., status='in_progress') on every socket event
+        db.Index('ix_exam_sessions_lookup', 'exam_id', 'user_id', 'status'),
+        # Roster / bulk close: in-progress sessions of one exam
+        db.Index('ix_exam_sessions_exam_in_progress', 'exam_id',
+                 postgresql_where=db.text("status = 'in_progress'"),
+                 sqlite_where=db.text("status = 'in_progress'")),
+    )
     
     # Relationships
     events = db.relationship('Event', backref='session', lazy='dynamic', cascade='all, delete-orphan')
-    alerts = db.relationship('Alert', backref='session', lazy='dynamic', cascade='all, delete-orphan')
+    alerts = db.relationship('Alert', backref='session', lazy='dynamic', cascade='all, delete-orphan',
+                             foreign_keys='Alert.session_id')
     
     def to_dict(self):
         return {
@@ -126,18 +151,41 @@ class Event(db.Model):
     __tablename__ = 'events'
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('exam_sessions.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('exam_sessions.id'), nullable=False)  # see ix_events_session_time
     event_type = db.Column(db.String(50), nullable=False, index=True)  # tab_switch, copy_paste, window_blur, etc.
-    event_data = db.Column(Text, nullable=True)  # JSON string of event details
+    event_data = db.Column(JSONType, nullable=True)  # raw event payload
     timestamp = db.Column(db.DateTime, default=db.func.now(), nullable=False, index=True)
     severity = db.Column(db.String(20), default='low')  # low, medium, high
     
+    # Hot payload attributes promoted to typed columns so scoring and analytics
+    # can aggregate them in SQL instead of parsing event_data
+    duration = db.Column(db.Float, nullable=True)  # seconds, e.g. window_blur
+    count = db.Column(db.Integer, nullable=True)  # client-side running count, e.g. tab_switch
+    
+    __table_args__ = (
+        db.Index('ix_events_session_time', 'session_id', 'timestamp'),
+        db.Index('ix_events_event_data_gin', 'event_data', postgresql_using='gin').ddl_if(dialect='postgresql'),
+    )
+    
+    @staticmethod
+    def promoted_attributes(data):
+        """Typed column values for the hot attributes of an event payload"""
+        data = data or {}
+        
+        def number(key, cast):
+            try:
+                return cast(data[key]) if data.get(key) is not None else None
+            except (TypeError, ValueError):
+                return None
+        
+        return {'duration': number('duration', float), 'count': number('count', int)}
+    
     def to_dict(self):
         return {
             'id': self.id,
             'session_id': self.session_id,
             'event_type': self.event_type,
-            'event_data': json.loads(self.event_data) if self.event_data else {},
+            'event_data': self.event_data or {},
             'timestamp': self.timestamp.isoformat() if self.timestamp else None,
             'severity': self.severity
         }
@@ -150,7 +198,9 @@ class Alert(db.Model):
     __tablename__ = 'alerts'
     
     id = db.Column(db.Integer, primary_key=True)
-    session_id = db.Column(db.Integer, db.ForeignKey('exam_sessions.id'), nullable=False, index=True)
+    session_id = db.Column(db.Integer, db.ForeignKey('exam_sessions.id'), nullable=False)  # see ix_alerts_session_created
+    # The other session of a pair alert (answer_collusion); None for single-session alerts
+    related_session_id = db.Column(db.Integer, db.ForeignKey('exam_sessions.id', ondelete='SET NULL'), nullable=True)
     alert_type = db.Column(db.String(50), nullable=False)
     message = db.Column(Text, nullable=False)
     risk_score = db.Column(db.Float, nullable=False)
@@ -159,10 +209,19 @@ class Alert(db.Model):
     resolved_by = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False, index=True)
     
+    __table_args__ = (
+        db.Index('ix_alerts_session_created', 'session_id', 'created_at'),
+        # Review queue: only unresolved alerts are indexed
+        db.Index('ix_alerts_unresolved', 'session_id', 'created_at',
+                 postgresql_where=db.text('resolved = false'),
+                 sqlite_where=db.text('resolved = 0')),
+    )
+    
     def to_dict(self):
         return {
             'id': self.id,
             'session_id': self.session_id,
+            'related_session_id': self.related_session_id,
             'alert_type': self.alert_type,
             'message': self.message,
             'risk_score': self.risk_score,
@@ -179,21 +238,69 @@ class Baseline(db.Model):
     __tablename__ = "baselines"
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True, nullable=False)
-    features = db.Column(Text, nullable=False)  # JSON string of behavioral features
+    # One row per user (migrate_baseline_unique.py for existing databases)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True, unique=True, nullable=False)
+    features = db.Column(JSONType, nullable=False)  # {feature_name: value}
     sample_count = db.Column(db.Integer, default=1, nullable=False)
     typing_speed_wpm = db.Column(db.Float, nullable=True)
     mouse_speed_pxs = db.Column(db.Float, nullable=True)
     avg_question_time_sec = db.Column(db.Float, nullable=True)
     tab_switch_rate = db.Column(db.Float, nullable=True)
+    # Welford accumulators {'features': {name: [count, mean, M2, spread_count]}, 'metrics': {column: [...]}};
+    # features and the metric columns above hold the means (see services/baseline_utils.py)
+    feature_stats = db.Column(JSONType, nullable=True)
+    # Personal anomaly model over the 40 extractor features, packed float32 (services/personal_models.py)
+    feature_model = db.Column(db.LargeBinary, nullable=True)
     created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
     updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), nullable=False)
     
+    def current_stats(self):
+        """feature_stats, seeded from the stored means for baselines created before it existed"""
+        if self.feature_stats:
+            return self.feature_stats
+        return {
+            'features': baseline_utils.seed_stats(self.features, self.sample_count),
+            'metrics': baseline_utils.seed_stats(
+                {column: getattr(self, column) for column in baseline_utils.METRIC_COLUMNS},
+                self.sample_count
+            )
+        }
+    
+    def add_sample(self, features=None, metrics=None):
+        """Fold one calibration sample into the running means and variances (O(features))"""
+        stats = self.current_stats()
+        feature_stats = baseline_utils.merge_sample(stats.get('features'), features or {})
+        metric_stats = baseline_utils.merge_sample(
+            stats.get('metrics'),
+            {k: v for k, v in (metrics or {}).items() if k in baseline_utils.METRIC_COLUMNS}
+        )
+        
+        self.feature_stats = {'features': feature_stats, 'metrics': metric_stats}
+        # Non-numeric features keep their latest value
+        self.features = {
+            **(self.features or {}),
+            **(features or {}),
+            **{name: stats[1] for name, stats in feature_stats.items()}
+        }
+        for column, column_stats in metric_stats.items():
+            setattr(self, column, column_stats[1])
+        self.sample_count = (self.sample_count or 0) + 1
+    
+    def metric_std(self, column):
+        return baseline_utils.std(self.current_stats().get('metrics', {}).get(column))
+    
+    def metric_z_score(self, column, value):
+        """How many of this user's standard deviations value is from their mean (None if unknown)"""
+        return baseline_utils.z_score(self.current_stats().get('metrics', {}).get(column), value)
+    
     def to_dict(self):
+        stats = self.current_stats()
         return {
             'id': self.id,
             'user_id': self.user_id,
-            'features': json.loads(self.features) if self.features else {},
+            'features': self.features or {},
+            'feature_std': {name: baseline_utils.std(s) for name, s in stats.get('features', {}).items()},
+            'metric_std': {name: baseline_utils.std(s) for name, s in stats.get('metrics', {}).items()},
             'sample_count': self.sample_count,
             'typing_speed_wpm': self.typing_speed_wpm,
             'mouse_speed_pxs': self.mouse_speed_pxs,
@@ -205,3 +312,102 @@ class Baseline(db.Model):
     
     def __repr__(self):
         return f"<Baseline id={self.id} user={self.user_id} samples={self.sample_count}>"
+
+
+class BaselineSample(db.Model):
+    """One calibration session reduced to the 40 extractor features (services/behavior_features.py)"""
+    __tablename__ = "baseline_samples"
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("users.id"), index=True, nullable=False)
+    # Little-endian float32 in FEATURE_NAMES order (160 bytes); nan = feature unavailable
+    feature_vector = db.Column(db.LargeBinary, nullable=False)
+    feature_layout = db.Column(db.BigInteger, nullable=False)  # behavior_features.FEATURE_LAYOUT_ID
+    duration_seconds = db.Column(db.Float, nullable=True)
+    created_at = db.Column(db.DateTime, default=db.func.now(), nullable=False)
+    
+    def vector(self):
+        return np.frombuffer(self.feature_vector, dtype='<f4')
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'user_id': self.user_id,
+            'n_features': len(self.feature_vector) // 4,
+            'duration_seconds': self.duration_seconds,
+            'created_at': self.created_at.isoformat() if self.created_at else None
+        }
+    
+    def __repr__(self):
+        return f"<BaselineSample id={self.id} user={self.user_id}>"
+
+
+class RollupCountersMixin:
+    """Counter columns shared by the per-exam and per-bucket analytics rollups"""
+    sessions_started = db.Column(db.Integer, default=0, nullable=False)
+    sessions_submitted = db.Column(db.Integer, default=0, nullable=False)
+    events_count = db.Column(db.Integer, default=0, nullable=False)
+    low_severity_events = db.Column(db.Integer, default=0, nullable=False)
+    medium_severity_events = db.Column(db.Integer, default=0, nullable=False)
+    high_severity_events = db.Column(db.Integer, default=0, nullable=False)
+    alerts_count = db.Column(db.Integer, default=0, nullable=False)
+    risk_low_count = db.Column(db.Integer, default=0, nullable=False)  # submitted sessions with risk < 0.3
+    risk_medium_count = db.Column(db.Integer, default=0, nullable=False)  # 0.3 <= risk < 0.7
+    risk_high_count = db.Column(db.Integer, default=0, nullable=False)  # risk >= 0.7
+    risk_score_sum = db.Column(db.Float, default=0.0, nullable=False)
+
+    def counters_dict(self):
+        return {
+            'sessions_started': self.sessions_started or 0,
+            'sessions_submitted': self.sessions_submitted or 0,
+            'events_count': self.events_count or 0,
+            'events_by_severity': {
+                'low': self.low_severity_events or 0,
+                'medium': self.medium_severity_events or 0,
+                'high': self.high_severity_events or 0
+            },
+            'alerts_count': self.alerts_count or 0,
+            'risk_distribution': {
+                'low': self.risk_low_count or 0,
+                'medium': self.risk_medium_count or 0,
+                'high': self.risk_high_count or 0
+            },
+            'avg_risk_score': (self.risk_score_sum / self.sessions_submitted) if self.sessions_submitted else None
+        }
+
+
+class ExamAnalytics(RollupCountersMixin, db.Model):
+    """Running per-exam totals, maintained incrementally by services/analytics_rollup.py"""
+    __tablename__ = 'exam_analytics'
+    
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), primary_key=True)
+    updated_at = db.Column(db.DateTime, default=db.func.now(), onupdate=db.func.now(), nullable=False)
+    
+    def to_dict(self):
+        data = {'exam_id': self.exam_id}
+        data.update(self.counters_dict())
+        data['updated_at'] = self.updated_at.isoformat() if self.updated_at else None
+        return data
+    
+    def __repr__(self):
+        return f"<ExamAnalytics exam={self.exam_id} events={self.events_count}>"
+
+
+class ExamAnalyticsBucket(RollupCountersMixin, db.Model):
+    """Per-exam counters for a fixed-width time bucket (see ANALYTICS_BUCKET_SECONDS)"""
+    __tablename__ = 'exam_analytics_buckets'
+    __table_args__ = (
+        db.UniqueConstraint('exam_id', 'bucket_start', name='uq_exam_analytics_bucket'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    exam_id = db.Column(db.Integer, db.ForeignKey('exams.id'), nullable=False)
+    bucket_start = db.Column(db.DateTime, nullable=False)
+    
+    def to_dict(self):
+        data = {'bucket_start': self.bucket_start.isoformat() if self.bucket_start else None}
+        data.update(self.counters_dict())
+        return data
+    
+    def __repr__(self):
+        return f"<ExamAnalyticsBucket exam={self.exam_id} start={self.bucket_start}>"
@@ -2,7 +2,10 @@
 from flask import Blueprint, request, jsonify
 from app import db
 from app.models import Baseline, User
-import json
+from app.services.baseline_utils import METRIC_COLUMNS
+from app.services import telemetry_codec
+from app.services.baseline_capture import calibration_queue, lock_baseline, refit_personal_model
+from app.services.personal_models import PersonalModel
 import jwt
 import os
 from datetime import datetime
@@ -24,6 +27,12 @@ def get_user_from_token():
         return None
 
 
+def personal_model_info(baseline):
+    """Summary of the stored personal anomaly model, or None"""
+    model = PersonalModel.from_bytes(baseline.feature_model)
+    return model.to_dict() if model else None
+
+
 @baselines_bp.route('/', methods=['POST'])
 def create_baseline():
     """Create or update user baseline"""
@@ -32,60 +41,121 @@ def create_baseline():
         if not user:
             return jsonify({'error': 'Unauthorized'}), 401
         
-        data = request.get_json()
+        data = request.get_json() or {}
         
-        # Check if baseline exists
-        baseline = Baseline.query.filter_by(user_id=user.id).first()
+        # With raw telemetry the session is counted once, off-thread, with metrics
+        # measured by the extractor (services/baseline_capture.py) rather than
+        # the client's: mixing both in one running mean would skew it
+        session_data = data.get('session_data')
+        calibration = None
+        if session_data:
+            calibration = calibration_queue.submit(
+                user.id, telemetry_codec.load_session_data(session_data), features=data.get('features')
+            )
+            if calibration is None:
+                return jsonify({'error': 'Calibration queue is full, retry shortly'}), 503, {'Retry-After': '5'}
         
-        if baseline:
-            # Update existing baseline
-            baseline.sample_count += 1
-            baseline.updated_at = datetime.utcnow()
-            
-            # Update features (merge with existing)
-            existing_features = json.loads(baseline.features) if baseline.features else {}
-            new_features = data.get('features', {})
-            
-            # Average the values
-            for key, value in new_features.items():
-                if key in existing_features:
-                    existing_features[key] = (existing_features[key] + value) / 2
-                else:
-                    existing_features[key] = value
-            
-            baseline.features = json.dumps(existing_features)
-            
-            # Update specific metrics
-            if data.get('typing_speed_wpm'):
-                baseline.typing_speed_wpm = (baseline.typing_speed_wpm + data['typing_speed_wpm']) / 2 if baseline.typing_speed_wpm else data['typing_speed_wpm']
-            if data.get('mouse_speed_pxs'):
-                baseline.mouse_speed_pxs = (baseline.mouse_speed_pxs + data['mouse_speed_pxs']) / 2 if baseline.mouse_speed_pxs else data['mouse_speed_pxs']
-            if data.get('avg_question_time_sec'):
-                baseline.avg_question_time_sec = (baseline.avg_question_time_sec + data['avg_question_time_sec']) / 2 if baseline.avg_question_time_sec else data['avg_question_time_sec']
-            if data.get('tab_switch_rate'):
-                baseline.tab_switch_rate = (baseline.tab_switch_rate + data['tab_switch_rate']) / 2 if baseline.tab_switch_rate else data['tab_switch_rate']
-            
-            message = 'Baseline updated successfully'
-        else:
-            # Create new baseline
-            baseline = Baseline(
-                user_id=user.id,
-                features=json.dumps(data.get('features', {})),
-                sample_count=1,
-                typing_speed_wpm=data.get('typing_speed_wpm'),
-                mouse_speed_pxs=data.get('mouse_speed_pxs'),
-                avg_question_time_sec=data.get('avg_question_time_sec'),
-                tab_switch_rate=data.get('tab_switch_rate', 0.0)
+        baseline, created = lock_baseline(user.id)
+        message = 'Baseline created successfully' if created else 'Baseline updated successfully'
+        
+        if not session_data:
+            # Running mean and variance per feature (services/baseline_utils.py)
+            baseline.add_sample(
+                data.get('features', {}),
+                {column: data.get(column) for column in METRIC_COLUMNS}
             )
-            db.session.add(baseline)
-            message = 'Baseline created successfully'
+        if baseline.tab_switch_rate is None:
+            baseline.tab_switch_rate = 0.0
+        
+        baseline.updated_at = datetime.utcnow()
         
         db.session.commit()
         
         return jsonify({
             'message': message,
-            'baseline': baseline.to_dict()
-        }), 201 if not baseline.sample_count > 1 else 200
+            'baseline': baseline.to_dict(),
+            'personal_model': personal_model_info(baseline),
+            'calibration': calibration
+        }), 201 if created else 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@baselines_bp.route('/calibration', methods=['POST'])
+def submit_calibration():
+    """
+    Capture a calibration session from raw telemetry
+    
+    Body: {"session_data": {...}} (see services/anomaly_model.py), or a binary
+    EPT1 body (Content-Type: application/vnd.exampulse.telemetry).
+    Feature extraction runs off the request thread (services/baseline_capture.py);
+    poll GET /calibration/<job_id> for the result.
+    """
+    try:
+        user = get_user_from_token()
+        if not user:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        if request.mimetype == telemetry_codec.CONTENT_TYPE:
+            try:
+                session_data = telemetry_codec.decode_session_data(request.get_data())
+            except telemetry_codec.TelemetryDecodeError as e:
+                return jsonify({'error': str(e)}), 400
+        else:
+            session_data = telemetry_codec.load_session_data((request.get_json() or {}).get('session_data'))
+        
+        if not isinstance(session_data, dict) or not session_data.get('duration'):
+            return jsonify({'error': 'session_data with a duration is required'}), 400
+        
+        job = calibration_queue.submit(user.id, session_data)
+        if job is None:
+            return jsonify({'error': 'Calibration queue is full, retry shortly'}), 503, {'Retry-After': '5'}
+        
+        return jsonify({'message': 'Calibration session accepted', 'job': job}), 202
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@baselines_bp.route('/calibration/<job_id>', methods=['GET'])
+def get_calibration(job_id):
+    """Status of a calibration job (its owner or a proctor)"""
+    try:
+        user = get_user_from_token()
+        if not user:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        job = calibration_queue.status(job_id)
+        if not job or (job['user_id'] != user.id and user.role != 'proctor'):
+            return jsonify({'error': 'Calibration job not found'}), 404
+        
+        return jsonify({'job': job}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@baselines_bp.route('/<int:user_id>/refit', methods=['POST'])
+def refit_baseline_model(user_id):
+    """Rebuild a user's personal model from their stored calibration samples (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        baseline = Baseline.query.filter_by(user_id=user_id).first()
+        if not baseline:
+            return jsonify({'error': 'No baseline found for this user'}), 404
+        
+        samples = refit_personal_model(baseline)
+        db.session.commit()
+        
+        return jsonify({
+            'message': f'Personal model refit from {samples} calibration samples',
+            'personal_model': personal_model_info(baseline)
+        }), 200
         
     except Exception as e:
         db.session.rollback()
@@ -105,7 +175,7 @@ def get_baseline():
         if not baseline:
             return jsonify({'error': 'No baseline found'}), 404
         
-        return jsonify({'baseline': baseline.to_dict()}), 200
+        return jsonify({'baseline': baseline.to_dict(), 'personal_model': personal_model_info(baseline)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -124,7 +194,7 @@ def get_user_baseline(user_id):
         if not baseline:
             return jsonify({'error': 'No baseline found for this user'}), 404
         
-        return jsonify({'baseline': baseline.to_dict()}), 200
+        return jsonify({'baseline': baseline.to_dict(), 'personal_model': personal_model_info(baseline)}), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
@@ -1,9 +1,15 @@
 # app/routes/exams.py
 from flask import Blueprint, request, jsonify
 from app import db
-from app.models import Exam, ExamSession, User, Event, Alert
+from app.models import Exam, ExamSession, User, Event, Alert, Baseline
+from app.services import analytics_rollup, answer_similarity, session_lifecycle, submission
+from app.services.answer_key import regrade_exam as regrade_exam_sessions
+from app.services.exam_policy import policy_cache
+from app.services.risk_decay import tracker as risk_tracker
+from app.services.risk_scorer import risk_scorer
+from app.services.similarity_index import similarity_index, KINDS
+from app import socketio
 from datetime import datetime
-import json
 import jwt
 import os
 
@@ -91,7 +97,7 @@ def create_exam():
             monitoring_sensitivity=data.get('monitoring_sensitivity', 'medium'),
             allow_tab_switch=data.get('allow_tab_switch', False),
             allow_copy_paste=data.get('allow_copy_paste', False),
-            questions=json.dumps(data.get('questions', [])),
+            questions=data.get('questions', []),
             status='scheduled'
         )
         
@@ -124,7 +130,7 @@ def get_exam(exam_id):
         
         # Include questions if user is taking the exam
         if exam.questions:
-            exam_dict['questions'] = json.loads(exam.questions)
+            exam_dict['questions'] = exam.questions
         
         
         exam = Exam.query.get(exam_id)
@@ -153,6 +159,7 @@ def get_exam(exam_id):
         )
         
         db.session.add(session)
+        analytics_rollup.record_session_started(exam_id, session.started_at)
         db.session.commit()
         
         return jsonify({
@@ -185,30 +192,12 @@ def submit_exam(exam_id):
         if not session:
             return jsonify({'error': 'No active exam session found'}), 404
         
-        # Update session
-        session.submitted_at = datetime.utcnow()
-        session.time_taken_seconds = data.get('time_taken_seconds')
-        session.answers = json.dumps(data.get('answers', {}))
-        session.status = 'submitted'
-        
-        # Calculate score (simplified - in production, compare with correct answers)
-        # For now, just set a mock score
-        session.score = 85.0
-        
-        # Calculate integrity score based on events
-        events_count = Event.query.filter_by(session_id=session.id).count()
-        high_severity_events = Event.query.filter_by(
-            session_id=session.id,
-            severity='high'
-        ).count()
-        
-        # Simple integrity calculation
-        if events_count == 0:
-            session.integrity_score = 1.0
-        else:
-            session.integrity_score = max(0.5, 1.0 - (high_severity_events * 0.1) - (events_count * 0.02))
-        
-        session.risk_score = 1.0 - session.integrity_score
+        submission.finalize_submission(
+            session,
+            answers=data.get('answers', {}),
+            time_taken_seconds=data.get('time_taken_seconds'),
+            current_behavior=submission.behavior_from_payload(data)
+        )
         
         db.session.commit()
         
@@ -222,6 +211,223 @@ def submit_exam(exam_id):
         return jsonify({'error': str(e)}), 500
 
 
+@exams_bp.route('/<int:exam_id>/sessions/provision', methods=['POST'])
+def provision_exam_sessions(exam_id):
+    """Pre-create sessions for a roster in one bulk insert (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        exam = Exam.query.get(exam_id)
+        if not exam:
+            return jsonify({'error': 'Exam not found'}), 404
+        
+        data = request.get_json(silent=True) or {}
+        user_ids = data.get('user_ids')
+        if user_ids is None:
+            # Default roster: every student
+            user_ids = [row.id for row in db.session.query(User.id).filter_by(role='student')]
+        elif not isinstance(user_ids, list):
+            return jsonify({'error': 'user_ids must be a list'}), 400
+        
+        created, existing = session_lifecycle.provision_sessions(exam_id, user_ids)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Sessions provisioned',
+            'exam_id': exam_id,
+            'created': created,
+            'already_active': existing
+        }), 201 if created else 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+EDITABLE_EXAM_FIELDS = (
+    'name', 'description', 'duration_minutes', 'total_questions', 'instructions',
+    'monitoring_sensitivity', 'allow_tab_switch', 'allow_copy_paste', 'questions'
+)
+
+
+@exams_bp.route('/<int:exam_id>', methods=['PUT'])
+def update_exam(exam_id):
+    """Edit an exam's settings (proctor who created it); live scoring picks up the change"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        exam = Exam.query.get(exam_id)
+        if not exam:
+            return jsonify({'error': 'Exam not found'}), 404
+        if exam.created_by != user.id:
+            return jsonify({'error': 'Unauthorized - Not your exam'}), 403
+        
+        data = request.get_json() or {}
+        if 'monitoring_sensitivity' in data and data['monitoring_sensitivity'] not in ('low', 'medium', 'high'):
+            return jsonify({'error': 'monitoring_sensitivity must be low, medium or high'}), 400
+        
+        for field in EDITABLE_EXAM_FIELDS:
+            if field in data:
+                setattr(exam, field, data[field])
+        
+        # Commit drops the cached scoring policy and answer key (services/exam_policy.py, answer_key.py)
+        db.session.commit()
+        
+        return jsonify({
+            'message': 'Exam updated successfully',
+            'exam': exam.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/<int:exam_id>/regrade', methods=['POST'])
+def regrade_exam(exam_id):
+    """Regrade all submitted sessions against the exam's current answer key (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        result = regrade_exam_sessions(exam_id)
+        if result is None:
+            return jsonify({'error': 'Exam not found'}), 404
+        db.session.commit()
+        
+        print(f"📝 Regraded exam {exam_id}: {result['changed']} of {result['sessions']} scores changed")
+        
+        return jsonify({'message': 'Exam regraded', **result}), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/<int:exam_id>/close', methods=['POST'])
+def close_exam(exam_id):
+    """Force-submit all in-progress sessions with batched final scoring (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        exam = Exam.query.get(exam_id)
+        if not exam:
+            return jsonify({'error': 'Exam not found'}), 404
+        
+        closed = session_lifecycle.close_exam_sessions(exam_id)
+        db.session.commit()
+        
+        # Drop closed sessions from the live socket registry and tell everyone in the room
+        from app.sockets.handlers import active_sessions
+        from app.sockets.roster import roster
+        for session in closed:
+            active_sessions.pop(session['id'], None)
+        roster.students_left(exam_id, [session['id'] for session in closed], reason='closed')
+        
+        socketio.emit('exam_closed', {
+            'exam_id': exam_id,
+            'closed_sessions': len(closed),
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=f"exam_{exam_id}")
+        
+        return jsonify({
+            'message': 'Exam closed',
+            'exam_id': exam_id,
+            'closed_sessions': len(closed),
+            'sessions': closed
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/<int:exam_id>/analytics', methods=['GET'])
+def get_exam_analytics(exam_id):
+    """Get pre-aggregated risk, incident and alert rollups for an exam (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        include_buckets = request.args.get('buckets', 'false').lower() in ('1', 'true', 'yes')
+        analytics = analytics_rollup.get_exam_analytics(exam_id, include_buckets=include_buckets)
+        
+        return jsonify({'analytics': analytics}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/<int:exam_id>/similar-pairs', methods=['GET'])
+def get_similar_pairs(exam_id):
+    """
+    Most similar pairs of sessions in an exam, for collusion review (proctor only)
+    
+    Query: kind=features|timing (default both), k (default 20, max 500),
+    min_similarity (cosine; for timing it is the Pearson correlation)
+    """
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        kind = request.args.get('kind')
+        if kind and kind not in KINDS:
+            return jsonify({'error': f"kind must be one of {', '.join(KINDS)}"}), 400
+        k = min(max(request.args.get('k', 20, type=int), 1), 500)
+        min_similarity = request.args.get('min_similarity', 0.0, type=float)
+        
+        results = {
+            space: similarity_index.similar_pairs(exam_id, space, k, min_similarity)
+            for space in ([kind] if kind else KINDS)
+        }
+        
+        return jsonify({'exam_id': exam_id, 'similar_pairs': results}), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/<int:exam_id>/answer-similarity', methods=['POST'])
+def analyze_answer_similarity(exam_id):
+    """
+    Cohort answer-pattern analysis of the exam's submitted sessions (proctor only)
+    
+    Flags pairs with improbably many identical wrong answers or highly
+    correlated answer timing, and raises an 'answer_collusion' alert on both
+    sessions. Body/query: dry_run=true to only report the pairs.
+    """
+    try:
+        user = get_user_from_token()
+        if not user or user.role != 'proctor':
+            return jsonify({'error': 'Unauthorized - Proctor access required'}), 403
+        
+        data = request.get_json(silent=True) or {}
+        dry_run = data.get('dry_run', request.args.get('dry_run', 'false').lower() == 'true')
+        
+        report = answer_similarity.analyze_exam(exam_id, create_alerts=not dry_run)
+        if report is None:
+            return jsonify({'error': 'Exam not found'}), 404
+        db.session.commit()
+        
+        if report['alerts_created']:
+            print(f"🚨 Answer similarity: {len(report['flagged_pairs'])} pairs flagged in exam {exam_id}")
+        
+        return jsonify(report), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': str(e)}), 500
+
+
 @exams_bp.route('/sessions', methods=['GET'])
 def get_user_sessions():
     """Get all exam sessions for current user"""
@@ -282,3 +488,47 @@ def get_session_details(session_id):
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
+
+
+@exams_bp.route('/sessions/<int:session_id>/risk-trajectory', methods=['GET'])
+def get_risk_trajectory(session_id):
+    """Live risk over time, decayed incident counts and sliding-window counts for a session"""
+    try:
+        user = get_user_from_token()
+        if not user:
+            return jsonify({'error': 'Unauthorized'}), 401
+        
+        session = db.session.get(ExamSession, session_id)
+        if not session:
+            return jsonify({'error': 'Session not found'}), 404
+        
+        # Check authorization
+        if user.role != 'proctor' and session.user_id != user.id:
+            return jsonify({'error': 'Unauthorized'}), 403
+        
+        now = datetime.utcnow()
+        risk_tracker.ensure(session_id)
+        snapshot = risk_tracker.snapshot(session_id, now)
+        
+        # Risk right now: incidents keep decaying between events
+        current_risk = session.risk_score
+        if session.status == 'in_progress':
+            policy = policy_cache.get(session.exam_id)
+            baseline = Baseline.query.filter_by(user_id=session.user_id).first()
+            if baseline:
+                current_risk = risk_scorer.calculate_risk_score(
+                    snapshot['behavior'],
+                    baseline,
+                    policy.filter_summary(risk_tracker.summary(session_id, now)),
+                    policy.sensitivity
+                )
+        
+        return jsonify({
+            'session_id': session_id,
+            'status': session.status,
+            'current': {'timestamp': now.isoformat(), 'risk_score': current_risk},
+            **snapshot
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
@@ -1,13 +1,43 @@
 # app/routes/features.py
 from flask import Blueprint, request, jsonify
 from datetime import datetime
+import os
+
+import jwt
 
 from app import db, socketio
-from app.models import ExamSession, Alert
+from app.models import ExamSession, Alert, User
 from app.services.anomaly_model import get_anomaly_model_service
+from app.services.model_retrainer import model_retrainer
+from app.services import analytics_rollup, telemetry_codec
 
 features_bp = Blueprint("features", __name__)
 
+SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key-change-in-production")
+
+
+def get_user_from_token():
+    """Extract user from JWT token"""
+    auth_header = request.headers.get("Authorization")
+    if not auth_header:
+        return None
+    try:
+        token = auth_header.split(" ")[1]
+        payload = jwt.decode(token, SECRET_KEY, algorithms=["HS256"])
+        return User.query.get(payload["user_id"])
+    except:
+        return None
+
+
+@features_bp.route("/telemetry-formats", methods=["GET"])
+def telemetry_formats():
+    """Telemetry encodings accepted by /score-session and submit_exam"""
+    return jsonify({
+        "formats": list(telemetry_codec.FORMATS),
+        "compressions": list(telemetry_codec.COMPRESSIONS),
+        "content_type": telemetry_codec.CONTENT_TYPE
+    }), 200
+
 
 @features_bp.route("/score-session", methods=["POST"])
 def score_session():
@@ -20,12 +50,23 @@ def score_session():
         "exam_id": <int>,
         "session_data": { ... }   # format described in anomaly_model.py docstring
     }
+
+    Or a binary EPT1 body (Content-Type: application/vnd.exampulse.telemetry,
+    see services/telemetry_codec.py) with user_id and exam_id as query args.
     """
     try:
-        payload = request.get_json() or {}
-        user_id = payload.get("user_id")
-        exam_id = payload.get("exam_id")
-        session_data = payload.get("session_data")
+        if request.mimetype == telemetry_codec.CONTENT_TYPE:
+            user_id = request.args.get("user_id", type=int)
+            exam_id = request.args.get("exam_id", type=int)
+            try:
+                session_data = telemetry_codec.decode_session_data(request.get_data())
+            except telemetry_codec.TelemetryDecodeError as e:
+                return jsonify({"error": str(e)}), 400
+        else:
+            payload = request.get_json() or {}
+            user_id = payload.get("user_id")
+            exam_id = payload.get("exam_id")
+            session_data = payload.get("session_data")
 
         if not user_id or not exam_id or not session_data:
             return jsonify({"error": "user_id, exam_id and session_data are required"}), 400
@@ -49,7 +90,7 @@ def score_session():
 
         # ---- Call anomaly model ----
         model_service = get_anomaly_model_service()
-        risk_score, raw_score = model_service.score_session(session_data)
+        risk_score, raw_score = model_service.score_session(session_data, user_id=session.user_id, exam_session=session)
 
         # Update session scores
         session.risk_score = risk_score
@@ -68,6 +109,7 @@ def score_session():
                 resolved=False,
             )
             db.session.add(alert)
+            analytics_rollup.record_alert(session.exam_id)
             alert_payload = {
                 "session_id": session.id,
                 "user_id": session.user_id,
@@ -115,4 +157,45 @@ def score_session():
 
     except Exception as e:
         db.session.rollback()
-        return jsonify({"error": str(e)}), 500
\ No newline at end of file
+        return jsonify({"error": str(e)}), 500
+
+
+@features_bp.route("/model", methods=["GET"])
+def model_status():
+    """Serving model version and production retraining status (proctor only)"""
+    try:
+        user = get_user_from_token()
+        if not user or user.role != "proctor":
+            return jsonify({"error": "Unauthorized - Proctor access required"}), 403
+
+        service = get_anomaly_model_service()
+        return jsonify({
+            "serving_version": service.version,
+            "serving_model": type(service.model).__name__ if service.model is not None else None,
+            "online_updates": service.online_updates,
+            "retraining": model_retrainer.status()
+        }), 200
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+
+@features_bp.route("/model/retrain", methods=["POST"])
+def retrain_model():
+    """
+    Start retraining the global model on the production reservoir now, in a
+    separate process (proctor only). Answers 202; poll GET /model for the result.
+    """
+    try:
+        user = get_user_from_token()
+        if not user or user.role != "proctor":
+            return jsonify({"error": "Unauthorized - Proctor access required"}), 403
+
+        run = model_retrainer.start("manual")
+        if run is None:
+            return jsonify({"error": "Retraining already running"}), 409
+
+        return jsonify({"message": "Retraining started", "run": run}), 202
+
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
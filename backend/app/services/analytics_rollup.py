@@ -0,0 +1,221 @@
+# app/services/analytics_rollup.py
+"""
+Pre-aggregated exam analytics.
+
+Counters are kept per exam (ExamAnalytics) and per exam + time bucket
+(ExamAnalyticsBucket). Callers record events, alerts and submissions as they
+happen; the counters are bumped with set-based UPDATEs inside the caller's
+transaction, so the rollup commits (or rolls back) together with the rows it
+describes. Reads never touch the sessions / events / alerts tables.
+"""
+from datetime import datetime, timedelta
+import os
+
+from sqlalchemy import update, delete, func, cast, Integer
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from app.models import (
+    ExamAnalytics, ExamAnalyticsBucket, ExamSession, Event, Alert
+)
+
+BUCKET_SECONDS = int(os.getenv('ANALYTICS_BUCKET_SECONDS', 300))
+
+SEVERITY_COLUMNS = {
+    'low': 'low_severity_events',
+    'medium': 'medium_severity_events',
+    'high': 'high_severity_events'
+}
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def bucket_start(ts=None):
+    """Floor a timestamp to the start of its rollup bucket"""
+    ts = ts or datetime.utcnow()
+    seconds = int((ts - EPOCH).total_seconds())
+    return EPOCH + timedelta(seconds=seconds - seconds % BUCKET_SECONDS)
+
+
+def risk_column(risk_score):
+    """Map a final risk score onto its distribution counter (same bands as RiskScorer.get_risk_level)"""
+    if risk_score is None or risk_score < 0.3:
+        return 'risk_low_count'
+    elif risk_score < 0.7:
+        return 'risk_medium_count'
+    return 'risk_high_count'
+
+
+def _bump(model, key, deltas):
+    """Add deltas to one rollup row, creating it on first use"""
+    values = {name: getattr(model, name) + delta for name, delta in deltas.items()}
+    result = db.session.execute(
+        update(model).filter_by(**key).values(**values).execution_options(synchronize_session=False)
+    )
+    if result.rowcount:
+        return
+
+    try:
+        # Savepoint so a concurrent insert of the same row only undoes this insert
+        with db.session.begin_nested():
+            db.session.add(model(**key, **deltas))
+    except IntegrityError:
+        db.session.execute(
+            update(model).filter_by(**key).values(**values).execution_options(synchronize_session=False)
+        )
+
+
+def _record(exam_id, ts, deltas):
+    if not exam_id or not deltas:
+        return
+    _bump(ExamAnalytics, {'exam_id': exam_id}, deltas)
+    _bump(ExamAnalyticsBucket, {'exam_id': exam_id, 'bucket_start': bucket_start(ts)}, deltas)
+
+
+def record_session_started(exam_id, ts=None, count=1):
+    _record(exam_id, ts, {'sessions_started': count})
+
+
+def record_event(exam_id, severity, ts=None, count=1):
+    deltas = {'events_count': count}
+    column = SEVERITY_COLUMNS.get(severity)
+    if column:
+        deltas[column] = count
+    _record(exam_id, ts, deltas)
+
+
+def record_alert(exam_id, ts=None, count=1):
+    _record(exam_id, ts, {'alerts_count': count})
+
+
+def record_submission(exam_id, risk_score, ts=None):
+    _record(exam_id, ts, {
+        'sessions_submitted': 1,
+        risk_column(risk_score): 1,
+        'risk_score_sum': float(risk_score or 0.0)
+    })
+
+
+def record_submissions(exam_id, risk_scores, ts=None):
+    """Record many submissions at once (bulk close) with a single bump per rollup row"""
+    if not risk_scores:
+        return
+    deltas = {'sessions_submitted': len(risk_scores), 'risk_score_sum': 0.0}
+    for risk_score in risk_scores:
+        column = risk_column(risk_score)
+        deltas[column] = deltas.get(column, 0) + 1
+        deltas['risk_score_sum'] += float(risk_score or 0.0)
+    _record(exam_id, ts, deltas)
+
+
+def get_exam_analytics(exam_id, include_buckets=False):
+    """Read the rollup for one exam; a primary-key lookup plus an optional bucket range scan"""
+    totals = db.session.get(ExamAnalytics, exam_id)
+    data = totals.to_dict() if totals else ExamAnalytics(exam_id=exam_id, **_zero_counters()).to_dict()
+
+    if include_buckets:
+        buckets = ExamAnalyticsBucket.query.filter_by(exam_id=exam_id).order_by(
+            ExamAnalyticsBucket.bucket_start
+        ).all()
+        data['bucket_seconds'] = BUCKET_SECONDS
+        data['buckets'] = [bucket.to_dict() for bucket in buckets]
+
+    return data
+
+
+def _zero_counters():
+    return {column.name: 0 for column in ExamAnalytics.__table__.columns
+            if column.name not in ('exam_id', 'updated_at')}
+
+
+# ---------------------------------------------------------------------------
+# Backfill
+# ---------------------------------------------------------------------------
+
+def _epoch_bucket(column):
+    """SQL expression flooring a timestamp column to a bucket, as seconds since epoch"""
+    if db.engine.dialect.name == 'sqlite':
+        seconds = cast(func.strftime('%s', column), Integer)
+    else:
+        seconds = cast(func.extract('epoch', column), Integer)
+    return (seconds // BUCKET_SECONDS) * BUCKET_SECONDS
+
+
+def backfill_exam_analytics(exam_id=None):
+    """
+    Rebuild rollups from the raw tables with grouped aggregates.
+    Rebuilds a single exam when exam_id is given, otherwise every exam.
+    Returns the number of exams rebuilt. Commits.
+    """
+    totals = {}
+    buckets = {}
+
+    def add(exam, bucket_epoch, deltas):
+        for target, key in ((totals, exam), (buckets, (exam, bucket_epoch))):
+            row = target.setdefault(key, {})
+            for name, delta in deltas.items():
+                row[name] = row.get(name, 0) + delta
+
+    def scoped(query, column):
+        return query.filter(column == exam_id) if exam_id else query
+
+    # Sessions started
+    started_bucket = _epoch_bucket(ExamSession.started_at)
+    query = db.session.query(ExamSession.exam_id, started_bucket, func.count(ExamSession.id))
+    for exam, epoch, count in scoped(query, ExamSession.exam_id).group_by(ExamSession.exam_id, started_bucket):
+        add(exam, epoch, {'sessions_started': count})
+
+    # Submissions and risk distribution
+    submitted_bucket = _epoch_bucket(ExamSession.submitted_at)
+    risk_band = db.case(
+        (ExamSession.risk_score >= 0.7, 'risk_high_count'),
+        (ExamSession.risk_score >= 0.3, 'risk_medium_count'),
+        else_='risk_low_count'
+    )
+    query = db.session.query(
+        ExamSession.exam_id, submitted_bucket, risk_band,
+        func.count(ExamSession.id), func.coalesce(func.sum(ExamSession.risk_score), 0.0)
+    ).filter(ExamSession.submitted_at.isnot(None))
+    query = scoped(query, ExamSession.exam_id).group_by(ExamSession.exam_id, submitted_bucket, risk_band)
+    for exam, epoch, band, count, risk_sum in query:
+        add(exam, epoch, {'sessions_submitted': count, band: count, 'risk_score_sum': float(risk_sum)})
+
+    # Events by severity
+    event_bucket = _epoch_bucket(Event.timestamp)
+    query = db.session.query(
+        ExamSession.exam_id, event_bucket, Event.severity, func.count(Event.id)
+    ).join(ExamSession, Event.session_id == ExamSession.id)
+    query = scoped(query, ExamSession.exam_id).group_by(ExamSession.exam_id, event_bucket, Event.severity)
+    for exam, epoch, severity, count in query:
+        deltas = {'events_count': count}
+        if severity in SEVERITY_COLUMNS:
+            deltas[SEVERITY_COLUMNS[severity]] = count
+        add(exam, epoch, deltas)
+
+    # Alerts
+    alert_bucket = _epoch_bucket(Alert.created_at)
+    query = db.session.query(
+        ExamSession.exam_id, alert_bucket, func.count(Alert.id)
+    ).join(ExamSession, Alert.session_id == ExamSession.id)
+    for exam, epoch, count in scoped(query, ExamSession.exam_id).group_by(ExamSession.exam_id, alert_bucket):
+        add(exam, epoch, {'alerts_count': count})
+
+    # Replace existing rollups
+    for model in (ExamAnalyticsBucket, ExamAnalytics):
+        stmt = delete(model)
+        if exam_id:
+            stmt = stmt.where(model.exam_id == exam_id)
+        db.session.execute(stmt)
+
+    db.session.add_all(ExamAnalytics(exam_id=exam, **counters) for exam, counters in totals.items())
+    db.session.add_all(
+        ExamAnalyticsBucket(
+            exam_id=exam,
+            bucket_start=EPOCH + timedelta(seconds=int(epoch)),
+            **counters
+        )
+        for (exam, epoch), counters in buckets.items()
+    )
+    db.session.commit()
+
+    return len(totals)
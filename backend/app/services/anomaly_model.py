@@ -1,23 +1,195 @@
 # app/services/anomaly_model.py
+"""
+Session-level anomaly scoring over the 40 extractor features.
+
+session_data is the raw behavioral payload of a whole session, as produced by
+ml-model's BehaviorDataGenerator (JSON or EPT1, see telemetry_codec):
+    {
+        "duration": <seconds>,
+        "mouse": {"speeds", "pauses", "jitter", "smoothness", "timestamps"},
+        "keyboard": {"intervals", "hold_times", "burst_sizes", "backspace_freq", "timestamps"},
+        "tabs": {"num_switches", "switch_times", "time_away", "total_time_away"},
+        "answers": {"time_per_question", "answer_changes"}
+    }
+
+Two models score the feature vector:
+- the global Isolation Forest: the newest published production version
+  (services/model_retrainer.py) if there is one, else the one trained by
+  ml-model/model_trainer.py, if its artifacts are present in ML_MODEL_DIR.
+  A newly published version is loaded on a side thread and swapped in;
+  scoring never waits for it. A streaming model (ml-model's HalfSpaceTrees,
+  MODEL_RETRAIN_DETECTOR=half_space_trees) also learns from every committed
+  submission below MODEL_ONLINE_MAX_RISK between versions (see learn())
+- the student's personal model fitted from their baseline sessions
+  (services/personal_models.py), if they have one
+The risk is the mean of the available scores.
+"""
+import os
+import threading
+import time
 from typing import Any
 
+import joblib
+import numpy as np
+
+from app.services.behavior_features import ML_MODEL_DIR, extract_vector, pack_vector
+from app.services.model_retrainer import MODELS_DIR, current_version, model_retrainer
+from app.services.personal_models import personal_models
+from app.services.similarity_index import similarity_index, pack_timings
+
+RELOAD_CHECK_SECONDS = float(os.getenv('MODEL_RELOAD_CHECK_SECONDS', 30))
+ONLINE_MAX_RISK = float(os.getenv('MODEL_ONLINE_MAX_RISK', 0.7))
+
+
 class AnomalyModelService:
-    def __init__(self, model_path: str = None) -> None:
-        # initialize/load model here
-        self.model_path = model_path
-        self.model = None
-        # e.g. self.model = load_model(model_path)
-    
+    def __init__(self, model_path: str = None, scaler_path: str = None, versions_dir: str = None) -> None:
+        self.model_path = model_path or os.path.join(ML_MODEL_DIR, 'anomaly_detector.joblib')
+        self.scaler_path = scaler_path or os.path.join(ML_MODEL_DIR, 'feature_scaler.joblib')
+        # Published production versions are followed only by the default service
+        self.versions_dir = versions_dir if versions_dir is not None else (None if model_path else MODELS_DIR)
+        self._loaded = (None, None, None)  # (model, scaler, version), swapped as one
+        self._next_check = 0.0
+        self._reloading = False
+        self._learn_lock = threading.Lock()
+        self.online_updates = 0
+        self.load_model()
+        if self.versions_dir is not None:
+            model_retrainer.add_learner(self.learn)
+
+    @property
+    def model(self):
+        return self._loaded[0]
+
+    @property
+    def scaler(self):
+        return self._loaded[1]
+
+    @property
+    def version(self):
+        return self._loaded[2]
+
+    def load_model(self) -> None:
+        """Load the published production version, else the model ml-model trained, if any"""
+        version = current_version(self.versions_dir) if self.versions_dir else None
+        if version and self._load_version(version):
+            return
+        if not (os.path.exists(self.model_path) and os.path.exists(self.scaler_path)):
+            return
+        try:
+            self._loaded = (joblib.load(self.model_path), joblib.load(self.scaler_path), None)
+            print(f"✅ Loaded anomaly model from {self.model_path}")
+        except Exception as e:
+            self._loaded = (None, None, None)
+            print(f"⚠️ Failed to load anomaly model: {e}")
+
+    def _load_version(self, version):
+        directory = os.path.join(self.versions_dir, version)
+        try:
+            model = joblib.load(os.path.join(directory, 'anomaly_detector.joblib'))
+            scaler = joblib.load(os.path.join(directory, 'feature_scaler.joblib'))
+        except Exception as e:
+            print(f"⚠️ Failed to load anomaly model {version}: {e}")
+            return False
+        self._loaded = (model, scaler, version)
+        print(f"✅ Loaded anomaly model {version} from {directory}")
+        return True
+
+    def maybe_reload(self):
+        """Start loading a newly published version in the background (rate-limited, never blocks)"""
+        now = time.monotonic()
+        if self.versions_dir is None or now < self._next_check or self._reloading:
+            return
+        self._next_check = now + RELOAD_CHECK_SECONDS
+        version = current_version(self.versions_dir)
+        if not version or version == self.version:
+            return
+        self._reloading = True
+
+        def reload():
+            try:
+                self._load_version(version)
+            finally:
+                self._reloading = False
+        threading.Thread(target=reload, daemon=True).start()
+
+    def learn(self, vectors, risks):
+        """
+        Update a streaming global model with committed sessions' vectors,
+        leaving out the high-risk ones (likely cheaters) as retraining does.
+        Other models are only replaced by retraining.
+        """
+        model, scaler, _ = self._loaded
+        if model is None or not hasattr(model, 'partial_fit'):
+            return
+        normal = np.isnan(risks) | (risks < ONLINE_MAX_RISK)
+        if not normal.any():
+            return
+        features = scaler.transform(np.nan_to_num(np.asarray(vectors, dtype=np.float64)[normal]))
+        with self._learn_lock:
+            model.partial_fit(features)
+            self.online_updates += int(normal.sum())
+
     def predict(self, data: Any) -> Any:
-        # implement prediction
-        # return some result
-        return {"anomaly_score": 0.0}
+        """Global model risk for one feature vector"""
+        return {"anomaly_score": self._global_risk(np.asarray(data, dtype=np.float64))}
+
+    def _global_risk(self, vector):
+        model, scaler, _ = self._loaded
+        if model is None:
+            return None
+        features = scaler.transform(np.nan_to_num(vector).reshape(1, -1))
+        # decision_function is negative for outliers; same mapping as RiskScorer._ml_scores
+        score = float(model.decision_function(features)[0])
+        return float(1.0 / (1.0 + np.exp(score * 5)))
+
+    def score_session(self, session_data, user_id=None, exam_session=None):
+        """
+        Returns (risk_score, raw_score): risk in [0, 1] and the per-model
+        components {'global': risk, 'personal': risk, 'personal_distance': d2}.
+        
+        With exam_session, the feature vector and answer times are also stored
+        on it (caller commits) and added to the exam's similarity index once
+        the transaction commits.
+        """
+        self.maybe_reload()
+        vector = extract_vector(session_data)
+        raw_score = {}
+        if exam_session is not None:
+            self.index_session(exam_session, session_data, vector)
+
+        global_risk = self._global_risk(vector)
+        if global_risk is not None:
+            raw_score['global'] = global_risk
+            if self.version:
+                raw_score['global_version'] = self.version
+
+        personal = personal_models.score(user_id, vector) if user_id else None
+        if personal is not None:
+            raw_score['personal'], raw_score['personal_distance'] = personal
+
+        risks = [raw_score[k] for k in ('global', 'personal') if k in raw_score]
+        risk_score = float(sum(risks) / len(risks)) if risks else 0.0
+        return risk_score, raw_score
+
+    def index_session(self, exam_session, session_data, vector):
+        timings = (session_data.get('answers') or {}).get('time_per_question')
+        timings = np.asarray(timings, dtype=np.float32) if timings is not None else None
+        exam_session.feature_vector = pack_vector(vector)
+        exam_session.answer_timings = pack_timings(timings) if timings is not None and len(timings) else None
+        similarity_index.add(exam_session, vector, timings)
+
+
+_services = {}
+_services_lock = threading.Lock()
+
 
 # Factory function that other modules import
 def get_anomaly_model_service(model_path: str = None) -> AnomalyModelService:
     """
-    Return a (singleton or new) instance of the service.
-    If you want a singleton, you can implement caching here.
+    Return the shared service for model_path (the model loads once per process).
     """
-    # simple stateless example — create a new instance
-    return AnomalyModelService(model_path=model_path)
+    with _services_lock:
+        service = _services.get(model_path)
+        if service is None:
+            service = _services[model_path] = AnomalyModelService(model_path=model_path)
+        return service
@@ -0,0 +1,201 @@
+# app/services/answer_key.py
+"""
+Compiled answer keys and vectorized grading.
+
+Questions are stored as the exam editor sends them, e.g.
+    {"question": "...", "options": ["O(n)", "O(log n)", ...], "correctAnswer": 1, "points": 2}
+and ExamSession.answers maps the question index to the chosen option index
+({"0": 1, "1": 3}). Answers given as option text are mapped to their index.
+
+An AnswerKey is compiled once per exam from Exam.questions. It holds the
+correct option per question (int16, UNANSWERED where the question has no
+key), the points per question (default 1) and an option-text lookup. Keys
+are cached in memory per exam. An exam edit drops its key once the edit
+commits, the same way as the scoring policies (commit_hooks.KeyedCache). Grading a
+submission therefore never reparses Exam.questions.
+
+Grading packs answers into an int16 matrix (sessions x questions) and
+scores it in one vectorized step, as the percent of the keyed points earned:
+    score = 100 * ((answers == key) @ points) / total_points
+One submission is a 1-row matrix. Regrading a whole exam after a key
+correction is one matrix and one bulk UPDATE (regrade_exam).
+"""
+import json
+
+import numpy as np
+from sqlalchemy import select, update, bindparam
+
+from app import db
+from app.models import Exam, ExamSession
+from app.services.commit_hooks import KeyedCache
+
+UNANSWERED = -1
+INDEX_MAX = int(np.iinfo(np.int16).max)
+
+CORRECT_KEYS = ('correctAnswer', 'correct_answer', 'answer')
+
+GRADED_STATUSES = ('submitted', 'flagged')
+
+
+def answer_index(value, options=None):
+    """
+    Option index for an answer value (option text, index or numeric string), or
+    UNANSWERED. Option texts win over numeric strings, so options like '3', '4'
+    match by text. Indexes past the question's options (past INDEX_MAX when it has
+    none) are UNANSWERED too: they are never correct and must fit the int16 matrix.
+    """
+    index = _raw_index(value, options)
+    limit = len(options) if options else INDEX_MAX + 1
+    return index if 0 <= index < limit else UNANSWERED
+
+
+def _raw_index(value, options):
+    if value is None or isinstance(value, bool):
+        return UNANSWERED
+    if isinstance(value, int):
+        return value
+    if isinstance(value, float):
+        return int(value) if value.is_integer() else UNANSWERED
+    if isinstance(value, str):
+        text = value.strip()
+        if options and text in options:
+            return options[text]
+        if text.isdigit():
+            return int(text)
+    return UNANSWERED
+
+
+class AnswerKey:
+    def __init__(self, exam_id, key, points, options=None):
+        self.exam_id = exam_id
+        self.key = np.asarray(key, dtype=np.int16)
+        points = np.asarray(points, dtype=np.float32)
+        self.points = np.where(self.key != UNANSWERED, points, 0.0).astype(np.float32)
+        self.options = options or [None] * len(self.key)  # per question {option text: index} or None
+        self.total_points = float(self.points.sum())
+
+    @property
+    def n_questions(self):
+        return len(self.key)
+
+    @property
+    def keyed_questions(self):
+        return int((self.key != UNANSWERED).sum())
+
+    @classmethod
+    def from_exam(cls, exam):
+        questions = exam.questions if isinstance(exam.questions, list) else []
+        n_questions = max(exam.total_questions or 0, len(questions))
+        key = np.full(n_questions, UNANSWERED, dtype=np.int16)
+        points = np.ones(n_questions, dtype=np.float32)
+        options = [None] * n_questions
+        for i, question in enumerate(questions):
+            if not isinstance(question, dict):
+                continue
+            if isinstance(question.get('options'), list):
+                options[i] = {str(text): j for j, text in enumerate(question['options'])}
+            for name in CORRECT_KEYS:
+                if name in question:
+                    key[i] = answer_index(question[name], options[i])
+                    break
+            try:
+                points[i] = max(float(question.get('points', 1)), 0.0)
+            except (TypeError, ValueError):
+                pass
+        return cls(exam.id, key, points, options)
+
+    def pack(self, answers_by_row):
+        """
+        int16 matrix (rows x questions) of chosen option indexes from a list of
+        ExamSession.answers dicts; UNANSWERED where no (usable) answer was given.
+        """
+        matrix = np.full((len(answers_by_row), self.n_questions), UNANSWERED, dtype=np.int16)
+        for row, answers in enumerate(answers_by_row):
+            if isinstance(answers, str):
+                # Rows written before answers became a JSON column
+                try:
+                    answers = json.loads(answers)
+                except ValueError:
+                    continue
+            if not isinstance(answers, dict):
+                continue
+            for question, value in answers.items():
+                col = answer_index(question)
+                if 0 <= col < self.n_questions:
+                    matrix[row, col] = answer_index(value, self.options[col])
+        return matrix
+
+    def grade_matrix(self, matrix):
+        """Percent scores (float32, one per row); None if the exam has no keyed points"""
+        if not self.total_points:
+            return None
+        correct = (matrix == self.key[None, :]) & (self.key != UNANSWERED)[None, :]
+        return correct.astype(np.float32) @ self.points * np.float32(100.0 / self.total_points)
+
+    def grade(self, answers):
+        """Percent score of one ExamSession.answers dict, or None if the exam has no key"""
+        return self.grade_many([answers])[0]
+
+    def grade_many(self, answers_by_row):
+        scores = self.grade_matrix(self.pack(answers_by_row))
+        if scores is None:
+            return [None] * len(answers_by_row)
+        return [round(float(score), 2) for score in scores]
+
+    def to_dict(self):
+        return {
+            'exam_id': self.exam_id,
+            'questions': self.n_questions,
+            'keyed_questions': self.keyed_questions,
+            'total_points': self.total_points
+        }
+
+
+class AnswerKeyCache(KeyedCache):
+    def load(self, exam_id):
+        """The exam's compiled key; None for unknown exams"""
+        exam = db.session.get(Exam, exam_id)
+        return AnswerKey.from_exam(exam) if exam else None
+
+
+# Global instance
+answer_keys = AnswerKeyCache()
+answer_keys.invalidate_on_commit(Exam, 'id')
+
+
+def regrade_exam(exam_id):
+    """
+    Regrade every submitted session of an exam against its current key with
+    one packed matrix and one bulk UPDATE (caller commits).
+    Returns a summary, or None for an unknown exam.
+    """
+    answer_key = answer_keys.get(exam_id)
+    if answer_key is None:
+        return None
+    rows = db.session.execute(
+        select(ExamSession.id, ExamSession.answers, ExamSession.score)
+        .where(ExamSession.exam_id == exam_id, ExamSession.status.in_(GRADED_STATUSES))
+    ).all()
+    scores = answer_key.grade_many([row.answers for row in rows])
+
+    changed = [
+        {'b_id': row.id, 'score': score}
+        for row, score in zip(rows, scores) if score != row.score
+    ]
+    if changed:
+        sessions_table = ExamSession.__table__
+        db.session.execute(
+            update(sessions_table)
+            .where(sessions_table.c.id == bindparam('b_id'))
+            .values(score=bindparam('score')),
+            changed
+        )
+
+    graded = [score for score in scores if score is not None]
+    return {
+        **answer_key.to_dict(),
+        'sessions': len(rows),
+        'changed': len(changed),
+        'mean_score': round(sum(graded) / len(graded), 2) if graded else None
+    }
+
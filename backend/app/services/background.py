@@ -0,0 +1,27 @@
+# app/services/background.py
+"""
+Queues for socketio background workers.
+
+Workers started with socketio.start_background_task are green threads when
+Flask-SocketIO runs under eventlet or gevent (run.py does not monkey-patch),
+and a blocking queue.Queue.get() in one of them would stall the whole event
+loop. new_queue() returns the queue native to socketio.async_mode. All of
+them support put_nowait/get/task_done/qsize/unfinished_tasks and raise
+queue.Full / queue.Empty.
+"""
+import queue
+
+from app import socketio
+
+
+def new_queue(maxsize=0):
+    """A joinable queue for the current async mode (maxsize 0 = unbounded)"""
+    mode = getattr(socketio, 'async_mode', None)
+    if mode == 'eventlet':
+        from eventlet.queue import Queue
+        # eventlet treats maxsize=0 as a rendezvous channel; None is unbounded
+        return Queue(maxsize or None)
+    if mode in ('gevent', 'gevent_uwsgi'):
+        from gevent.queue import JoinableQueue
+        return JoinableQueue(maxsize or None)
+    return queue.Queue(maxsize)
@@ -0,0 +1,225 @@
+# app/services/baseline_capture.py
+"""
+Baseline capture from raw calibration telemetry.
+
+POST /api/baselines/calibration hands the decoded session_data to this queue
+and answers 202 at once. Running BehaviorFeatureExtractor on a session takes
+milliseconds of NumPy work, so a small pool of worker threads does it off
+the request thread. Each job then:
+- stores the 40-feature vector as a BaselineSample (160 bytes of float32)
+- folds it into the user's personal model (services/personal_models.py)
+- updates the Baseline's scalar metrics from the same features, so live
+  scoring compares exam behavior against values measured the same way
+
+Stored samples let a model be refit from scratch (refit_personal_model), e.g.
+after the extractor changes, without asking students to calibrate again.
+
+Job status is kept in memory for the last JOB_HISTORY jobs and can be
+polled with GET /api/baselines/calibration/<job_id>. A full queue rejects new
+jobs (the route answers 503) instead of growing without bound.
+"""
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+
+from app import db, socketio
+from app.models import Baseline, BaselineSample
+from app.services.background import new_queue
+from app.services.behavior_features import FEATURE_NAMES, FEATURE_LAYOUT_ID, extract_vector, pack_vector
+from app.services.personal_models import add_baseline_sessions
+
+JOB_HISTORY = 1000
+
+# Baseline metric columns filled from extractor features: (feature, scale)
+METRIC_FEATURES = {
+    'typing_speed_wpm': ('key_typing_speed', 1 / 5.0),  # keystrokes/min, 5 per word
+    'mouse_speed_pxs': ('mouse_speed_mean', 1.0),
+    'avg_question_time_sec': ('answer_time_mean', 1.0),
+    'tab_switch_rate': ('tab_switch_freq', 1.0),  # per hour
+}
+FEATURE_INDEX = {name: i for i, name in enumerate(FEATURE_NAMES)}
+
+
+def lock_baseline(user_id):
+    """
+    The user's Baseline, row-locked until the caller commits, and whether it was
+    created. A concurrent insert for the same user (baselines.user_id is unique)
+    makes this return that row instead.
+    """
+    baseline = Baseline.query.filter_by(user_id=user_id).with_for_update().first()
+    if baseline:
+        return baseline, False
+    try:
+        # Savepoint so a concurrent insert of the same row only undoes this insert
+        with db.session.begin_nested():
+            baseline = Baseline(user_id=user_id, features={}, sample_count=0)
+            db.session.add(baseline)
+        return baseline, True
+    except IntegrityError:
+        return Baseline.query.filter_by(user_id=user_id).with_for_update().one(), False
+
+
+def capture_sample(user_id, session_data, features=None):
+    """
+    Extract, store and fold in one calibration session. Returns the BaselineSample (caller commits).
+    features: the client's own feature dict for the session, counted in the same sample
+    """
+    vector = extract_vector(session_data)
+    baseline, _ = lock_baseline(user_id)
+    sample = BaselineSample(
+        user_id=user_id,
+        feature_vector=pack_vector(vector),
+        feature_layout=FEATURE_LAYOUT_ID,
+        duration_seconds=float(session_data.get('duration') or 0) or None
+    )
+    db.session.add(sample)
+
+    metrics = {}
+    for column, (feature, scale) in METRIC_FEATURES.items():
+        value = float(vector[FEATURE_INDEX[feature]])
+        if value == value:  # not nan
+            metrics[column] = value * scale
+    baseline.add_sample(features or {}, metrics)
+    add_baseline_sessions(baseline, vector)
+    baseline.updated_at = datetime.utcnow()
+    return sample
+
+
+def refit_personal_model(baseline):
+    """Rebuild the user's personal model from their stored samples (caller commits). Returns the sample count."""
+    rows = db.session.execute(
+        select(BaselineSample.feature_vector).where(
+            BaselineSample.user_id == baseline.user_id,
+            BaselineSample.feature_layout == FEATURE_LAYOUT_ID
+        )
+    ).scalars().all()
+    baseline.feature_model = None
+    if rows:
+        add_baseline_sessions(baseline, np.frombuffer(b''.join(rows), dtype='<f4').reshape(len(rows), -1))
+    return len(rows)
+
+
+class CalibrationQueue:
+    def __init__(self, workers=None, max_depth=None):
+        self.workers = int(os.getenv('BASELINE_CAPTURE_WORKERS', 2)) if workers is None else workers
+        self.max_depth = max_depth or int(os.getenv('BASELINE_CAPTURE_QUEUE_MAX', 256))
+
+        self.app = None
+        self._queue = None  # created with the workers, once socketio's async mode is known
+        self._jobs = OrderedDict()  # {job_id: status dict}
+        self._started = False
+        self._lock = threading.Lock()
+        self._counters = {'submitted': 0, 'completed': 0, 'failed': 0, 'rejected': 0}
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, user_id, session_data, features=None):
+        """Queue one calibration session; returns the job status, or None if the queue is full"""
+        job_id = uuid.uuid4().hex
+        status = {'job_id': job_id, 'user_id': user_id, 'status': 'queued',
+                  'submitted_at': datetime.utcnow().isoformat()}
+
+        if self.workers <= 0:
+            self._remember(status)
+            self._run(job_id, user_id, session_data, features)
+            return self.status(job_id)
+
+        self._ensure_workers()
+        # Recorded before queueing: a worker may pick the job up at once
+        self._remember(status)
+        try:
+            self._queue.put_nowait((job_id, user_id, session_data, features))
+        except queue.Full:
+            self._forget(job_id)
+            self._count('rejected')
+            return None
+        self._count('submitted')
+        return dict(status)
+
+    def status(self, job_id):
+        with self._lock:
+            status = self._jobs.get(job_id)
+            return dict(status) if status else None
+
+    def drain(self, timeout=10.0):
+        """Wait until every queued job has been processed (scripts and shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self._queue is not None and self._queue.unfinished_tasks:
+            if time.monotonic() > deadline:
+                return False
+            socketio.sleep(0.01)
+        return True
+
+    def _remember(self, status):
+        with self._lock:
+            self._jobs[status['job_id']] = status
+            while len(self._jobs) > JOB_HISTORY:
+                self._jobs.popitem(last=False)
+
+    def _forget(self, job_id):
+        with self._lock:
+            self._jobs.pop(job_id, None)
+
+    def _update(self, job_id, **changes):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id].update(changes)
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._started:
+                return
+            # Green-thread safe under eventlet/gevent (a queue.Queue.get() would block the hub)
+            self._queue = new_queue(self.max_depth)
+            self._started = True
+        for _ in range(self.workers):
+            socketio.start_background_task(self._worker)
+
+    def _worker(self):
+        while True:
+            job_id, user_id, session_data, features = self._queue.get()
+            try:
+                self._run(job_id, user_id, session_data, features)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, job_id, user_id, session_data, features=None):
+        self._update(job_id, status='running')
+        start = time.perf_counter()
+        with self.app.app_context():
+            try:
+                sample = capture_sample(user_id, session_data, features)
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                self._count('failed')
+                self._update(job_id, status='failed', error=str(e))
+                print(f"⚠️ Baseline capture failed for user {user_id}: {e}")
+                return
+            self._update(job_id, status='completed', sample_id=sample.id,
+                         elapsed_ms=round((time.perf_counter() - start) * 1000, 2))
+        self._count('completed')
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({'workers': self.workers, 'depth': self._queue.qsize() if self._queue is not None else 0,
+                         'max_depth': self.max_depth})
+        return counters
+
+
+# Global instance
+calibration_queue = CalibrationQueue()
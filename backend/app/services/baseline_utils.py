@@ -1,28 +1,111 @@
-# simple incremental merge logic for numeric features
-from copy import deepcopy
+# app/services/baseline_utils.py
+"""
+Streaming baseline statistics (Welford's algorithm).
 
-def merge_baseline(old_features: dict, new_features: dict, old_count: int) -> dict:
-    """
-    Merge numeric features by incremental average:
-      merged = (old_mean * old_count + new_value) / (old_count + 1)
+A baseline keeps, per numeric feature, [count, mean, M2] where M2 is the sum
+of squared deviations from the mean. Adding a sample is O(features) and
+numerically stable, every sample weighs the same, and the per-user standard
+deviation is sqrt(M2 / (count - 1)):
+
+    count' = count + 1
+    delta  = x - mean
+    mean'  = mean + delta / count'
+    M2'    = M2 + delta * (x - mean')
+
+Features can be missing from a sample, so each keeps its own count.
+
+Baselines recorded before variance was tracked are seeded with their mean
+and sample count but an unknown spread, so stats carry a fourth element:
+the number of samples M2 actually measures ([count, mean, M2, spread_count]).
+The standard deviation is sqrt(M2 / (spread_count - 1)), and only once
+spread_count reaches MIN_SPREAD_SAMPLES; until then z-scores are unknown and
+the z-rules do not fire (a spread from two or three samples is mostly noise).
+"""
+import math
+
+# Baseline columns tracked alongside the free-form features dict
+METRIC_COLUMNS = ('typing_speed_wpm', 'mouse_speed_pxs', 'avg_question_time_sec', 'tab_switch_rate')
+
+# Samples with a measured spread needed before std and z-scores are known
+MIN_SPREAD_SAMPLES = 5
+
+# Standard deviation floor, relative to the mean, so near-constant baselines
+# do not turn ordinary deviations into huge z-scores. A person's typing speed,
+# mouse speed and answer time typically vary 15% or more between sessions.
+MIN_RELATIVE_STD = 0.15
+
+
+def _number(value):
+    if isinstance(value, bool) or value is None:
+        return None
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return None
+    return value if math.isfinite(value) else None
+
+
+def _unpack(stats):
+    """(count, mean, M2, spread_count); stats may be None"""
+    if not stats:
+        return 0, 0.0, 0.0, 0
+    count, mean, m2, spread_count = stats
+    return count, mean, m2, spread_count
+
+
+def update_stats(stats, value):
+    """[count, mean, M2, spread_count] after adding one value (stats may be None)"""
+    count, mean, m2, spread_count = _unpack(stats)
+    count += 1
+    delta = value - mean
+    mean += delta / count
+    m2 += delta * (value - mean)
+    return [count, mean, m2, spread_count + 1]
 
-    For features missing in old_features, treat old_mean as new_value for initialization.
-    Non-numeric values will be replaced by the new value (no averaging).
+
+def merge_sample(feature_stats, sample):
+    """
+    feature_stats with one more sample {feature: value} added. Non-numeric
+    values are skipped. Returns a new outer dict; untouched features are shared.
     """
-    if old_features is None:
-        return new_features
-
-    merged = deepcopy(old_features)
-    for k, v_new in new_features.items():
-        v_old = old_features.get(k)
-        # try numeric averaging
-        try:
-            if v_old is None:
-                merged[k] = v_new
-            else:
-                # both numeric?
-                merged[k] = (float(v_old) * float(old_count) + float(v_new)) / (old_count + 1)
-        except Exception:
-            # fallback: just overwrite non-numeric fields
-            merged[k] = v_new
+    merged = dict(feature_stats or {})
+    for name, value in sample.items():
+        value = _number(value)
+        if value is not None:
+            merged[name] = update_stats(merged.get(name), value)
     return merged
+
+
+def seed_stats(means, count):
+    """
+    Stats for means recorded before variance was tracked: the count and mean
+    are kept, the spread is unknown (spread_count = 0) until new samples arrive.
+    """
+    stats = {}
+    for name, value in (means or {}).items():
+        value = _number(value)
+        if value is not None:
+            stats[name] = [max(int(count or 1), 1), value, 0.0, 0]
+    return stats
+
+
+def mean(stats):
+    return stats[1] if stats else None
+
+
+def std(stats):
+    """Sample standard deviation, or None while it is unknown"""
+    _, _, m2, spread_count = _unpack(stats)
+    if spread_count < MIN_SPREAD_SAMPLES or m2 <= 0:
+        return None
+    return math.sqrt(m2 / (spread_count - 1))
+
+
+def z_score(stats, value):
+    """|value - mean| / std, or None while the spread is unknown"""
+    sigma = std(stats)
+    value = _number(value)
+    if sigma is None or value is None:
+        return None
+    sigma = max(sigma, abs(stats[1]) * MIN_RELATIVE_STD)
+    return abs(value - stats[1]) / sigma if sigma else None
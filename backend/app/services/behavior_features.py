@@ -0,0 +1,56 @@
+# app/services/behavior_features.py
+"""
+The 40 behavioral features of ml-model's BehaviorFeatureExtractor, for the backend.
+
+The extractor is imported from the ml-model directory (ML_MODEL_DIR, by default
+../ml-model next to backend/), the same code the offline trainer uses, so a
+vector computed here lines up with the trained models. Vectors are float32 in
+FEATURE_NAMES order (the extractor's own sorted order).
+"""
+import os
+import sys
+import zlib
+
+import numpy as np
+
+ML_MODEL_DIR = os.getenv('ML_MODEL_DIR') or os.path.normpath(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'ml-model')
+)
+if ML_MODEL_DIR not in sys.path:
+    sys.path.insert(0, ML_MODEL_DIR)
+
+from feature_extractor import BehaviorFeatureExtractor  # noqa: E402
+
+FEATURE_NAMES = (
+    'answer_change_rate', 'answer_quick_ratio', 'answer_slow_ratio', 'answer_time_mean', 'answer_time_std',
+    'cross_activity_concentration', 'cross_behavioral_consistency', 'cross_focus_stability',
+    'cross_mouse_key_correlation', 'cross_multitask_indicator',
+    'key_backspace_rate', 'key_burst_mean', 'key_burst_std', 'key_hold_mean', 'key_hold_std',
+    'key_interval_cv', 'key_interval_mean', 'key_interval_outliers', 'key_interval_std',
+    'key_pattern_stability', 'key_rhythm_entropy', 'key_typing_speed',
+    'mouse_jitter_mean', 'mouse_jitter_std', 'mouse_pause_freq', 'mouse_pause_mean',
+    'mouse_smoothness_mean', 'mouse_smoothness_std', 'mouse_speed_cv', 'mouse_speed_mean',
+    'mouse_speed_std', 'mouse_speed_transitions',
+    'tab_clustering', 'tab_early_late_ratio', 'tab_long_absence_count', 'tab_regularity',
+    'tab_switch_freq', 'tab_time_away_mean', 'tab_time_away_pct', 'tab_time_away_std',
+)
+N_FEATURES = len(FEATURE_NAMES)
+
+# Identifies the feature layout inside stored binary blobs
+FEATURE_LAYOUT_ID = zlib.crc32(','.join(FEATURE_NAMES).encode())
+
+_extractor = BehaviorFeatureExtractor()
+_extractor.feature_names = list(FEATURE_NAMES)
+
+
+def extract_vector(session_data):
+    """float32 feature vector for one session_data payload (see telemetry_codec)"""
+    vector = np.asarray(_extractor.extract_all_features(session_data), dtype=np.float32)
+    # Degenerate telemetry (e.g. no keystrokes) can produce inf/nan; treat as unknown
+    vector[~np.isfinite(vector)] = np.nan
+    return vector
+
+
+def pack_vector(vector):
+    """Little-endian float32 bytes for a feature vector (BaselineSample.feature_vector)"""
+    return np.asarray(vector, dtype='<f4').tobytes()
@@ -0,0 +1,234 @@
+# app/services/behavior_ingest.py
+"""
+Batched behavioral telemetry ingestion (the `behavior_batch` socket event).
+
+A batch carries many typed samples for one student:
+
+    {user_id, exam_id, first_seq, samples: [[type, ts_ms, {fields}], ...]}
+
+and is stored with one session lookup (done by the caller), one guarded
+UPDATE of a per-session high-water mark and one multi-row INSERT.
+
+Delivery is at-least-once. Clients number samples with a monotonic seq
+(sample i of a batch is first_seq + i) and keep them until acked; after a
+reconnect the whole unacked backlog is replayed as one batch. Samples at or
+below the session's last_event_seq are dropped by slicing, without any
+per-event lookup. The high-water mark moves in the same transaction as the
+insert, so samples are either stored and marked or neither.
+
+Older clients send batch_seq instead of first_seq; a batch_seq at or below
+last_batch_seq is a duplicate of a whole batch.
+
+Functions add to the caller's transaction; the caller commits.
+"""
+from datetime import datetime
+
+from sqlalchemy import update, insert, or_, func
+
+from app import db
+from app.models import ExamSession, Event
+from app.services import analytics_rollup
+
+MAX_SAMPLES_PER_BATCH = 500
+# Reconnect replays carry the whole offline backlog in one batch
+MAX_SAMPLES_PER_REPLAY = 5000
+
+# Continuous telemetry: stored for scoring, not counted as incidents
+TELEMETRY_TYPES = {'typing', 'mouse'}
+
+
+def classify_severity(event_type, data, policy=None):
+    """Severity of a suspicious activity event from its payload ('info' if the exam allows it)"""
+    if event_type in TELEMETRY_TYPES or (policy and policy.ignores(event_type)):
+        return 'info'
+    if event_type in ['copy_paste', 'tab_switch'] and (data.get('count') or 0) > 3:
+        return 'high'
+    if event_type == 'window_blur' and (data.get('duration') or 0) > 30:
+        return 'medium'
+    return 'low'
+
+
+def parse_sample(raw):
+    """
+    (event_type, timestamp, data) from a compact [type, ts_ms, {fields}] sample
+    or a {type, ts, ...} dict. Raises ValueError on malformed samples.
+    """
+    if isinstance(raw, (list, tuple)):
+        if len(raw) < 2:
+            raise ValueError('sample needs at least [type, ts]')
+        event_type, ts = raw[0], raw[1]
+        data = dict(raw[2]) if len(raw) > 2 and raw[2] else {}
+    elif isinstance(raw, dict):
+        data = dict(raw)
+        event_type = data.pop('type', None)
+        ts = data.pop('ts', None)
+    else:
+        raise ValueError('sample must be a list or an object')
+
+    if not event_type or not isinstance(event_type, str):
+        raise ValueError('sample type is required')
+    try:
+        timestamp = datetime.utcfromtimestamp(float(ts) / 1000.0)
+    except (TypeError, ValueError, OverflowError, OSError):
+        raise ValueError(f'invalid sample timestamp: {ts!r}')
+
+    data['type'] = event_type
+    return event_type, timestamp, data
+
+
+def parse_samples(samples, limit=MAX_SAMPLES_PER_BATCH):
+    if not isinstance(samples, list) or not samples:
+        raise ValueError('samples must be a non-empty list')
+    if len(samples) > limit:
+        raise ValueError(f'too many samples in one batch (max {limit})')
+    return [parse_sample(raw) for raw in samples]
+
+
+def claim_batch(session_id, batch_seq):
+    """Advance the session's batch high-water mark; False if batch_seq was already stored"""
+    sessions = ExamSession.__table__
+    result = db.session.execute(
+        update(sessions)
+        .where(
+            sessions.c.id == session_id,
+            or_(sessions.c.last_batch_seq.is_(None), sessions.c.last_batch_seq < batch_seq)
+        )
+        .values(last_batch_seq=batch_seq)
+    )
+    return result.rowcount == 1
+
+
+def claim_events(session_id, seen_seq, new_seq):
+    """
+    Move the session's event high-water mark from seen_seq to new_seq.
+    False if another writer moved it first (the caller should retry).
+    """
+    sessions = ExamSession.__table__
+    current = func.coalesce(sessions.c.last_event_seq, 0)
+    result = db.session.execute(
+        update(sessions)
+        .where(sessions.c.id == session_id, current == seen_seq)
+        .values(last_event_seq=new_seq)
+    )
+    return result.rowcount == 1
+
+
+def _empty_result():
+    return {
+        'status': 'stored',
+        'stored': 0,
+        'incidents': 0,
+        'suspicious': [],
+        'behavior': {},
+        'acked_through': None,
+        'gap': 0,
+        'observations': []
+    }
+
+
+def ingest_batch(session, batch_seq, samples, policy=None):
+    """
+    Store one batch of parsed samples for an in-progress session.
+
+    Returns {'status', 'stored', 'incidents', 'suspicious', 'behavior', ...}
+    where status is 'stored' or 'duplicate', suspicious is
+    [(event_type, severity, timestamp)] for proctor updates, observations adds
+    each incident's duration for risk_decay, and behavior holds the latest
+    telemetry metrics for the risk scorer. policy (an ExamPolicy)
+    marks event types the exam allows as 'info'.
+    """
+    result = _empty_result()
+    if not claim_batch(session.id, batch_seq):
+        result['status'] = 'duplicate'
+        return result
+
+    _store_samples(session, samples, result, policy)
+    return result
+
+
+def ingest_events(session, first_seq, samples, policy=None):
+    """
+    Store sequenced samples (sample i has seq first_seq + i), skipping those at
+    or below the session's last_event_seq. Used for both live batches and
+    reconnect replays, which may overlap what the server already has.
+
+    The session should be loaded with FOR UPDATE (see load_session_for_ingest).
+    Adds 'acked_through' (the new high-water mark) and 'gap' (seqs the client
+    skipped) to the result; status is 'stored', 'duplicate' or 'retry'.
+    """
+    result = _empty_result()
+    seen_seq = session.last_event_seq or 0
+    last_seq = first_seq + len(samples) - 1
+
+    if last_seq <= seen_seq:
+        result['status'] = 'duplicate'
+        result['acked_through'] = seen_seq
+        return result
+
+    skip = max(0, seen_seq - first_seq + 1)
+    result['gap'] = max(0, first_seq - seen_seq - 1)
+
+    if not claim_events(session.id, seen_seq, last_seq):
+        result['status'] = 'retry'
+        result['acked_through'] = seen_seq
+        return result
+
+    _store_samples(session, samples[skip:], result, policy)
+    result['acked_through'] = last_seq
+    return result
+
+
+def load_session_for_ingest(exam_id, user_id):
+    """The in-progress session, row-locked on PostgreSQL so concurrent replays serialize"""
+    return ExamSession.query.filter_by(
+        exam_id=exam_id,
+        user_id=user_id,
+        status='in_progress'
+    ).with_for_update().first()
+
+
+def _store_samples(session, samples, result, policy=None):
+    rows = []
+    counts = {}  # {(severity, rollup bucket): stored events}, as process_activity counts them
+    latest_typing = None
+    for event_type, timestamp, data in samples:
+        severity = classify_severity(event_type, data, policy)
+        promoted = Event.promoted_attributes(data)
+        bucket = (severity, analytics_rollup.bucket_start(timestamp))
+        counts[bucket] = counts.get(bucket, 0) + 1
+        rows.append({
+            'session_id': session.id,
+            'event_type': event_type,
+            'event_data': data,
+            'timestamp': timestamp,
+            'severity': severity,
+            **promoted
+        })
+        if event_type in TELEMETRY_TYPES:
+            if event_type == 'typing' and data.get('wpm') is not None:
+                if latest_typing is None or timestamp >= latest_typing[0]:
+                    latest_typing = (timestamp, data['wpm'])
+            continue
+        if severity == 'info':
+            # Allowed by the exam's policy: stored, not an incident
+            continue
+        result['suspicious'].append((event_type, severity, timestamp))
+        result['observations'].append((event_type, severity, timestamp, promoted.get('duration')))
+
+    if rows:
+        db.session.execute(insert(Event), rows)
+    for (severity, bucket), count in counts.items():
+        analytics_rollup.record_event(session.exam_id, severity, bucket, count=count)
+    result['stored'] = len(rows)
+    result['incidents'] = len(result['suspicious'])
+
+    if result['incidents']:
+        sessions = ExamSession.__table__
+        db.session.execute(
+            update(sessions)
+            .where(sessions.c.id == session.id)
+            .values(flagged_incidents_count=sessions.c.flagged_incidents_count + result['incidents'])
+        )
+
+    if latest_typing:
+        result['behavior']['typing_speed_wpm'] = latest_typing[1]
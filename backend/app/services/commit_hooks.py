@@ -0,0 +1,129 @@
+# app/services/commit_hooks.py
+"""
+In-memory side effects that wait for the database transaction to commit.
+
+Per-process state (the policy, answer key and personal model caches, the
+similarity index, the feature reservoir) must not see a change that a
+rollback undoes. Writers stage values in Session.info under a key registered
+with on_commit(); one after_commit listener hands each key's staged values
+to its handler, and after_rollback drops them. Handlers only touch memory:
+SQL cannot be emitted from after_commit.
+
+KeyedCache is the shared per-key cache on top of this: entries load lazily,
+and invalidate_on_commit() drops the entry of a changed row once the change
+commits. Each invalidation bumps a generation, so a load that raced an edit
+is not cached.
+"""
+import threading
+from collections import OrderedDict
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import db
+
+_handlers = {}  # {Session.info key: (handler, unique)}
+
+
+def on_commit(key, handler, unique=False):
+    """Call handler(values) with the values staged under key once their transaction commits"""
+    _handlers[key] = (handler, unique)
+
+
+def stage(key, value, session=None):
+    """Stage a value for key's on_commit handler (a set of values if it is unique, else a list)"""
+    info = (session if session is not None else db.session).info
+    if _handlers[key][1]:
+        info.setdefault(key, set()).add(value)
+    else:
+        info.setdefault(key, []).append(value)
+
+
+@event.listens_for(Session, 'after_commit')
+def _run_committed(session):
+    for key, (handler, _) in _handlers.items():
+        values = session.info.pop(key, None)
+        if values:
+            try:
+                handler(values)
+            except Exception as e:
+                print(f"⚠️ After-commit handler {key} failed: {e}")
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rolled_back(session):
+    for key in _handlers:
+        session.info.pop(key, None)
+
+
+class KeyedCache:
+    """
+    Lazily loaded values by integer key. Subclasses implement load(key);
+    a None result is cached only when cache_missing is set. max_entries
+    bounds the cache (least recently used entries go first).
+    """
+    cache_missing = False
+
+    def __init__(self, max_entries=None):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._generations = {}
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def load(self, key):
+        raise NotImplementedError
+
+    def get(self, key):
+        """The cached value for key, loading it on first use; None for keys that are not integers"""
+        try:
+            key = int(key)
+        except (TypeError, ValueError):
+            return None
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self._counters['hits'] += 1
+                return self._entries[key]
+            self._counters['misses'] += 1
+            generation = self._generations.get(key, 0)
+
+        value = self.load(key)
+        if value is None and not self.cache_missing:
+            return None
+        with self._lock:
+            if self._generations.get(key, 0) == generation:
+                self._entries[key] = value
+                while self.max_entries and len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return value
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generations[key] = self._generations.get(key, 0) + 1
+            if self._entries.pop(key, None) is not None:
+                self._counters['invalidations'] += 1
+
+    def invalidate_on_commit(self, model, key_attr, events=('after_update', 'after_delete')):
+        """Drop the entry of a changed model row (keyed by key_attr) once the change commits"""
+        info_key = ('invalidate', id(self))
+
+        def invalidate_all(keys):
+            for key in keys:
+                self.invalidate(key)
+
+        def changed(mapper, connection, target):
+            key = getattr(target, key_attr)
+            session = Session.object_session(target)
+            if session is not None:
+                stage(info_key, key, session)
+            else:
+                self.invalidate(key)
+
+        on_commit(info_key, invalidate_all, unique=True)
+        for name in events:
+            event.listen(model, name, changed)
+
+    def metrics(self):
+        with self._lock:
+            return {**self._counters, 'cached': len(self._entries)}
@@ -0,0 +1,81 @@
+# app/services/exam_policy.py
+"""
+Per-exam scoring policy, cached in memory.
+
+An ExamPolicy is built from the exam's settings:
+- monitoring_sensitivity picks the rule profile (thresholds and weights,
+  see rule_engine.SENSITIVITY_PROFILES)
+- allow_tab_switch / allow_copy_paste make the matching event types
+  "allowed": they are still stored, but classified 'info', not counted as
+  incidents and left out of the risk score
+
+Policies are loaded when the exam room opens (join_exam) and then served
+from memory, so the live scorer reads no exam rows per event. An exam edit
+drops its policy once the edit commits (commit_hooks.KeyedCache), and the
+next lookup rebuilds it. The cache is per process, like the
+roster and broadcaster state.
+"""
+from app import db
+from app.models import Exam
+from app.services.commit_hooks import KeyedCache
+from app.services.rule_engine import DEFAULT_SENSITIVITY, SENSITIVITY_PROFILES
+
+# Event types an exam setting allows
+ALLOWED_BY_SETTING = {
+    # A tab switch is reported as tab_switch or as a window blur, depending on the browser
+    'allow_tab_switch': ('tab_switch', 'window_blur'),
+    'allow_copy_paste': ('copy_paste', 'copy_attempt', 'paste_attempt'),
+}
+
+
+class ExamPolicy:
+    def __init__(self, exam_id, sensitivity=DEFAULT_SENSITIVITY, ignored_events=()):
+        self.exam_id = exam_id
+        self.sensitivity = sensitivity if sensitivity in SENSITIVITY_PROFILES else DEFAULT_SENSITIVITY
+        self.ignored_events = frozenset(ignored_events)
+
+    @classmethod
+    def from_exam(cls, exam):
+        ignored = []
+        for setting, event_types in ALLOWED_BY_SETTING.items():
+            if getattr(exam, setting):
+                ignored.extend(event_types)
+        return cls(exam.id, exam.monitoring_sensitivity, ignored)
+
+    def ignores(self, event_type):
+        return event_type in self.ignored_events
+
+    def filter_summary(self, summary):
+        """An event summary without the event types this exam allows"""
+        if not self.ignored_events:
+            return summary
+        by_type = {t: n for t, n in summary['by_type'].items() if t not in self.ignored_events}
+        removed = sum(n for t, n in summary['by_type'].items() if t in self.ignored_events)
+        return {
+            'total': summary['total'] - removed,
+            'by_type': by_type,
+            'by_severity': summary['by_severity'],
+            'blur_seconds': 0.0 if 'window_blur' in self.ignored_events else summary['blur_seconds']
+        }
+
+    def to_dict(self):
+        return {
+            'exam_id': self.exam_id,
+            'sensitivity': self.sensitivity,
+            'ignored_events': sorted(self.ignored_events)
+        }
+
+
+class PolicyCache(KeyedCache):
+    def load(self, exam_id):
+        exam = db.session.get(Exam, exam_id)
+        return ExamPolicy.from_exam(exam) if exam else None
+
+    def get(self, exam_id):
+        """The exam's policy; loads it on first use. Unknown exams get the default policy."""
+        return super().get(exam_id) or ExamPolicy(exam_id)
+
+
+# Global instance
+policy_cache = PolicyCache()
+policy_cache.invalidate_on_commit(Exam, 'id')
@@ -0,0 +1,55 @@
+# app/services/metrics.py
+"""
+In-process metrics primitives for the /api/metrics endpoint
+"""
+import bisect
+import threading
+
+
+class Histogram:
+    """
+    Fixed-bucket histogram with per-bucket (non-cumulative) counts.
+    Quantiles are estimated as the upper bound of the bucket they fall in.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = sorted(bounds)
+        self._lock = threading.Lock()
+        self._counts = [0] * (len(self.bounds) + 1)  # last bucket: above the highest bound
+        self._sum = 0.0
+        self._count = 0
+        self._max = None
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.bounds, value)
+        with self._lock:
+            self._counts[index] += 1
+            self._sum += value
+            self._count += 1
+            if self._max is None or value > self._max:
+                self._max = value
+
+    def _quantile(self, q):
+        if not self._count:
+            return None
+        rank = q * self._count
+        seen = 0
+        for index, count in enumerate(self._counts):
+            seen += count
+            if seen >= rank:
+                return self.bounds[index] if index < len(self.bounds) else self._max
+        return self._max
+
+    def snapshot(self):
+        with self._lock:
+            labels = [f"le_{bound:g}" for bound in self.bounds] + ['inf']
+            return {
+                'count': self._count,
+                'sum': self._sum,
+                'mean': self._sum / self._count if self._count else None,
+                'max': self._max,
+                'p50': self._quantile(0.5),
+                'p95': self._quantile(0.95),
+                'p99': self._quantile(0.99),
+                'buckets': dict(zip(labels, self._counts))
+            }
@@ -0,0 +1,288 @@
+# app/services/model_retrainer.py
+"""
+Production retraining of the global anomaly model.
+
+The Isolation Forest from ml-model/model_trainer.py is trained on synthetic
+sessions only. This service feeds it real ones:
+
+- every submission that has a feature vector (ExamSession.feature_vector,
+  stored when the session was scored) is offered to an on-disk reservoir
+  sample, ml-model's FeatureReservoir. This is a bounded float32 memmap of
+  MODEL_RESERVOIR_SIZE rows and a uniform sample of every session ever
+  submitted. Vectors are added once the submission commits. Adding one is
+  a single row store.
+- a scheduler checks every RETRAIN_POLL_SECONDS. Once MODEL_RETRAIN_INTERVAL
+  has passed and at least MODEL_RETRAIN_MIN_NEW sessions have arrived, it
+  launches ml-model/production_retrain.py as a separate, niced process.
+  The last run is recorded in a marker file next to the reservoir, claimed
+  under a file lock, so only one of the backend processes starts each run.
+  Training never runs inside the serving process. The script writes the
+  next versioned artifact directory (MODELS_DIR/v0001, ...) and publishes
+  it by replacing MODELS_DIR/CURRENT. A model that does not separate held-out
+  sessions from generated cheaters is not published.
+- serving processes (AnomalyModelService) check CURRENT at most every
+  MODEL_RELOAD_CHECK_SECONDS. They load a new version on a side thread and
+  swap it in when it is ready, and keep scoring with the old one until then.
+
+The reservoir and versions live in MODEL_PRODUCTION_DIR (default
+ml-model/production) and are shared by every backend process on the host.
+
+MODEL_RETRAIN_DETECTOR=half_space_trees trains ml-model's streaming
+HalfSpaceTrees instead of the Isolation Forest. Such a model also keeps
+learning between retrains: committed vectors are passed to the functions
+registered with add_learner() (the serving AnomalyModelService).
+"""
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+import numpy as np
+
+from app import socketio
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process claim, run a single backend process
+    fcntl = None
+from app.services.behavior_features import ML_MODEL_DIR, N_FEATURES, FEATURE_LAYOUT_ID
+from app.services.commit_hooks import on_commit, stage
+
+from feature_reservoir import FeatureReservoir  # noqa: E402  (ml-model, on sys.path via behavior_features)
+
+PRODUCTION_DIR = os.getenv('MODEL_PRODUCTION_DIR') or os.path.join(ML_MODEL_DIR, 'production')
+RESERVOIR_PATH = os.path.join(PRODUCTION_DIR, 'reservoir.f32')
+MODELS_DIR = os.path.join(PRODUCTION_DIR, 'models')
+RETRAIN_SCRIPT = os.path.join(ML_MODEL_DIR, 'production_retrain.py')
+RETRAIN_LOG = os.path.join(PRODUCTION_DIR, 'retrain.log')
+LAST_RUN_FILE = os.path.join(PRODUCTION_DIR, 'last_retrain.json')
+CURRENT_FILE = 'CURRENT'
+
+RESERVOIR_SIZE = int(os.getenv('MODEL_RESERVOIR_SIZE', 100000))
+RETRAIN_INTERVAL = int(os.getenv('MODEL_RETRAIN_INTERVAL', 6 * 3600))  # seconds; 0 disables the scheduler
+RETRAIN_MIN_NEW = int(os.getenv('MODEL_RETRAIN_MIN_NEW', 1000))
+RETRAIN_DETECTOR = os.getenv('MODEL_RETRAIN_DETECTOR', 'isolation_forest')
+RETRAIN_POLL_SECONDS = 30
+RETRAIN_NICE = 10
+
+# production_retrain.py exit codes
+EXIT_STATUS = {0: 'published', 3: 'not_enough_data', 4: 'rejected'}
+
+
+def current_version(models_dir=MODELS_DIR):
+    """Published model version name (e.g. 'v0003'), or None"""
+    try:
+        with open(os.path.join(models_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except OSError:
+        return None
+
+
+class ModelRetrainer:
+    def __init__(self, reservoir_path=RESERVOIR_PATH, models_dir=MODELS_DIR,
+                 capacity=RESERVOIR_SIZE, interval=RETRAIN_INTERVAL, min_new=RETRAIN_MIN_NEW,
+                 detector=RETRAIN_DETECTOR):
+        self.reservoir_path = reservoir_path
+        self.models_dir = models_dir
+        self.capacity = capacity
+        self.interval = interval
+        self.min_new = min_new
+        self.detector = detector
+        self._learners = []
+
+        self.app = None
+        self._reservoir = None
+        self._reservoir_error = None
+        self._process = None
+        self._run = None  # status of this process's running / last run
+        self._started = False
+        self._lock = threading.Lock()
+        self._counters = {'offered': 0, 'stored': 0, 'runs': 0, 'published': 0, 'failed': 0}
+
+    def init_app(self, app):
+        self.app = app
+        if self.interval > 0:
+            with self._lock:
+                if self._started:
+                    return
+                self._started = True
+            socketio.start_background_task(self._scheduler)
+
+    # ---- reservoir ----
+
+    def reservoir(self):
+        """The shared reservoir, opened on first use; None if it cannot be opened"""
+        if self._reservoir is None and self._reservoir_error is None:
+            try:
+                self._reservoir = FeatureReservoir(
+                    self.reservoir_path, N_FEATURES, capacity=self.capacity, layout_id=FEATURE_LAYOUT_ID
+                )
+            except (OSError, ValueError) as e:
+                self._reservoir_error = str(e)
+                print(f"⚠️ Feature reservoir unavailable: {e}")
+        return self._reservoir
+
+    def record(self, feature_vector, risk_score):
+        """Offer a submitted session's packed feature vector, once the transaction commits"""
+        if feature_vector:
+            stage('reservoir_rows', (feature_vector, risk_score))
+
+    def add_learner(self, learner):
+        """Call learner(vectors, risks) with every batch of committed vectors"""
+        if learner not in self._learners:
+            self._learners.append(learner)
+
+    def add(self, rows):
+        """Add (packed vector, risk) pairs to the reservoir now"""
+        vectors = [np.frombuffer(blob, dtype='<f4') for blob, _ in rows]
+        keep = [i for i, vector in enumerate(vectors) if len(vector) == N_FEATURES]
+        if not keep:
+            return 0
+        vectors = np.vstack([vectors[i] for i in keep])
+        risks = np.array([rows[i][1] if rows[i][1] is not None else np.nan for i in keep], dtype=np.float32)
+        for learner in self._learners:
+            try:
+                learner(vectors, risks)
+            except Exception as e:
+                print(f"⚠️ Online model update failed: {e}")
+        with self._lock:
+            reservoir = self.reservoir()
+            if reservoir is None:
+                return 0
+            stored = reservoir.add(vectors, risks)
+            self._counters['offered'] += len(keep)
+            self._counters['stored'] += stored
+        return stored
+
+    # ---- retraining ----
+
+    def _scheduler(self):
+        while True:
+            socketio.sleep(RETRAIN_POLL_SECONDS)
+            try:
+                self.poll()
+                self.start('scheduled', force=False)
+            except Exception as e:
+                print(f"⚠️ Model retrain scheduler failed: {e}")
+
+    def _claim_run(self, reservoir, seen, force):
+        """Record a new run in the marker file, unless (not forced) none is due"""
+        os.makedirs(PRODUCTION_DIR, exist_ok=True)
+        with open(LAST_RUN_FILE + '.lock', 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            if not force and not self.due(reservoir, self.last_run()):
+                return False
+            tmp_path = f"{LAST_RUN_FILE}.tmp{os.getpid()}"
+            with open(tmp_path, 'w') as f:
+                json.dump({'started': time.time(), 'seen': seen, 'pid': os.getpid()}, f)
+            os.replace(tmp_path, LAST_RUN_FILE)
+        return True
+
+    @staticmethod
+    def last_run():
+        """The marker of the last run started by any backend process ({} if none)"""
+        try:
+            with open(LAST_RUN_FILE) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def due(self, reservoir, last_run):
+        return (time.time() - last_run.get('started', 0) >= self.interval
+                and reservoir.seen - last_run.get('seen', 0) >= self.min_new)
+
+    def start(self, reason='manual', force=True):
+        """
+        Launch a retraining process. Returns its status, or None if this
+        process is already running one (or, unless forced, if none is due).
+        """
+        with self._lock:
+            if self._process is not None:
+                return None
+            reservoir = self.reservoir()
+            if reservoir is None:
+                raise RuntimeError(f"Feature reservoir unavailable: {self._reservoir_error}")
+            seen = reservoir.seen
+            if not self._claim_run(reservoir, seen, force):
+                return None
+            reservoir.flush()
+
+            os.makedirs(os.path.dirname(RETRAIN_LOG), exist_ok=True)
+            log = open(RETRAIN_LOG, 'a')
+            log.write(f"\n=== {datetime.utcnow().isoformat()} retrain ({reason}) ===\n")
+            log.flush()
+            self._process = subprocess.Popen(
+                [sys.executable, RETRAIN_SCRIPT,
+                 '--reservoir', self.reservoir_path,
+                 '--models-dir', self.models_dir,
+                 '--n-features', str(N_FEATURES),
+                 '--layout-id', str(FEATURE_LAYOUT_ID),
+                 '--detector', self.detector],
+                cwd=ML_MODEL_DIR,
+                stdout=log,
+                stderr=subprocess.STDOUT,
+                preexec_fn=(lambda: os.nice(RETRAIN_NICE)) if hasattr(os, 'nice') else None
+            )
+            log.close()  # the child keeps its own handle
+
+            self._counters['runs'] += 1
+            self._run = {
+                'status': 'running',
+                'reason': reason,
+                'detector': self.detector,
+                'pid': self._process.pid,
+                'reservoir_seen': seen,
+                'started_at': datetime.utcnow().isoformat()
+            }
+            print(f"🧠 Retraining anomaly model on {min(seen, self.capacity)} production sessions (pid {self._process.pid})")
+            return dict(self._run)
+
+    def poll(self):
+        """Collect a finished retraining process"""
+        with self._lock:
+            if self._process is None or self._process.poll() is None:
+                return
+            code = self._process.returncode
+            self._process = None
+            status = EXIT_STATUS.get(code, 'failed')
+            self._run.update(status=status, exit_code=code, finished_at=datetime.utcnow().isoformat())
+            if status == 'published':
+                self._counters['published'] += 1
+                self._run['version'] = current_version(self.models_dir)
+            elif status == 'failed':
+                self._counters['failed'] += 1
+        print(f"🧠 Model retrain finished: {status} (see {RETRAIN_LOG})")
+
+    def status(self):
+        self.poll()
+        with self._lock:
+            reservoir = self._reservoir.stats() if self._reservoir is not None else None
+            return {
+                'current_version': current_version(self.models_dir),
+                'last_run': dict(self._run) if self._run else None,
+                'last_run_any_process': self.last_run(),
+                'reservoir': reservoir,
+                'reservoir_error': self._reservoir_error,
+                'interval_seconds': self.interval,
+                'detector': self.detector,
+                'min_new_sessions': self.min_new
+            }
+
+    def metrics(self):
+        self.poll()
+        with self._lock:
+            counters = dict(self._counters)
+            counters['running'] = self._process is not None
+            counters['reservoir_rows'] = len(self._reservoir) if self._reservoir is not None else 0
+        counters['current_version'] = current_version(self.models_dir)
+        return counters
+
+
+# Global instance
+model_retrainer = ModelRetrainer()
+on_commit('reservoir_rows', model_retrainer.add)
+
@@ -0,0 +1,241 @@
+# app/services/risk_decay.py
+"""
+Time-decayed incident state for live risk scoring.
+
+The live scorer used to feed the rules the session's all-time event counts,
+so risk could only go up and a burst early in the exam weighed as much as
+one a minute ago. Instead, each session keeps per event type:
+
+- an exponentially decayed count (each event starts at 1 and halves every
+  half-life seconds; window_blur also keeps decayed blur seconds)
+- a sliding-window count over the last WINDOW_SECONDS, in a fixed ring of
+  WINDOW_BUCKETS buckets
+
+Both update in O(1) per event with fixed memory per session. The rules see
+the decayed counts in place of the raw counts (see summary()), so every
+heuristic decays with no rule changes. A decayed count below
+MIN_EFFECTIVE_COUNT no longer counts as an incident at all.
+
+Each live score is also appended to a bounded trajectory, which the
+dashboard reads through GET /api/exams/sessions/<id>/risk-trajectory.
+
+State is per process and rebuilt from the session's stored events the first
+time a session is touched (one query). At most MAX_TRACKED_SESSIONS are kept,
+least recently used first out.
+"""
+import os
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+
+from sqlalchemy import select
+
+from app import db
+from app.models import Event
+
+EPOCH = datetime(1970, 1, 1)
+
+DEFAULT_HALF_LIFE_S = float(os.getenv('RISK_DECAY_HALF_LIFE_S', 600))
+# Per event type, e.g. "tab_switch=300,copy_paste=1200"
+HALF_LIFE_OVERRIDES = os.getenv('RISK_DECAY_HALF_LIVES', 'copy_paste=1200,paste_attempt=1200')
+WINDOW_SECONDS = int(os.getenv('RISK_WINDOW_SECONDS', 300))
+WINDOW_BUCKETS = int(os.getenv('RISK_WINDOW_BUCKETS', 30))
+TRAJECTORY_POINTS = int(os.getenv('RISK_TRAJECTORY_POINTS', 360))
+MAX_TRACKED_SESSIONS = int(os.getenv('RISK_MAX_TRACKED_SESSIONS', 20000))
+MIN_EFFECTIVE_COUNT = 0.5
+
+
+def parse_half_lives(spec):
+    half_lives = {}
+    for item in filter(None, (part.strip() for part in (spec or '').split(','))):
+        event_type, _, seconds = item.partition('=')
+        try:
+            half_lives[event_type.strip()] = float(seconds)
+        except ValueError:
+            print(f"⚠️ Ignoring invalid half-life {item!r}")
+    return half_lives
+
+
+HALF_LIVES = parse_half_lives(HALF_LIFE_OVERRIDES)
+
+
+def half_life(event_type):
+    return HALF_LIVES.get(event_type, DEFAULT_HALF_LIFE_S)
+
+
+def to_seconds(ts):
+    """Seconds since the epoch for a naive UTC datetime"""
+    return (ts - EPOCH).total_seconds()
+
+
+class DecayedValue:
+    """A sum whose terms halve every half_life seconds"""
+    __slots__ = ('half_life', 'value', 'at')
+
+    def __init__(self, half_life):
+        self.half_life = half_life
+        self.value = 0.0
+        self.at = None
+
+    def add(self, amount, t):
+        if self.at is None:
+            self.value, self.at = amount, t
+        elif t >= self.at:
+            self.value = self.value * 2.0 ** (-(t - self.at) / self.half_life) + amount
+            self.at = t
+        else:
+            # Late event: decay it to the current reference time instead
+            self.value += amount * 2.0 ** (-(self.at - t) / self.half_life)
+
+    def at_time(self, t):
+        if self.at is None:
+            return 0.0
+        return self.value * 2.0 ** (-max(0.0, t - self.at) / self.half_life)
+
+
+class SlidingWindow:
+    """Event count over the last `seconds`, in a ring of fixed-width buckets"""
+    __slots__ = ('width', 'counts', 'epochs')
+
+    def __init__(self, seconds=WINDOW_SECONDS, buckets=WINDOW_BUCKETS):
+        self.width = seconds / buckets
+        self.counts = [0] * buckets
+        self.epochs = [-1] * buckets
+
+    def add(self, t, count=1):
+        epoch = int(t // self.width)
+        i = epoch % len(self.counts)
+        if self.epochs[i] != epoch:
+            if self.epochs[i] > epoch:
+                return  # older than the window
+            self.epochs[i] = epoch
+            self.counts[i] = 0
+        self.counts[i] += count
+
+    def total(self, t):
+        oldest = int(t // self.width) - len(self.counts) + 1
+        return sum(c for c, e in zip(self.counts, self.epochs) if e >= oldest)
+
+
+class SessionRiskState:
+    __slots__ = ('counts', 'blur_seconds', 'windows', 'trajectory', 'behavior')
+
+    def __init__(self):
+        self.counts = {}  # {event_type: DecayedValue}
+        self.blur_seconds = DecayedValue(half_life('window_blur'))
+        self.windows = {}  # {event_type: SlidingWindow}
+        self.trajectory = deque(maxlen=TRAJECTORY_POINTS)  # (t, risk)
+        self.behavior = {}  # latest live behavior metrics
+
+    def observe(self, event_type, t, duration=None):
+        counter = self.counts.get(event_type)
+        if counter is None:
+            counter = self.counts[event_type] = DecayedValue(half_life(event_type))
+            self.windows[event_type] = SlidingWindow()
+        counter.add(1.0, t)
+        self.windows[event_type].add(t)
+        if event_type == 'window_blur' and duration:
+            self.blur_seconds.add(float(duration), t)
+
+
+class RiskDecayTracker:
+    def __init__(self, max_sessions=MAX_TRACKED_SESSIONS):
+        self.max_sessions = max_sessions
+        self._states = OrderedDict()
+        self._lock = threading.Lock()
+
+    def ensure(self, session_id):
+        """
+        Make sure the session's state exists. Returns True if it was just
+        rebuilt from stored events (which then already include anything the
+        caller has committed), False if it was already tracked.
+        """
+        with self._lock:
+            if session_id in self._states:
+                self._states.move_to_end(session_id)
+                return False
+
+        rows = db.session.execute(
+            select(Event.event_type, Event.timestamp, Event.duration)
+            .where(Event.session_id == session_id, Event.severity != 'info')
+            .order_by(Event.timestamp)
+        ).all()
+        state = SessionRiskState()
+        for event_type, timestamp, duration in rows:
+            state.observe(event_type, to_seconds(timestamp), duration)
+
+        with self._lock:
+            if session_id in self._states:
+                return False
+            self._states[session_id] = state
+            while len(self._states) > self.max_sessions:
+                self._states.popitem(last=False)
+        return True
+
+    def observe(self, session_id, observations):
+        """Add [(event_type, severity, timestamp, duration)]; 'info' events are skipped"""
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return
+            for event_type, severity, timestamp, duration in observations:
+                if severity != 'info':
+                    state.observe(event_type, to_seconds(timestamp), duration)
+
+    def summary(self, session_id, now=None):
+        """
+        An event summary (the shape RiskScorer expects) of decayed counts at
+        `now`. Types whose decayed count is below MIN_EFFECTIVE_COUNT are left out.
+        """
+        t = to_seconds(now or datetime.utcnow())
+        by_type = {}
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            for event_type, counter in state.counts.items():
+                value = counter.at_time(t)
+                if value >= MIN_EFFECTIVE_COUNT:
+                    by_type[event_type] = value
+            blur_seconds = state.blur_seconds.at_time(t) if 'window_blur' in by_type else 0.0
+        return {
+            'total': sum(by_type.values()),
+            'by_type': by_type,
+            'by_severity': {},
+            'blur_seconds': blur_seconds
+        }
+
+    def record_risk(self, session_id, risk_score, behavior=None, now=None):
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return
+            state.trajectory.append((to_seconds(now or datetime.utcnow()), float(risk_score)))
+            if behavior:
+                state.behavior.update(behavior)
+
+    def snapshot(self, session_id, now=None):
+        """Trajectory, decayed counts and window counts for the dashboard"""
+        t = to_seconds(now or datetime.utcnow())
+        with self._lock:
+            state = self._states.get(session_id)
+            if state is None:
+                return None
+            return {
+                'trajectory': [
+                    {'timestamp': datetime.utcfromtimestamp(at).isoformat(), 'risk_score': risk}
+                    for at, risk in state.trajectory
+                ],
+                'decayed_counts': {k: round(c.at_time(t), 3) for k, c in state.counts.items()},
+                'window_counts': {k: w.total(t) for k, w in state.windows.items()},
+                'window_seconds': WINDOW_SECONDS,
+                'behavior': dict(state.behavior)
+            }
+
+    def metrics(self):
+        with self._lock:
+            return {'tracked_sessions': len(self._states), 'max_sessions': self.max_sessions}
+
+
+# Global instance
+tracker = RiskDecayTracker()
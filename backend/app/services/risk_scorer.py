@@ -6,10 +6,31 @@ Uses behavioral analytics to calculate real-time risk scores
 import numpy as np
 from sklearn.ensemble import IsolationForest
 from sklearn.preprocessing import StandardScaler
-import json
 import joblib
 import os
 
+from app.services.rule_engine import session_rules, session_inputs, to_columns
+
+
+def summarize_events(events):
+    """
+    Reduce a list of Event rows to the aggregate the scorer needs.
+    submission.event_summaries builds the same shape with one grouped SQL query.
+    """
+    summary = empty_event_summary()
+    for event in events:
+        summary['total'] += 1
+        summary['by_type'][event.event_type] = summary['by_type'].get(event.event_type, 0) + 1
+        summary['by_severity'][event.severity] = summary['by_severity'].get(event.severity, 0) + 1
+        if event.event_type == 'window_blur':
+            summary['blur_seconds'] += event.duration or 0
+    return summary
+
+
+def empty_event_summary():
+    return {'total': 0, 'by_type': {}, 'by_severity': {}, 'blur_seconds': 0.0}
+
+
 class RiskScorer:
     def __init__(self, model_path=None):
         self.scaler = StandardScaler()
@@ -59,15 +80,23 @@ class RiskScorer:
         self.is_trained = True
         print("✅ Initialized ML model with synthetic baseline data")
 
-    def calculate_risk_score(self, current_behavior, baseline, events):
+    def calculate_risk_score(self, current_behavior, baseline, events, sensitivity=None):
         """
         Calculate risk score using Hybrid approach:
         1. Heuristic Rules (Expert System)
         2. ML Anomaly Detection (Isolation Forest)
+        
+        events may be a list of Event rows or an event summary (see summarize_events).
+        Behavior metrics that are missing or None count as matching the baseline.
+        sensitivity is the exam's monitoring_sensitivity (rule thresholds profile).
         """
         try:
+            if not isinstance(events, dict):
+                events = summarize_events(events)
+            current_behavior = {k: v for k, v in (current_behavior or {}).items() if v is not None}
+            
             # 1. Calculate Heuristic Score
-            heuristic_score = self._calculate_heuristic_score(current_behavior, baseline, events)
+            heuristic_score = self._calculate_heuristic_score(current_behavior, baseline, events, sensitivity)
             
             # 2. Calculate ML Anomaly Score
             ml_score = self._calculate_ml_score(current_behavior, events)
@@ -82,6 +111,36 @@ class RiskScorer:
             print(f"Error calculating risk score: {e}")
             return 0.0
 
+    def calculate_risk_scores(self, behaviors, baselines, summaries, sensitivity=None):
+        """
+        calculate_risk_score for many sessions of one exam at once: the rules
+        and the Isolation Forest each run once over the whole batch.
+        Returns a list of floats in input order.
+        """
+        if not summaries:
+            return []
+        try:
+            behaviors = [
+                {k: v for k, v in (behavior or {}).items() if v is not None}
+                for behavior in behaviors
+            ]
+            rows = [
+                session_inputs(behavior, baseline, summary)
+                for behavior, baseline, summary in zip(behaviors, baselines, summaries)
+            ]
+            heuristic, _ = session_rules.evaluate(to_columns(rows), sensitivity)
+            ml = self._ml_scores(np.array([
+                [behavior.get('typing_speed_wpm', 45),
+                 row['tab_switches'],
+                 behavior.get('mouse_speed_pxs', 500),
+                 behavior.get('avg_question_time_sec', 150)]
+                for row, behavior in zip(rows, behaviors)
+            ], dtype=np.float64))
+            return np.clip(heuristic * 0.7 + ml * 0.3, 0.0, 1.0).tolist()
+        except Exception as e:
+            print(f"Error calculating risk scores: {e}")
+            return [0.0] * len(summaries)
+
     def _calculate_ml_score(self, current_behavior, events):
         """Get anomaly score from Isolation Forest"""
         if not self.is_trained:
@@ -90,7 +149,7 @@ class RiskScorer:
         try:
             # Extract features matching training data
             # [typing_speed, tab_switches, mouse_speed, answer_time]
-            tab_switches = len([e for e in events if e.event_type == 'tab_switch'])
+            tab_switches = events['by_type'].get('tab_switch', 0)
             
             features = np.array([[
                 current_behavior.get('typing_speed_wpm', 45),
@@ -99,144 +158,34 @@ class RiskScorer:
                 current_behavior.get('avg_question_time_sec', 150)
             ]])
             
-            # Scale features
-            features_scaled = self.scaler.transform(features)
-            
-            # Predict anomaly score (lower is more anomalous)
-            # decision_function returns negative for outliers, positive for inliers
-            score = self.model.decision_function(features_scaled)[0]
-            
-            # Convert to risk probability (0 to 1)
-            # Typical range is -0.5 to 0.5. We map -0.5 (anomaly) to 1.0 (high risk)
-            # and 0.5 (normal) to 0.0 (low risk)
-            risk_prob = 1.0 / (1.0 + np.exp(score * 5)) # Sigmoid-like transformation
-            
-            return risk_prob
+            return float(self._ml_scores(features)[0])
             
         except Exception as e:
             print(f"ML scoring error: {e}")
             return 0.0
 
-    def _calculate_heuristic_score(self, current_behavior, baseline, events):
-        """Original rule-based calculation"""
-        # Calculate individual component scores
-        typing_score = self._calculate_typing_score(
-            current_behavior.get('typing_speed_wpm', 0),
-            baseline.typing_speed_wpm or 45
-        )
-        
-        tab_switch_score = self._calculate_tab_switch_score(
-            events,
-            baseline.tab_switch_rate or 0.01
-        )
-        
-        mouse_score = self._calculate_mouse_score(
-            current_behavior.get('mouse_speed_pxs', 0),
-            baseline.mouse_speed_pxs or 500
-        )
-        
-        answer_speed_score = self._calculate_answer_speed_score(
-            current_behavior.get('avg_question_time_sec', 0),
-            baseline.avg_question_time_sec or 150
-        )
-        
-        window_focus_score = self._calculate_window_focus_score(events)
-        
-        # Weighted combination
-        return (
-            typing_score * 0.2 +
-            tab_switch_score * 0.3 +
-            mouse_score * 0.15 +
-            answer_speed_score * 0.2 +
-            window_focus_score * 0.15
-        )
-    
-    def _calculate_typing_score(self, current_wpm, baseline_wpm):
-        """Calculate typing speed deviation score"""
-        if baseline_wpm == 0:
-            return 0.0
-        
-        deviation = abs(current_wpm - baseline_wpm) / baseline_wpm
-        
-        # High deviation = high risk
-        if deviation > 1.0:  # More than 100% deviation
-            return 0.9
-        elif deviation > 0.5:  # 50-100% deviation
-            return 0.6
-        elif deviation > 0.3:  # 30-50% deviation
-            return 0.3
-        else:
-            return 0.1
-    
-    def _calculate_tab_switch_score(self, events, baseline_rate):
-        """Calculate tab switching risk score"""
-        tab_switches = [e for e in events if e.event_type == 'tab_switch']
-        current_rate = len(tab_switches)
-        
-        if current_rate == 0:
-            return 0.0
-        
-        # More than 5 tab switches is highly suspicious
-        if current_rate > 10:
-            return 1.0
-        elif current_rate > 5:
-            return 0.8
-        elif current_rate > 2:
-            return 0.5
-        else:
-            return 0.2
-    
-    def _calculate_mouse_score(self, current_speed, baseline_speed):
-        """Calculate mouse movement deviation score"""
-        if baseline_speed == 0:
-            return 0.0
-        
-        deviation = abs(current_speed - baseline_speed) / baseline_speed
-        
-        # Unusually slow mouse movement can indicate cheating
-        if current_speed < baseline_speed * 0.3:  # Less than 30% of normal
-            return 0.7
-        elif deviation > 0.5:
-            return 0.4
-        else:
-            return 0.1
-    
-    def _calculate_answer_speed_score(self, current_time, baseline_time):
-        """Calculate answer speed deviation score"""
-        if baseline_time == 0:
-            return 0.0
-        
-        # Too fast = suspicious (copy-paste)
-        if current_time < baseline_time * 0.3:
-            return 0.8
-        # Too slow = might be looking up answers
-        elif current_time > baseline_time * 3:
-            return 0.6
-        else:
-            return 0.1
-    
-    def _calculate_window_focus_score(self, events):
-        """Calculate window focus loss score"""
-        blur_events = [e for e in events if e.event_type == 'window_blur']
+    def _ml_scores(self, features):
+        """Risk probabilities for a feature matrix (one row per session)"""
+        if not self.is_trained:
+            return np.zeros(len(features))
         
-        if not blur_events:
-            return 0.0
+        # Scale features
+        features_scaled = self.scaler.transform(features)
         
-        # Calculate total blur time
-        total_blur_time = 0
-        for event in blur_events:
-            event_data = json.loads(event.event_data) if event.event_data else {}
-            total_blur_time += event_data.get('duration', 0)
+        # Predict anomaly score (lower is more anomalous)
+        # decision_function returns negative for outliers, positive for inliers
+        scores = self.model.decision_function(features_scaled)
         
-        # More than 2 minutes of blur time is suspicious
-        if total_blur_time > 120:
-            return 0.9
-        elif total_blur_time > 60:
-            return 0.6
-        elif total_blur_time > 30:
-            return 0.3
-        else:
-            return 0.1
+        # Convert to risk probability (0 to 1)
+        # Typical range is -0.5 to 0.5. We map -0.5 (anomaly) to 1.0 (high risk)
+        # and 0.5 (normal) to 0.0 (low risk)
+        return 1.0 / (1.0 + np.exp(scores * 5))  # Sigmoid-like transformation
+
+    def _calculate_heuristic_score(self, current_behavior, baseline, events, sensitivity=None):
+        """Rule-based component (see rule_engine.SESSION_RULES)"""
+        inputs = session_inputs(current_behavior, baseline, events)
+        risk, _ = session_rules.evaluate_one(inputs, sensitivity)
+        return risk
     
     def get_risk_level(self, risk_score):
         """Convert risk score to level"""
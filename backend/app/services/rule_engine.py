@@ -0,0 +1,352 @@
+# app/services/rule_engine.py
+"""
+Declarative heuristic rules, compiled into a vectorized evaluator.
+
+A rule maps one or more signals to a component score:
+
+    {'name': 'tab_switch', 'weight': 0.3,
+     'checks': [('tab_switches', '>', 10, 1.0), ('tab_switches', '>', 5, 0.8), ...],
+     'default': 0.0, 'guard': None}
+
+Checks are tried in order and the first match gives the score (an if/elif
+chain); when none match the rule scores `default`. A rule with a `guard`
+signal scores 0 wherever that signal is <= 0. The risk is
+sum(weight * score), clipped to [0, 1].
+
+Signals are NumPy functions of input columns (see SESSION_SIGNALS), so the
+same compiled rule set scores one session or thousands in a handful of
+array operations.
+
+Per-exam `monitoring_sensitivity` selects a profile that scales thresholds:
+'>' thresholds are multiplied and '<' thresholds divided, so a scale below 1
+makes every rule fire earlier. Profiles can also override a rule's weight or
+scale. Compiled rule sets are cached per sensitivity.
+
+evaluate_one() walks the same compiled checks in plain Python, which is
+cheaper than NumPy for a single live session.
+
+Every evaluation updates per-rule counters (which check matched, how many
+rows were skipped by the guard) and time spent, reported by metrics().
+"""
+import operator
+import threading
+import time
+
+import numpy as np
+
+# (vectorized, scalar) comparison per operator
+OPS = {
+    '>': (np.greater, operator.gt),
+    '>=': (np.greater_equal, operator.ge),
+    '<': (np.less, operator.lt),
+    '<=': (np.less_equal, operator.le),
+}
+
+# Fallbacks when a student has no baseline (or a metric is missing from it)
+DEFAULT_BASELINE = {
+    'typing_speed_wpm': 45.0,
+    'mouse_speed_pxs': 500.0,
+    'avg_question_time_sec': 150.0,
+}
+
+SENSITIVITY_PROFILES = {
+    'low': {'threshold_scale': 1.25},
+    'medium': {'threshold_scale': 1.0},
+    'high': {'threshold_scale': 0.8},
+}
+DEFAULT_SENSITIVITY = 'medium'
+
+
+def _ratio(numerator, denominator):
+    if isinstance(numerator, (int, float)) and isinstance(denominator, (int, float)):
+        return numerator / denominator if denominator else 0.0
+    numerator = np.asarray(numerator, dtype=np.float64)
+    denominator = np.asarray(denominator, dtype=np.float64)
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator != 0)
+
+
+# Session-level signals (RiskScorer heuristics)
+SESSION_SIGNALS = {
+    'typing_deviation': lambda c: np.abs(_ratio(c['typing_wpm'] - c['baseline_wpm'], c['baseline_wpm'])),
+    'baseline_wpm': lambda c: c['baseline_wpm'],
+    'mouse_ratio': lambda c: _ratio(c['mouse_pxs'], c['baseline_mouse']),
+    'mouse_deviation': lambda c: np.abs(_ratio(c['mouse_pxs'] - c['baseline_mouse'], c['baseline_mouse'])),
+    'baseline_mouse': lambda c: c['baseline_mouse'],
+    'answer_ratio': lambda c: _ratio(c['answer_time'], c['baseline_answer_time']),
+    'baseline_answer_time': lambda c: c['baseline_answer_time'],
+    'typing_z': lambda c: c['typing_z'],
+    'mouse_z': lambda c: c['mouse_z'],
+    'answer_z': lambda c: c['answer_z'],
+    'tab_switches': lambda c: c['tab_switches'],
+    'blur_events': lambda c: c['blur_events'],
+    'blur_seconds': lambda c: c['blur_seconds'],
+}
+
+SESSION_RULES = [
+    {
+        'name': 'typing_speed',
+        'weight': 0.2,
+        'checks': [
+            # More than 3 of the user's own standard deviations away
+            ('typing_z', '>', 3.0, 0.9),
+            ('typing_deviation', '>', 1.0, 0.9),
+            ('typing_deviation', '>', 0.5, 0.6),
+            ('typing_deviation', '>', 0.3, 0.3),
+        ],
+        'default': 0.1,
+        'guard': 'baseline_wpm',
+    },
+    {
+        'name': 'tab_switch',
+        'weight': 0.3,
+        'checks': [
+            ('tab_switches', '>', 10, 1.0),
+            ('tab_switches', '>', 5, 0.8),
+            ('tab_switches', '>', 2, 0.5),
+        ],
+        'default': 0.2,
+        'guard': 'tab_switches',
+    },
+    {
+        'name': 'mouse_speed',
+        'weight': 0.15,
+        'checks': [
+            # Unusually slow mouse movement can indicate cheating
+            ('mouse_ratio', '<', 0.3, 0.7),
+            ('mouse_z', '>', 3.0, 0.7),
+            ('mouse_deviation', '>', 0.5, 0.4),
+        ],
+        'default': 0.1,
+        'guard': 'baseline_mouse',
+    },
+    {
+        'name': 'answer_speed',
+        'weight': 0.2,
+        'checks': [
+            # Too fast suggests copy-paste, too slow looking answers up
+            ('answer_ratio', '<', 0.3, 0.8),
+            ('answer_z', '>', 3.0, 0.7),
+            ('answer_ratio', '>', 3.0, 0.6),
+        ],
+        'default': 0.1,
+        'guard': 'baseline_answer_time',
+    },
+    {
+        'name': 'window_focus',
+        'weight': 0.15,
+        'checks': [
+            ('blur_seconds', '>', 120, 0.9),
+            ('blur_seconds', '>', 60, 0.6),
+            ('blur_seconds', '>', 30, 0.3),
+        ],
+        'default': 0.1,
+        'guard': 'blur_events',
+    },
+]
+
+
+class CompiledRule:
+    """One rule with thresholds resolved for a sensitivity profile"""
+
+    def __init__(self, spec, threshold_scale):
+        self.name = spec['name']
+        self.weight = float(spec.get('weight', 1.0))
+        self.guard = spec.get('guard')
+        self.checks = []
+        self.scalar_checks = []
+        self.labels = []
+        for signal, op, threshold, score in spec['checks']:
+            if op not in OPS:
+                raise ValueError(f"Unknown operator {op!r} in rule {self.name}")
+            scaled = threshold * threshold_scale if op.startswith('>') else threshold / threshold_scale
+            self.checks.append((signal, OPS[op][0], scaled))
+            self.scalar_checks.append((signal, OPS[op][1], scaled, score))
+            self.labels.append(f"{signal}{op}{scaled:g}")
+        self.labels.append('default')
+        # Index i is the score of check i; the last entry is the default
+        self.default = float(spec.get('default', 0.0))
+        self.scores = np.array([check[3] for check in spec['checks']] + [self.default])
+        self.inputs = {check[0] for check in self.checks} | ({self.guard} if self.guard else set())
+
+    def evaluate(self, signals):
+        """(component scores, hit counts per label, rows skipped by the guard)"""
+        conditions = [op(signals[signal], threshold) for signal, op, threshold in self.checks]
+        branch = np.select(conditions, np.arange(len(self.checks)), len(self.checks))
+        values = self.scores[branch]
+        skipped = 0
+        if self.guard:
+            active = signals[self.guard] > 0
+            values = np.where(active, values, 0.0)
+            skipped = int(len(active) - np.count_nonzero(active))
+            branch = branch[active]
+        hits = np.bincount(branch, minlength=len(self.scores)).tolist()
+        return values, hits, skipped
+
+    def evaluate_scalar(self, signals):
+        """(score, index of the label hit or None) for one row of float signals"""
+        if self.guard and not signals[self.guard] > 0:
+            return 0.0, None
+        for index, (signal, op, threshold, score) in enumerate(self.scalar_checks):
+            if op(signals[signal], threshold):
+                return score, index
+        return self.default, len(self.scalar_checks)
+
+
+class RuleEngine:
+    """Compiles a rule set per sensitivity profile and evaluates it over input columns"""
+
+    def __init__(self, rules, signals, profiles=None):
+        self.rules = rules
+        self.signals = dict(signals)
+        self.profiles = profiles or SENSITIVITY_PROFILES
+        self._compiled = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+        for rule in rules:
+            self._rule_stats(rule['name'])
+
+    def compile(self, sensitivity=None):
+        sensitivity = sensitivity if sensitivity in self.profiles else DEFAULT_SENSITIVITY
+        compiled = self._compiled.get(sensitivity)
+        if compiled is None:
+            profile = self.profiles.get(sensitivity, {})
+            overrides = profile.get('rules', {})
+            compiled = []
+            for spec in self.rules:
+                override = overrides.get(spec['name'], {})
+                spec = {**spec, **{k: v for k, v in override.items() if k != 'threshold_scale'}}
+                scale = override.get('threshold_scale', profile.get('threshold_scale', 1.0))
+                compiled.append(CompiledRule(spec, scale))
+            self._compiled[sensitivity] = compiled
+        return compiled
+
+    def evaluate(self, columns, sensitivity=None):
+        """
+        Score many rows at once. columns maps input names to equal-length
+        arrays. Returns (risk array, {rule name: component score array}).
+        """
+        rules = self.compile(sensitivity)
+        needed = set().union(*(rule.inputs for rule in rules))
+        signals = {name: np.asarray(self.signals[name](columns), dtype=np.float64) for name in needed}
+
+        rows = len(next(iter(signals.values()))) if signals else 0
+        total = np.zeros(rows)
+        components = {}
+        timings = []
+        for rule in rules:
+            start = time.perf_counter()
+            values, hits, skipped = rule.evaluate(signals)
+            total += rule.weight * values
+            components[rule.name] = values
+            timings.append((rule, hits, skipped, time.perf_counter() - start))
+
+        with self._lock:
+            for rule, hits, skipped, elapsed in timings:
+                stats = self._rule_stats(rule.name)
+                stats['evaluated'] += rows
+                stats['skipped'] += skipped
+                stats['time_s'] += elapsed
+                for label, count in zip(rule.labels, hits):
+                    if count:
+                        stats['hits'][label] = stats['hits'].get(label, 0) + count
+
+        return np.clip(total, 0.0, 1.0), components
+
+    def evaluate_one(self, inputs, sensitivity=None):
+        """
+        (risk, {rule name: component score}) for a single row of scalar inputs.
+        Same rules as evaluate(), walked in plain Python: for one row that is
+        far cheaper than building arrays.
+        """
+        rules = self.compile(sensitivity)
+        signals = {}
+        risk = 0.0
+        components = {}
+        timings = []
+        for rule in rules:
+            start = time.perf_counter()
+            for name in rule.inputs:
+                if name not in signals:
+                    signals[name] = float(self.signals[name](inputs))
+            value, hit = rule.evaluate_scalar(signals)
+            risk += rule.weight * value
+            components[rule.name] = value
+            timings.append((rule, hit, time.perf_counter() - start))
+
+        with self._lock:
+            for rule, hit, elapsed in timings:
+                stats = self._rule_stats(rule.name)
+                stats['evaluated'] += 1
+                stats['time_s'] += elapsed
+                if hit is None:
+                    stats['skipped'] += 1
+                else:
+                    label = rule.labels[hit]
+                    stats['hits'][label] = stats['hits'].get(label, 0) + 1
+
+        return max(0.0, min(1.0, risk)), components
+
+    def _rule_stats(self, name):
+        stats = self._stats.get(name)
+        if stats is None:
+            stats = self._stats[name] = {'evaluated': 0, 'skipped': 0, 'time_s': 0.0, 'hits': {}}
+        return stats
+
+    def metrics(self):
+        with self._lock:
+            return {
+                name: {
+                    'evaluated': stats['evaluated'],
+                    'skipped': stats['skipped'],
+                    'time_us': round(stats['time_s'] * 1e6, 1),
+                    'hits': dict(stats['hits'])
+                }
+                for name, stats in self._stats.items()
+            }
+
+
+def session_inputs(current_behavior, baseline, summary):
+    """One row of session rule inputs from live behavior, a Baseline and an event summary"""
+    current_behavior = current_behavior or {}
+    baseline_wpm = (baseline.typing_speed_wpm if baseline else None) or DEFAULT_BASELINE['typing_speed_wpm']
+    baseline_mouse = (baseline.mouse_speed_pxs if baseline else None) or DEFAULT_BASELINE['mouse_speed_pxs']
+    baseline_answer_time = (
+        (baseline.avg_question_time_sec if baseline else None) or DEFAULT_BASELINE['avg_question_time_sec']
+    )
+    z_score = getattr(baseline, 'metric_z_score', None)
+
+    def z(column):
+        # 0 when the metric was not measured or the user's spread is still unknown
+        if not z_score or column not in current_behavior:
+            return 0.0
+        return z_score(column, current_behavior[column]) or 0.0
+
+    return {
+        'typing_z': z('typing_speed_wpm'),
+        'mouse_z': z('mouse_speed_pxs'),
+        'answer_z': z('avg_question_time_sec'),
+        'typing_wpm': current_behavior.get('typing_speed_wpm', baseline_wpm),
+        'baseline_wpm': baseline_wpm,
+        'mouse_pxs': current_behavior.get('mouse_speed_pxs', baseline_mouse),
+        'baseline_mouse': baseline_mouse,
+        'answer_time': current_behavior.get('avg_question_time_sec', baseline_answer_time),
+        'baseline_answer_time': baseline_answer_time,
+        'tab_switches': summary['by_type'].get('tab_switch', 0),
+        'blur_events': summary['by_type'].get('window_blur', 0),
+        'blur_seconds': summary['blur_seconds'],
+    }
+
+
+def to_columns(rows):
+    """Input rows (dicts with the same keys) as NumPy columns"""
+    if not rows:
+        return {}
+    return {name: np.asarray([row[name] for row in rows], dtype=np.float64) for name in rows[0]}
+
+
+# Global instances
+session_rules = RuleEngine(SESSION_RULES, SESSION_SIGNALS)
+
+
+def metrics():
+    return {'session': session_rules.metrics()}
@@ -0,0 +1,81 @@
+# app/services/session_lifecycle.py
+"""
+Bulk exam session lifecycle operations for proctors.
+
+- provision_sessions: create in-progress sessions for a whole roster with one
+  existence query and one multi-row INSERT
+- close_exam_sessions: force-submit every in-progress session of an exam,
+  scored as one batch by services/submission.py
+
+Both run inside the caller's transaction; the caller commits.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, insert
+
+from app import db
+from app.models import Exam, ExamSession
+from app.services import analytics_rollup, submission
+
+
+def provision_sessions(exam_id, user_ids, now=None):
+    """
+    Pre-create in-progress sessions for every user in the roster that does not
+    already have one. Returns (created_count, existing_count).
+    """
+    now = now or datetime.utcnow()
+    user_ids = list(dict.fromkeys(user_ids))
+    if not user_ids:
+        return 0, 0
+
+    existing = set(db.session.scalars(
+        select(ExamSession.user_id).where(
+            ExamSession.exam_id == exam_id,
+            ExamSession.status == 'in_progress',
+            ExamSession.user_id.in_(user_ids)
+        )
+    ))
+
+    rows = [
+        {
+            'exam_id': exam_id,
+            'user_id': user_id,
+            'started_at': now,
+            'status': 'in_progress',
+            'risk_score': 0.0,
+            'integrity_score': 1.0,
+            'flagged_incidents_count': 0
+        }
+        for user_id in user_ids if user_id not in existing
+    ]
+    if rows:
+        db.session.execute(insert(ExamSession), rows)
+        analytics_rollup.record_session_started(exam_id, now, count=len(rows))
+
+    return len(rows), len(existing)
+
+
+def close_exam_sessions(exam_id, now=None):
+    """
+    Force-submit all in-progress sessions of an exam and score them in one batch.
+    Returns the list of closed session dicts ({id, user_id, risk_score, integrity_score, score}).
+    """
+    now = now or datetime.utcnow()
+    exam = db.session.get(Exam, exam_id)
+    max_seconds = exam.duration_minutes * 60 if exam and exam.duration_minutes else None
+
+    open_sessions = db.session.execute(
+        select(
+            ExamSession.id, ExamSession.user_id, ExamSession.started_at,
+            ExamSession.answers, ExamSession.feature_vector
+        ).where(
+            ExamSession.exam_id == exam_id,
+            ExamSession.status == 'in_progress'
+        )
+    ).all()
+
+    closed = submission.finalize_sessions(exam_id, open_sessions, max_seconds=max_seconds, now=now)
+    if exam and closed:
+        exam.status = 'completed'
+
+    return closed
@@ -0,0 +1,324 @@
+# app/services/similarity_index.py
+"""
+Per-exam similarity index over session behavior, for collusion detection.
+
+Students who work together tend to look alike: similar feature vectors
+(40 extractor features) and correlated answer timing (same questions fast,
+same questions slow). Comparing every pair of an exam is O(N^2). Instead,
+each exam keeps two SimilaritySpaces, 'features' and 'timing', indexed with
+random-hyperplane LSH (SimHash):
+
+- vectors are mapped to unit length, so cosine similarity is a dot product.
+  Features are standardized with the exam's running mean and standard
+  deviation first. Timing sequences are cut or padded to the exam's question
+  count and z-normalized per session, so their cosine is the Pearson
+  correlation.
+- LSH_TABLES tables of hyperplane-sign signatures put each session in one
+  bucket per table. The signature length grows with log2 of the exam size,
+  so a bucket holds about TARGET_BUCKET sessions. Sessions with cosine s share a given table's bucket with
+  probability (1 - acos(s)/pi)^bits, so very similar pairs almost always meet
+  in some table while dissimilar ones rarely do.
+- a query checks only pairs that share a bucket (exact cosine, vectorized),
+  not all N^2, found by sorting each table's keys (no per-bucket Python
+  loops). A member of a bucket is compared with at most MAX_BUCKET - 1 of the
+  others, so degenerate data cannot make it quadratic.
+
+Sessions are added as they are scored (/score-session, submit_exam), once
+the scoring transaction commits, so a rollback leaves no vectors behind. The
+feature standardization is refreshed, and the tables rebuilt, whenever the
+exam's session count doubles, which keeps the amortized cost per insert
+O(1). Exams below EXACT_MAX sessions are compared exactly.
+
+The index is per process. The first use for an exam rebuilds it from the
+vectors stored on its sessions (ExamSession.feature_vector / answer_timings).
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from sqlalchemy import select
+
+from app import db
+from app.models import ExamSession
+from app.services.answer_key import answer_keys
+from app.services.commit_hooks import on_commit, stage
+
+LSH_TABLES = int(os.getenv('SIMILARITY_LSH_TABLES', 12))
+# Bits per signature grow with the exam (log2(N / TARGET_BUCKET)), so buckets
+# stay about TARGET_BUCKET sessions and the pairs checked grow linearly
+TARGET_BUCKET = 2
+MIN_BITS, MAX_BITS = 6, 20
+MAX_BUCKET = 64
+EXACT_MAX = 256
+MAX_TRACKED_EXAMS = int(os.getenv('SIMILARITY_MAX_EXAMS', 200))
+
+FEATURES = 'features'
+TIMING = 'timing'
+KINDS = (FEATURES, TIMING)
+
+
+def pack_timings(times):
+    """Answer times (seconds per question) as little-endian float32 bytes"""
+    return np.asarray(times, dtype='<f4').tobytes()
+
+
+def unpack_vector(blob):
+    return np.frombuffer(blob, dtype='<f4') if blob else None
+
+
+class SimHashTables:
+    """`tables` tables of `bits`-bit random-hyperplane signatures"""
+
+    def __init__(self, dim, bits, tables=LSH_TABLES, seed=0):
+        rng = np.random.default_rng(seed)
+        self.planes = rng.standard_normal((dim, tables * bits)).astype(np.float32)
+        self.tables, self.bits = tables, bits
+        self.weights = (1 << np.arange(bits)).astype(np.int64)
+        self.rows = []  # arrays of row numbers
+        self.keys = []  # arrays of (n, tables) bucket keys
+
+    def signatures(self, units):
+        """(n, tables) bucket keys for unit row vectors"""
+        signs = (np.atleast_2d(units) @ self.planes > 0).reshape(-1, self.tables, self.bits)
+        return signs @ self.weights
+
+    def add(self, rows, units):
+        self.rows.append(np.asarray(rows, dtype=np.int64))
+        self.keys.append(self.signatures(units))
+
+    def candidate_pairs(self, n_rows):
+        """(rows_a, rows_b) arrays of the distinct pairs that share a bucket"""
+        if len(self.rows) > 1:
+            self.rows, self.keys = [np.concatenate(self.rows)], [np.concatenate(self.keys)]
+        if not self.rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        rows, keys = self.rows[0], self.keys[0]
+
+        pairs = []
+        for table in range(self.tables):
+            order = np.argsort(keys[:, table], kind='stable')
+            sorted_keys, sorted_rows = keys[order, table], rows[order]
+            # Members of a bucket are adjacent once sorted: pair each with the
+            # next 1, 2, ... members while the key still matches
+            for offset in range(1, MAX_BUCKET):
+                same = sorted_keys[offset:] == sorted_keys[:-offset]
+                if not same.any():
+                    break
+                a, b = sorted_rows[:-offset][same], sorted_rows[offset:][same]
+                pairs.append(np.minimum(a, b) * n_rows + np.maximum(a, b))  # one int64 per pair
+        if not pairs:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+        pairs = np.unique(np.concatenate(pairs))
+        return pairs // n_rows, pairs % n_rows
+
+
+class SimilaritySpace:
+    """The sessions of one exam in one vector space ('features' or 'timing')"""
+
+    def __init__(self, kind, seed=0, dim=None):
+        self.kind = kind
+        self.seed = seed
+        self.session_ids = []  # row -> session id
+        self.user_ids = []
+        self.raw = []  # row -> float32 vector
+        self.live = []  # row -> False once the session was re-added
+        self.row_of = {}  # session id -> current row
+        self.dim = dim  # None: set by the first vector added
+        self.units = None  # (rows, dim) unit vectors, as of the last build
+        self.pending = []  # unit vectors added to the LSH tables since
+        self.built_rows = 0
+        self.lsh = None
+        self.center = None
+        self.scale = None
+
+    def __len__(self):
+        return len(self.row_of)
+
+    def add(self, session_id, user_id, vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        if self.dim is None:
+            self.dim = len(vector)
+        if self.kind == TIMING:
+            vector = self._fit_length(vector)
+        if len(vector) != self.dim:
+            return False
+
+        old = self.row_of.get(session_id)
+        if old is not None:
+            self.live[old] = False
+        row = len(self.raw)
+        self.session_ids.append(session_id)
+        self.user_ids.append(user_id)
+        self.raw.append(vector)
+        self.live.append(True)
+        self.row_of[session_id] = row
+
+        if len(self.raw) >= 2 * max(self.built_rows, EXACT_MAX // 2):
+            self._build()
+        elif self.lsh is not None:
+            unit = self._unit(vector[None, :])
+            self.pending.append(unit)
+            self.lsh.add([row], unit)
+        return True
+
+    def _fit_length(self, times):
+        """Truncate or pad (with the session's mean time) to the exam's sequence length"""
+        if len(times) >= self.dim:
+            return times[:self.dim]
+        fill = np.nanmean(times) if len(times) else 0.0
+        return np.concatenate([times, np.full(self.dim - len(times), fill, dtype=np.float32)])
+
+    def _unit(self, matrix):
+        matrix = np.asarray(matrix, dtype=np.float64)
+        if self.kind == TIMING:
+            # z-normalize each sequence: cosine then equals the Pearson correlation
+            centered = matrix - np.nanmean(matrix, axis=1, keepdims=True)
+        else:
+            centered = (matrix - self.center) / self.scale
+        centered = np.nan_to_num(centered)
+        norms = np.linalg.norm(centered, axis=1, keepdims=True)
+        return (centered / np.where(norms > 0, norms, 1.0)).astype(np.float32)
+
+    def _refresh_scale(self, matrix):
+        with np.errstate(invalid='ignore'):
+            self.center = np.nanmean(matrix, axis=0)
+            scale = np.nanstd(matrix, axis=0)
+        self.center = np.nan_to_num(self.center)
+        self.scale = np.where(np.isfinite(scale) & (scale > 0), scale, 1.0)
+
+    def _build(self):
+        """Re-standardize and (past EXACT_MAX sessions) rebuild the LSH tables"""
+        matrix = np.vstack(self.raw)
+        if self.kind == FEATURES:
+            self._refresh_scale(matrix)
+        self.units = self._unit(matrix)
+        self.pending = []
+        self.built_rows = len(self.raw)
+        if self.built_rows >= EXACT_MAX:
+            bits = int(np.clip(np.round(np.log2(self.built_rows / TARGET_BUCKET)), MIN_BITS, MAX_BITS))
+            self.lsh = SimHashTables(self.dim, bits, seed=self.seed)
+            live_rows = np.flatnonzero(self.live)
+            self.lsh.add(live_rows, self.units[live_rows])
+
+    def top_pairs(self, k=20, min_similarity=0.0):
+        """The k most similar live pairs, plus how many pairs were compared"""
+        if len(self.raw) < 2:
+            return [], 0
+        if self.pending:
+            self.units = np.vstack([self.units] + self.pending)
+            self.pending = []
+        if self.units is None or len(self.units) < len(self.raw):
+            self._build()
+        live = np.asarray(self.live)
+        if self.lsh is None:
+            rows = np.flatnonzero(live)
+            a, b = np.triu_indices(len(rows), k=1)
+            a, b = rows[a], rows[b]
+        else:
+            a, b = self.lsh.candidate_pairs(len(self.raw))
+            keep = live[a] & live[b]
+            a, b = a[keep], b[keep]
+
+        similarity = np.einsum('ij,ij->i', self.units[a], self.units[b])
+        keep = similarity >= min_similarity
+        a, b, similarity = a[keep], b[keep], similarity[keep]
+        order = np.argsort(-similarity)[:k]
+        pairs = [
+            {
+                'session_a': self.session_ids[i], 'user_a': self.user_ids[i],
+                'session_b': self.session_ids[j], 'user_b': self.user_ids[j],
+                'similarity': round(float(s), 4)
+            }
+            for i, j, s in zip(a[order], b[order], similarity[order])
+        ]
+        return pairs, len(keep)
+
+
+class SimilarityIndex:
+    def __init__(self, max_exams=MAX_TRACKED_EXAMS):
+        self.max_exams = max_exams
+        self._exams = OrderedDict()  # {exam_id: {kind: SimilaritySpace}}
+        self._lock = threading.Lock()
+        self._counters = {'added': 0, 'queries': 0, 'pairs_compared': 0, 'pairs_possible': 0}
+
+    def _spaces(self, exam_id):
+        """The exam's spaces, rebuilt from stored session vectors on first use"""
+        with self._lock:
+            spaces = self._exams.get(exam_id)
+            if spaces is not None:
+                self._exams.move_to_end(exam_id)
+                return spaces
+
+        rows = db.session.execute(
+            select(ExamSession.id, ExamSession.user_id, ExamSession.feature_vector, ExamSession.answer_timings)
+            .where(ExamSession.exam_id == exam_id)
+            .where((ExamSession.feature_vector.isnot(None)) | (ExamSession.answer_timings.isnot(None)))
+            .order_by(ExamSession.id)
+        ).all()
+        # Timing sequences are one time per question, whatever the first session sent
+        answer_key = answer_keys.get(exam_id)
+        n_questions = answer_key.n_questions if answer_key else 0
+        spaces = {
+            FEATURES: SimilaritySpace(FEATURES, seed=exam_id),
+            TIMING: SimilaritySpace(TIMING, seed=exam_id, dim=n_questions or None),
+        }
+        for session_id, user_id, features, timings in rows:
+            if features:
+                spaces[FEATURES].add(session_id, user_id, unpack_vector(features))
+            if timings:
+                spaces[TIMING].add(session_id, user_id, unpack_vector(timings))
+
+        with self._lock:
+            existing = self._exams.get(exam_id)
+            if existing is not None:
+                return existing
+            self._exams[exam_id] = spaces
+            while len(self._exams) > self.max_exams:
+                self._exams.popitem(last=False)
+        return spaces
+
+    def add(self, session, features=None, timings=None):
+        """Index a scored session's feature vector and/or answer times, once the transaction commits"""
+        stage('similarity_rows', (session.exam_id, session.id, session.user_id, features, timings))
+
+    def add_committed(self, rows):
+        """
+        Add committed sessions to the exams loaded in this process. Other exams
+        load them with the rest of their stored vectors on first use.
+        """
+        with self._lock:
+            for exam_id, session_id, user_id, features, timings in rows:
+                spaces = self._exams.get(exam_id)
+                if spaces is None:
+                    continue
+                if features is not None:
+                    spaces[FEATURES].add(session_id, user_id, features)
+                if timings is not None and len(timings):
+                    spaces[TIMING].add(session_id, user_id, timings)
+                self._counters['added'] += 1
+
+    def similar_pairs(self, exam_id, kind=FEATURES, k=20, min_similarity=0.0):
+        spaces = self._spaces(exam_id)
+        with self._lock:
+            space = spaces[kind]
+            pairs, compared = space.top_pairs(k, min_similarity)
+            n = len(space)
+            self._counters['queries'] += 1
+            self._counters['pairs_compared'] += compared
+            self._counters['pairs_possible'] += n * (n - 1) // 2
+        return {'kind': kind, 'sessions': n, 'pairs_compared': compared, 'pairs': pairs}
+
+    def forget(self, exam_id):
+        with self._lock:
+            self._exams.pop(exam_id, None)
+
+    def metrics(self):
+        with self._lock:
+            return {**self._counters, 'tracked_exams': len(self._exams)}
+
+
+# Global instance
+similarity_index = SimilarityIndex()
+on_commit('similarity_rows', similarity_index.add_committed)
+
@@ -0,0 +1,221 @@
+# app/services/submission.py
+"""
+Exam submission service shared by the REST endpoint, the socket handler and
+the proctor bulk close.
+
+Final risk comes from the same RiskScorer used on the live path, with the
+exam's cached scoring policy (rule profile, allowed event types). The event history it needs is
+reduced to per-session summaries (counts by type and severity, total blur
+time) with one grouped aggregate, so a single submission costs one query and
+a batch of N sessions still costs one query; the batch is then scored in one
+vectorized call.
+
+Submitted sessions that were scored by the anomaly model are offered to
+the production retraining reservoir (model_retrainer.py) once they commit.
+
+Answers are graded against the exam's cached, compiled answer key
+(answer_key.py); a batch is graded as one matrix.
+
+Functions add to the caller's transaction; the caller commits.
+"""
+from datetime import datetime
+
+from sqlalchemy import select, update, insert, func, bindparam
+
+from app import db
+from app.models import ExamSession, Event, Alert, Baseline
+from app.services import analytics_rollup
+from app.services.answer_key import answer_keys
+from app.services.exam_policy import policy_cache
+from app.services.model_retrainer import model_retrainer
+from app.services.risk_scorer import risk_scorer, empty_event_summary
+
+HIGH_RISK_THRESHOLD = 0.7
+
+BEHAVIOR_METRICS = ('typing_speed_wpm', 'mouse_speed_pxs', 'avg_question_time_sec')
+
+
+def event_summaries(session_ids):
+    """{session_id: event summary} for many sessions from one grouped aggregate"""
+    summaries = {session_id: empty_event_summary() for session_id in session_ids}
+    if not summaries:
+        return summaries
+
+    rows = db.session.execute(
+        select(
+            Event.session_id,
+            Event.event_type,
+            Event.severity,
+            func.count(Event.id),
+            func.coalesce(func.sum(Event.duration), 0.0)
+        ).where(Event.session_id.in_(list(summaries)))
+        .group_by(Event.session_id, Event.event_type, Event.severity)
+    )
+    for session_id, event_type, severity, count, duration in rows:
+        summary = summaries[session_id]
+        summary['total'] += count
+        summary['by_type'][event_type] = summary['by_type'].get(event_type, 0) + count
+        summary['by_severity'][severity] = summary['by_severity'].get(severity, 0) + count
+        if event_type == 'window_blur':
+            summary['blur_seconds'] += float(duration)
+    return summaries
+
+
+def baselines_for(user_ids):
+    """{user_id: Baseline} in one query"""
+    if not user_ids:
+        return {}
+    baselines = Baseline.query.filter(Baseline.user_id.in_(set(user_ids))).all()
+    return {baseline.user_id: baseline for baseline in baselines}
+
+
+def final_risk(summary, baseline, current_behavior=None, model_risk=None, sensitivity=None):
+    """
+    Final risk for one session. When a behavioral model score is available the
+    higher of the two wins, so neither signal can mask the other.
+    """
+    risk = risk_scorer.calculate_risk_score(current_behavior or {}, baseline, summary, sensitivity)
+    if model_risk is not None:
+        risk = max(risk, float(model_risk))
+    return max(0.0, min(1.0, risk))
+
+
+def _alert_row(session_id, risk_score, now):
+    return {
+        'session_id': session_id,
+        'alert_type': 'submission_risk',
+        'message': f"High risk at submission (risk={risk_score:.2f})",
+        'risk_score': risk_score,
+        'severity': 'high',
+        'resolved': False,
+        'created_at': now
+    }
+
+
+def finalize_submission(session, answers=None, time_taken_seconds=None,
+                        current_behavior=None, model_risk=None, now=None):
+    """
+    Submit one in-progress session and compute its final scores.
+    Returns {'risk_score', 'integrity_score', 'alert'} where alert is the
+    created Alert or None.
+    """
+    now = now or datetime.utcnow()
+    policy = policy_cache.get(session.exam_id)
+    summary = policy.filter_summary(event_summaries([session.id])[session.id])
+    baseline = Baseline.query.filter_by(user_id=session.user_id).first()
+
+    session.submitted_at = now
+    session.time_taken_seconds = time_taken_seconds
+    session.answers = answers if answers is not None else {}
+    session.status = 'submitted'
+
+    answer_key = answer_keys.get(session.exam_id)
+    session.score = answer_key.grade(session.answers) if answer_key else None
+
+    risk = final_risk(summary, baseline, current_behavior, model_risk, policy.sensitivity)
+    session.risk_score = risk
+    session.integrity_score = 1.0 - risk
+
+    alert = None
+    if risk >= HIGH_RISK_THRESHOLD:
+        alert = Alert(**_alert_row(session.id, risk, now))
+        db.session.add(alert)
+        analytics_rollup.record_alert(session.exam_id, now)
+
+    analytics_rollup.record_submission(session.exam_id, risk, now)
+    model_retrainer.record(session.feature_vector, risk)
+    return {'risk_score': risk, 'integrity_score': 1.0 - risk, 'alert': alert}
+
+
+def finalize_sessions(exam_id, sessions, max_seconds=None, now=None):
+    """
+    Submit and score a batch of in-progress sessions of one exam.
+
+    sessions: rows with .id, .user_id, .started_at, .answers (as saved so far)
+    and optionally .feature_vector
+    Returns a list of {id, user_id, risk_score, integrity_score, score} for the
+    sessions this call submitted (sessions no longer in progress are skipped).
+    """
+    now = now or datetime.utcnow()
+    if not sessions:
+        return []
+
+    # Claim the sessions first. The status guard skips sessions a student
+    # submitted between the caller's select and now; only the claimed ones
+    # are scored, alerted on and counted below
+    sessions_table = ExamSession.__table__
+    claimed = set(db.session.execute(
+        update(sessions_table)
+        .where(sessions_table.c.id.in_([row.id for row in sessions]), sessions_table.c.status == 'in_progress')
+        .values(status='submitted', submitted_at=now)
+        .returning(sessions_table.c.id)
+    ).scalars())
+    sessions = [row for row in sessions if row.id in claimed]
+    if not sessions:
+        return []
+
+    summaries = event_summaries([row.id for row in sessions])
+    baselines = baselines_for([row.user_id for row in sessions])
+    policy = policy_cache.get(exam_id)
+
+    # All sessions share the exam's policy, so score them as one batch
+    risks = risk_scorer.calculate_risk_scores(
+        [None] * len(sessions),
+        [baselines.get(row.user_id) for row in sessions],
+        [policy.filter_summary(summaries[row.id]) for row in sessions],
+        policy.sensitivity
+    )
+    answer_key = answer_keys.get(exam_id)
+    scores = answer_key.grade_many([row.answers for row in sessions]) if answer_key else [None] * len(sessions)
+
+    params = []
+    results = []
+    alert_rows = []
+    for row, risk, score in zip(sessions, risks, scores):
+        elapsed = int((now - row.started_at).total_seconds()) if row.started_at else None
+        if elapsed is not None and max_seconds:
+            elapsed = min(elapsed, max_seconds)
+
+        params.append({
+            'b_id': row.id,
+            'time_taken_seconds': elapsed,
+            'integrity_score': 1.0 - risk,
+            'risk_score': risk,
+            'score': score
+        })
+        results.append({
+            'id': row.id,
+            'user_id': row.user_id,
+            'risk_score': risk,
+            'integrity_score': 1.0 - risk,
+            'score': score
+        })
+        if risk >= HIGH_RISK_THRESHOLD:
+            alert_rows.append(_alert_row(row.id, risk, now))
+        model_retrainer.record(getattr(row, 'feature_vector', None), risk)
+
+    # One statement, executed for every claimed session
+    db.session.execute(
+        update(sessions_table)
+        .where(sessions_table.c.id == bindparam('b_id'))
+        .values(
+            time_taken_seconds=bindparam('time_taken_seconds'),
+            integrity_score=bindparam('integrity_score'),
+            risk_score=bindparam('risk_score'),
+            score=bindparam('score')
+        ),
+        params
+    )
+
+    if alert_rows:
+        db.session.execute(insert(Alert), alert_rows)
+        analytics_rollup.record_alert(exam_id, now, count=len(alert_rows))
+    analytics_rollup.record_submissions(exam_id, [result['risk_score'] for result in results], now)
+
+    return results
+
+
+def behavior_from_payload(data):
+    """Current behavior metrics present in a submission / event payload"""
+    data = data or {}
+    return {metric: data[metric] for metric in BEHAVIOR_METRICS if data.get(metric) is not None}
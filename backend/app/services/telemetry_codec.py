@@ -0,0 +1,191 @@
+# app/services/telemetry_codec.py
+"""
+Compact binary encoding for behavioral telemetry (session_data).
+
+The JSON form sends every mouse / keystroke sample as a float literal. The
+binary form ("EPT1") stores each numeric array as a typed array and each
+timestamp series as int32 millisecond deltas from its first timestamp,
+optionally zlib-compressed:
+
+    magic "EPT1" | version u8 | flags u8 (bit 0: zlib) | reserved u16 | body
+    body: meta_len u32 | meta JSON | arrays (each starting on an 8-byte boundary)
+
+meta = {"scalars": {path: value}, "arrays": [[path, dtype, length, offset(, base)], ...]}
+with dtypes f4, f8, i4, u1 or dms (delta milliseconds, decoded to seconds).
+A dms entry ends with base, the series' first timestamp in milliseconds, so
+epoch timestamps do not overflow int32.
+Series whose deltas still do not fit int32, and integer arrays outside the
+int32 range, are stored as f8 instead.
+
+Arrays are read with np.frombuffer straight from the (decompressed) body, so
+decoding does not copy or parse sample data; only dms series need a cumsum.
+"""
+import json
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b'EPT1'
+VERSION = 1
+FLAG_ZLIB = 0x01
+HEADER = struct.Struct('<4sBBH')
+META_LEN = struct.Struct('<I')
+
+CONTENT_TYPE = 'application/vnd.exampulse.telemetry'
+FORMATS = ('ept1', 'json')
+COMPRESSIONS = ('zlib', 'none')
+
+# Decompressed bodies larger than this are rejected (zip bomb guard)
+MAX_BODY_BYTES = 32 * 1024 * 1024
+
+DTYPES = {
+    'f4': np.dtype('<f4'),
+    'f8': np.dtype('<f8'),
+    'i4': np.dtype('<i4'),
+    'u1': np.dtype('u1'),
+    'dms': np.dtype('<i4'),
+}
+
+# Monotonic timestamp series (seconds) stored as millisecond deltas
+DELTA_FIELDS = {'mouse.timestamps', 'keyboard.timestamps', 'tabs.switch_times'}
+
+I4 = np.iinfo(np.int32)
+
+
+class TelemetryDecodeError(ValueError):
+    pass
+
+
+def negotiate(offered_formats=None, offered_compressions=None):
+    """Pick the first client-offered format / compression this server supports"""
+    telemetry_format = next((f for f in (offered_formats or []) if f in FORMATS), 'json')
+    compression = next((c for c in (offered_compressions or []) if c in COMPRESSIONS), 'none')
+    if telemetry_format == 'json':
+        compression = 'none'
+    return {'format': telemetry_format, 'compression': compression}
+
+
+def is_encoded(payload):
+    return isinstance(payload, (bytes, bytearray, memoryview)) and bytes(payload[:4]) == MAGIC
+
+
+def _fits_i4(values):
+    return values.size == 0 or (values.min() >= I4.min and values.max() <= I4.max)
+
+
+def _pack_array(path, values):
+    """(dtype, typed data, base) for one array; base is set for dms series only"""
+    if path in DELTA_FIELDS:
+        seconds = values.astype(np.float64)
+        if np.isfinite(seconds).all():
+            millis = np.rint(seconds * 1000.0).astype(np.int64)
+            base = int(millis[0]) if millis.size else 0
+            deltas = np.diff(millis, prepend=base)
+            if _fits_i4(deltas):
+                return 'dms', deltas.astype(DTYPES['dms']), base
+        return 'f8', seconds.astype(DTYPES['f8']), None
+    if values.dtype.kind in 'iub':
+        if values.size == 0 or (values.min() >= 0 and values.max() <= 255):
+            return 'u1', values.astype(DTYPES['u1']), None
+        if _fits_i4(values):
+            return 'i4', values.astype(DTYPES['i4']), None
+        return 'f8', values.astype(DTYPES['f8']), None
+    return 'f4', values.astype(DTYPES['f4']), None
+
+
+def encode_session_data(session_data, compress=True):
+    """Encode a session_data dict (lists or arrays of numbers, scalars) as EPT1 bytes"""
+    scalars = {}
+    arrays = []
+
+    def walk(prefix, value):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                walk(f"{prefix}.{key}" if prefix else key, item)
+        elif isinstance(value, (list, tuple, np.ndarray)):
+            arrays.append((prefix, np.asarray(value)))
+        else:
+            scalars[prefix] = value.item() if isinstance(value, np.generic) else value
+
+    walk('', session_data)
+
+    directory = []
+    chunks = []
+    offset = 0
+    for path, values in arrays:
+        dtype, data, base = _pack_array(path, values)
+        raw = data.tobytes()
+        entry = [path, dtype, int(data.size), offset]
+        directory.append(entry if base is None else entry + [base])
+        padding = -len(raw) % 8
+        chunks.append(raw + b'\0' * padding)
+        offset += len(raw) + padding
+
+    meta = json.dumps({'scalars': scalars, 'arrays': directory}, separators=(',', ':')).encode()
+    meta += b' ' * (-(META_LEN.size + len(meta)) % 8)  # arrays start 8-byte aligned
+    body = META_LEN.pack(len(meta)) + meta + b''.join(chunks)
+
+    flags = 0
+    if compress:
+        body = zlib.compress(body, 6)
+        flags |= FLAG_ZLIB
+    return HEADER.pack(MAGIC, VERSION, flags, 0) + body
+
+
+def _decompress(data):
+    decompressor = zlib.decompressobj()
+    body = decompressor.decompress(data, MAX_BODY_BYTES)
+    if decompressor.unconsumed_tail:
+        raise TelemetryDecodeError('decoded telemetry exceeds size limit')
+    return body
+
+
+def decode_session_data(payload):
+    """Decode EPT1 bytes into a session_data dict whose arrays are NumPy arrays"""
+    payload = memoryview(payload)
+    if len(payload) < HEADER.size:
+        raise TelemetryDecodeError('telemetry payload too short')
+    magic, version, flags, _ = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise TelemetryDecodeError('not an EPT1 telemetry payload')
+
+    try:
+        body = payload[HEADER.size:]
+        if flags & FLAG_ZLIB:
+            body = memoryview(_decompress(body))
+        if len(body) > MAX_BODY_BYTES:
+            raise TelemetryDecodeError('decoded telemetry exceeds size limit')
+
+        (meta_len,) = META_LEN.unpack_from(body)
+        meta = json.loads(bytes(body[META_LEN.size:META_LEN.size + meta_len]))
+        arrays_start = META_LEN.size + meta_len
+
+        session_data = {}
+        for path, value in meta.get('scalars', {}).items():
+            _assign(session_data, path, value)
+        for entry in meta.get('arrays', []):
+            path, dtype, length, offset = entry[:4]
+            values = np.frombuffer(body, dtype=DTYPES[dtype], count=length, offset=arrays_start + offset)
+            if dtype == 'dms':
+                values = (np.cumsum(values, dtype=np.int64) + int(entry[4])) / 1000.0
+            _assign(session_data, path, values)
+        return session_data
+    except TelemetryDecodeError:
+        raise
+    except (KeyError, IndexError, TypeError, ValueError, struct.error, zlib.error) as e:
+        raise TelemetryDecodeError(f'malformed telemetry payload: {e}')
+
+
+def _assign(target, path, value):
+    keys = path.split('.')
+    for key in keys[:-1]:
+        target = target.setdefault(key, {})
+    target[keys[-1]] = value
+
+
+def load_session_data(value):
+    """session_data from either its JSON form or EPT1 bytes"""
+    if is_encoded(value):
+        return decode_session_data(value)
+    return value
@@ -0,0 +1,221 @@
+# app/sockets/broadcaster.py
+"""
+Proctor fan-out layer
+
+Student activity is not emitted to proctors one event at a time. Updates are
+merged per exam (latest state per session) and flushed every
+BROADCAST_INTERVAL_MS as one `student_activity_batch` per proctor, carrying
+only the sessions that changed since that proctor's last batch.
+
+- Priority events (`high_risk_alert`) bypass coalescing and go out immediately
+- Backpressure: each proctor may have at most BROADCAST_MAX_UNACKED batches
+  awaiting an ack; while at the limit its changes keep merging into its own
+  outbox instead of queueing more messages. Unacked batches expire after
+  BROADCAST_ACK_TIMEOUT_S so a client that never acks still gets updates.
+- Metrics: events published, batches sent, and messages saved versus one
+  emit per event per proctor
+"""
+import os
+import threading
+import time
+from datetime import datetime
+
+from app import socketio
+
+
+def proctor_room(exam_id):
+    """Room holding the proctor sockets of an exam"""
+    return f"exam_{exam_id}_proctors"
+
+
+class _Subscriber:
+    __slots__ = ('sid', 'exam_id', 'exam_key', 'outbox', 'in_flight', 'seq')
+
+    def __init__(self, sid, exam_id):
+        self.sid = sid
+        self.exam_id = exam_id
+        self.exam_key = exam_key(exam_id)
+        self.outbox = {}     # {session_id: merged update}
+        self.in_flight = {}  # {batch seq: sent_at}
+        self.seq = 0
+
+
+class ProctorBroadcaster:
+    def __init__(self, interval_ms=None, max_unacked=None, ack_timeout_s=None):
+        self.interval = (interval_ms or int(os.getenv('BROADCAST_INTERVAL_MS', 250))) / 1000.0
+        self.max_unacked = max_unacked or int(os.getenv('BROADCAST_MAX_UNACKED', 3))
+        self.ack_timeout = ack_timeout_s or float(os.getenv('BROADCAST_ACK_TIMEOUT_S', 5))
+
+        self._lock = threading.Lock()
+        self._pending = {}      # {exam key: {session_id: merged update}}
+        self._subscribers = {}  # {sid: _Subscriber}
+        self._flusher_started = False
+        self._counters = {
+            'events_published': 0,
+            'fanout_without_coalescing': 0,
+            'batches_sent': 0,
+            'session_updates_sent': 0,
+            'priority_sent': 0,
+            'backpressure_deferrals': 0,
+            'ack_timeouts': 0,
+        }
+
+    # ---- subscriptions ----
+
+    def subscribe(self, sid, exam_id):
+        with self._lock:
+            self._subscribers[sid] = _Subscriber(sid, exam_id)
+        self._ensure_flusher()
+
+    def unsubscribe(self, sid):
+        with self._lock:
+            self._subscribers.pop(sid, None)
+
+    def subscriber_count(self, exam_id):
+        with self._lock:
+            return sum(1 for sub in self._subscribers.values() if sub.exam_key == exam_key(exam_id))
+
+    # ---- publishing ----
+
+    def publish_activity(self, exam_id, session_id, user_id, event_type, severity, risk_score, timestamp=None):
+        """Queue one student activity update for the next batch of this exam"""
+        timestamp = timestamp or datetime.utcnow()
+        key = exam_key(exam_id)
+        with self._lock:
+            subscribers = sum(1 for sub in self._subscribers.values() if sub.exam_key == key)
+            self._counters['events_published'] += 1
+            self._counters['fanout_without_coalescing'] += subscribers
+            if not subscribers:
+                return
+
+            sessions = self._pending.setdefault(key, {})
+            update = sessions.get(session_id)
+            if update is None:
+                update = sessions[session_id] = {
+                    'session_id': session_id,
+                    'user_id': user_id,
+                    'events': 0,
+                    'by_severity': {}
+                }
+            _merge(update, {
+                'events': 1,
+                'by_severity': {severity: 1},
+                'last_event_type': event_type,
+                'severity': severity,
+                'risk_score': risk_score,
+                'timestamp': timestamp.isoformat()
+            })
+
+    def send_priority(self, exam_id, event, payload):
+        """Emit immediately to the exam's proctors, bypassing coalescing"""
+        socketio.emit(event, payload, to=proctor_room(exam_id))
+        with self._lock:
+            self._counters['priority_sent'] += 1
+
+    # ---- flushing ----
+
+    def flush(self):
+        """Send one batch to every proctor that has changes and spare capacity"""
+        now = time.monotonic()
+        outgoing = []
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            for sub in self._subscribers.values():
+                for session_id, update in pending.get(sub.exam_key, {}).items():
+                    current = sub.outbox.get(session_id)
+                    if current is None:
+                        sub.outbox[session_id] = _copy(update)
+                    else:
+                        _merge(current, update)
+
+                expired = [seq for seq, sent_at in sub.in_flight.items() if now - sent_at > self.ack_timeout]
+                for seq in expired:
+                    del sub.in_flight[seq]
+                self._counters['ack_timeouts'] += len(expired)
+
+                if not sub.outbox:
+                    continue
+                if len(sub.in_flight) >= self.max_unacked:
+                    self._counters['backpressure_deferrals'] += 1
+                    continue
+
+                sub.seq += 1
+                sub.in_flight[sub.seq] = now
+                outgoing.append((sub.sid, sub.seq, {
+                    'exam_id': sub.exam_id,
+                    'seq': sub.seq,
+                    'sessions': list(sub.outbox.values()),
+                    'generated_at': datetime.utcnow().isoformat()
+                }))
+                self._counters['batches_sent'] += 1
+                self._counters['session_updates_sent'] += len(sub.outbox)
+                sub.outbox = {}
+
+        for sid, seq, batch in outgoing:
+            socketio.emit('student_activity_batch', batch, to=sid, callback=self._ack_callback(sid, seq))
+        return len(outgoing)
+
+    def ack(self, sid, seq):
+        with self._lock:
+            sub = self._subscribers.get(sid)
+            if sub:
+                sub.in_flight.pop(seq, None)
+
+    def _ack_callback(self, sid, seq):
+        def callback(*args):
+            self.ack(sid, seq)
+        return callback
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Broadcaster flush failed: {e}")
+
+    # ---- metrics ----
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self._counters)
+            counters['subscribers'] = len(self._subscribers)
+            counters['clients_at_limit'] = sum(
+                1 for sub in self._subscribers.values() if len(sub.in_flight) >= self.max_unacked
+            )
+        counters['messages_saved'] = max(0, counters['fanout_without_coalescing'] - counters['batches_sent'])
+        counters['interval_ms'] = int(self.interval * 1000)
+        counters['max_unacked'] = self.max_unacked
+        return counters
+
+
+def exam_key(exam_id):
+    """Key for per-exam state"""
+    # Clients send exam ids as numbers or strings; rooms are keyed by their text form
+    return str(exam_id)
+
+
+def _copy(update):
+    copied = dict(update)
+    copied['by_severity'] = dict(update['by_severity'])
+    return copied
+
+
+def _merge(target, update):
+    """Fold a newer update into an older one: counts add up, latest state wins"""
+    target['events'] += update['events']
+    for severity, count in update['by_severity'].items():
+        target['by_severity'][severity] = target['by_severity'].get(severity, 0) + count
+    for key in ('last_event_type', 'severity', 'risk_score', 'timestamp'):
+        target[key] = update[key]
+
+
+# Global instance
+broadcaster = ProctorBroadcaster()
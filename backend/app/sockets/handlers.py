@@ -2,18 +2,37 @@
 """
 Socket.IO event handlers for real-time exam monitoring
 """
+import os
+import random
+import threading
+
 from flask import request
 from app.services.anomaly_model import get_anomaly_model_service  # NEW
 from flask_socketio import emit, join_room, leave_room
+from sqlalchemy.exc import OperationalError
 from app import socketio, db
-from app.models import ExamSession, Event, Alert, Baseline
-from app.services.risk_scorer import risk_scorer
+from app.models import ExamSession
+from app.services import submission, behavior_ingest, telemetry_codec
+from app.services.exam_policy import policy_cache
+from app.services.personal_models import personal_models
+from app.sockets.broadcaster import broadcaster, proctor_room
+from app.sockets.roster import roster
+from app.sockets.scoring import scoring_queue, RECORD_ONLY
 from datetime import datetime
-import json
 
 # Store active connections
 active_sessions = {}  # {session_id: {user_id, exam_id, socket_id}}
 
+SEVERITY_RANK = {'info': 0, 'low': 1, 'medium': 2, 'high': 3}
+
+# Concurrent reconnect replays; beyond this clients are told to retry with jitter
+REPLAY_CONCURRENCY = int(os.environ.get('REPLAY_CONCURRENCY', 16))
+REPLAY_RETRY_MS = (500, int(os.environ.get('REPLAY_RETRY_MAX_MS', 5000)))
+replay_slots = threading.BoundedSemaphore(REPLAY_CONCURRENCY)
+
+# Telemetry encoding negotiated per client
+telemetry_formats = {}  # {socket_id: {format, compression}}
+
 
 @socketio.on('connect')
 def handle_connect():
@@ -26,14 +45,31 @@ def handle_connect():
 def handle_disconnect():
     """Handle client disconnection"""
     print(f"Client disconnected: {request.sid}")
+    broadcaster.unsubscribe(request.sid)
+    telemetry_formats.pop(request.sid, None)
     
     # Remove from active sessions
     for session_id, data in list(active_sessions.items()):
         if data.get('socket_id') == request.sid:
             del active_sessions[session_id]
+            roster.student_left(data.get('exam_id'), session_id)
             break
 
 
+@socketio.on('negotiate_telemetry')
+def handle_negotiate_telemetry(data):
+    """
+    Agree on the session_data encoding for this client
+    
+    Data: {formats: ['ept1', 'json'], compressions: ['zlib', 'none']} in preference order
+    Returns {format, compression}; clients that never ask keep sending JSON.
+    """
+    data = data or {}
+    choice = telemetry_codec.negotiate(data.get('formats'), data.get('compressions'))
+    telemetry_formats[request.sid] = choice
+    return choice
+
+
 @socketio.on('join_exam')
 def handle_join_exam(data):
     """
@@ -54,7 +90,13 @@ def handle_join_exam(data):
         room = f"exam_{exam_id}"
         join_room(room)
         
+        # Load the exam's scoring policy now so events never wait on it
+        policy_cache.get(exam_id)
+        
         if role == 'student':
+            # Load the student's personal model while they settle in
+            personal_models.get(user_id)
+            
             # Find or create exam session
             session = ExamSession.query.filter_by(
                 exam_id=exam_id,
@@ -70,6 +112,7 @@ def handle_join_exam(data):
                     'socket_id': request.sid,
                     'role': role
                 }
+                roster.student_joined(exam_id, session)
                 
                 emit('joined_exam', {
                     'message': 'Joined exam successfully',
@@ -84,7 +127,9 @@ def handle_join_exam(data):
                     'session_id': session.id
                 }, room=room, skip_sid=request.sid)
         else:
-            # Proctor joined
+            # Proctor joined: activity arrives as coalesced batches (see broadcaster.py)
+            join_room(proctor_room(exam_id))
+            broadcaster.subscribe(request.sid, exam_id)
             emit('joined_exam', {
                 'message': 'Joined exam as proctor',
                 'exam_id': exam_id
@@ -103,6 +148,8 @@ def handle_leave_exam(data):
         if exam_id:
             room = f"exam_{exam_id}"
             leave_room(room)
+            leave_room(proctor_room(exam_id))
+            broadcaster.unsubscribe(request.sid)
             emit('left_exam', {'message': 'Left exam successfully'})
     except Exception as e:
         print(f"Error in leave_exam: {e}")
@@ -115,6 +162,9 @@ def handle_suspicious_activity(data):
     Log suspicious activity during exam
     
     Data: {user_id, exam_id, type, count, duration, etc.}
+    
+    Scoring runs on the scoring workers (see scoring.py); the student is
+    acknowledged as soon as the event is queued.
     """
     try:
         user_id = data.get('user_id')
@@ -125,102 +175,117 @@ def handle_suspicious_activity(data):
             emit('error', {'message': 'Missing required fields'})
             return
         
-        # Find active session
-        session = ExamSession.query.filter_by(
-            exam_id=exam_id,
-            user_id=user_id,
-            status='in_progress'
-        ).first()
+        policy = policy_cache.get(exam_id)
+        severity = behavior_ingest.classify_severity(event_type, data, policy)
+        job = {
+            'sid': request.sid,
+            'user_id': user_id,
+            'exam_id': exam_id,
+            'event_type': event_type,
+            'severity': severity,
+            'data': data
+        }
+        if policy.ignores(event_type):
+            # Allowed by the exam: keep the record, skip scoring
+            job['mode'] = RECORD_ONLY
+        status = scoring_queue.submit(job)
         
-        if not session:
-            emit('error', {'message': 'No active session found'})
-            return
+        # Acknowledge to student
+        emit('activity_logged', {
+            'message': 'Activity logged' if status != 'dropped' else 'Activity dropped (server overloaded)',
+            'event_type': event_type,
+            'severity': severity,
+            'status': status
+        })
+        
+    except Exception as e:
+        print(f"Error in suspicious_activity: {e}")
+        emit('error', {'message': str(e)})
+
+
+@socketio.on('behavior_batch')
+def handle_behavior_batch(data):
+    """
+    Store a batch of behavioral samples (see services/behavior_ingest.py)
+    
+    Data: {user_id, exam_id, first_seq, samples: [[type, ts_ms, {fields}], ...], replay}
+    Returns the ack {first_seq, status, stored, acked_through}; status is
+    'stored', 'duplicate', 'retry' (resend after retry_after_ms) or 'error'.
+    The client drops samples with seq <= acked_through and resends the rest.
+    
+    Older clients send batch_seq instead of first_seq and get {batch_seq, status, stored}.
+    """
+    try:
+        user_id = data.get('user_id')
+        exam_id = data.get('exam_id')
+        first_seq = data.get('first_seq')
+        batch_seq = data.get('batch_seq')
+        replay = bool(data.get('replay'))
+        ack = {'first_seq': first_seq} if first_seq is not None else {'batch_seq': batch_seq}
+        seq = first_seq if first_seq is not None else batch_seq
         
-        # Determine severity
-        severity = 'low'
-        if event_type in ['copy_paste', 'tab_switch'] and data.get('count', 0) > 3:
-            severity = 'high'
-        elif event_type == 'window_blur' and data.get('duration', 0) > 30:
-            severity = 'medium'
+        if not user_id or not exam_id or not isinstance(seq, int) or seq < 1:
+            return {**ack, 'status': 'error', 'message': 'Missing user_id, exam_id or first_seq'}
         
-        # Create event
-        event = Event(
-            session_id=session.id,
-            event_type=event_type,
-            event_data=json.dumps(data),
-            timestamp=datetime.utcnow(),
-            severity=severity
-        )
-        db.session.add(event)
+        limit = behavior_ingest.MAX_SAMPLES_PER_REPLAY if replay else behavior_ingest.MAX_SAMPLES_PER_BATCH
+        try:
+            samples = behavior_ingest.parse_samples(data.get('samples'), limit=limit)
+        except ValueError as e:
+            return {**ack, 'status': 'error', 'message': str(e)}
         
-        # Update incident count
-        session.flagged_incidents_count += 1
+        # Reconnect storms: bound concurrent replays, tell the rest to back off
+        if replay and not replay_slots.acquire(blocking=False):
+            return {**ack, 'status': 'retry', 'retry_after_ms': random.randint(*REPLAY_RETRY_MS)}
         
-        # Calculate risk score
-        baseline = Baseline.query.filter_by(user_id=user_id).first()
-        if baseline:
-            events = Event.query.filter_by(session_id=session.id).all()
-            current_behavior = {
-                'typing_speed_wpm': data.get('typing_speed_wpm', 0),
-                'mouse_speed_pxs': data.get('mouse_speed_pxs', 0),
-                'avg_question_time_sec': data.get('avg_question_time_sec', 0)
-            }
+        try:
+            session = behavior_ingest.load_session_for_ingest(exam_id, user_id)
+            if not session:
+                return {**ack, 'status': 'error', 'message': 'No active session found'}
             
-            risk_score = risk_scorer.calculate_risk_score(
-                current_behavior,
-                baseline,
-                events
-            )
-            
-            session.risk_score = risk_score
-            session.integrity_score = 1.0 - risk_score
-            
-            # Create alert if risk is high
-            if risk_score > 0.7:
-                alert = Alert(
-                    session_id=session.id,
-                    alert_type=event_type,
-                    message=f"High risk activity detected: {event_type}",
-                    risk_score=risk_score,
-                    severity='high',
-                    resolved=False
-                )
-                db.session.add(alert)
-                
-                # Notify proctors immediately
-                room = f"exam_{exam_id}"
-                emit('high_risk_alert', {
-                    'user_id': user_id,
-                    'session_id': session.id,
-                    'risk_score': risk_score,
-                    'event_type': event_type,
-                    'message': alert.message
-                }, room=room)
+            policy = policy_cache.get(exam_id)
+            if first_seq is not None:
+                result = behavior_ingest.ingest_events(session, first_seq, samples, policy)
+            else:
+                result = behavior_ingest.ingest_batch(session, batch_seq, samples, policy)
+            db.session.commit()
+        finally:
+            if replay:
+                replay_slots.release()
         
-        db.session.commit()
+        if result['acked_through'] is not None:
+            ack['acked_through'] = result['acked_through']
+        if result['gap']:
+            print(f"⚠️ behavior_batch gap of {result['gap']} events (exam {exam_id}, user {user_id})")
+        if result['status'] == 'retry':
+            return {**ack, 'status': 'retry', 'retry_after_ms': random.randint(*REPLAY_RETRY_MS)}
+        if result['status'] == 'duplicate':
+            return {**ack, 'status': 'duplicate', 'stored': 0}
         
-        # Acknowledge to student
-        emit('activity_logged', {
-            'message': 'Activity logged',
-            'event_type': event_type,
-            'severity': severity
-        })
+        if result['suspicious'] or result['behavior']:
+            severities = [severity for _, severity, _ in result['suspicious']]
+            scoring_queue.submit({
+                'kind': 'rescore',
+                'sid': request.sid,
+                'user_id': user_id,
+                'exam_id': exam_id,
+                'session_id': session.id,
+                'severity': max(severities, key=SEVERITY_RANK.get) if severities else 'low',
+                'suspicious': result['suspicious'],
+                'observations': result['observations'],
+                'behavior': result['behavior']
+            })
         
-        # Notify proctors
-        room = f"exam_{exam_id}"
-        emit('student_activity', {
-            'user_id': user_id,
-            'session_id': session.id,
-            'event_type': event_type,
-            'severity': severity,
-            'risk_score': session.risk_score,
-            'timestamp': datetime.utcnow().isoformat()
-        }, room=room, skip_sid=request.sid)
+        return {**ack, 'status': 'stored', 'stored': result['stored']}
         
+    except OperationalError as e:
+        # Lock / pool timeouts are transient: the client keeps the samples and resends
+        db.session.rollback()
+        print(f"⚠️ behavior_batch deferred: {e.orig if hasattr(e, 'orig') else e}")
+        return {**ack, 'status': 'retry', 'retry_after_ms': random.randint(*REPLAY_RETRY_MS)}
     except Exception as e:
         db.session.rollback()
-        print(f"Error in suspicious_activity: {e}")
-        emit('error', {'message': str(e)})
+        print(f"Error in behavior_batch: {e}")
+        return {'first_seq': data.get('first_seq'), 'batch_seq': data.get('batch_seq'), 'status': 'error', 'message': str(e)}
 
 
 @socketio.on('submit_exam')
@@ -233,7 +298,8 @@ def handle_submit_exam(data):
         time_taken = data.get('time_taken')
 
         # NEW: optional full behavioral payload coming from frontend
-        session_data = data.get('session_data')  # may be None
+        # (JSON object or EPT1 bytes, see negotiate_telemetry)
+        session_data = telemetry_codec.load_session_data(data.get('session_data'))  # may be None
 
         # Find session
         session = ExamSession.query.filter_by(
@@ -246,64 +312,52 @@ def handle_submit_exam(data):
             emit('error', {'message': 'No active session found'})
             return
 
-        # Update session basic fields
-        session.submitted_at = datetime.utcnow()
-        session.time_taken_seconds = time_taken
-        session.answers = json.dumps(answers)
-        session.status = 'submitted'
-
-        # ---- NEW: compute model-based risk if session_data is provided ----
+        # ---- NEW: model-based risk if session_data is provided ----
+        model_risk, raw_score = None, None
         if session_data:
             try:
                 model_service = get_anomaly_model_service()
-                risk_score, raw_score = model_service.score_session(session_data)
-
-                session.risk_score = risk_score
-                session.integrity_score = 1.0 - risk_score
-
-                # If high risk, create alert
-                if risk_score >= 0.7:
-                    alert = Alert(
-                        session_id=session.id,
-                        alert_type='model_anomaly',
-                        message=f"High risk behavior detected by model (risk={risk_score:.2f})",
-                        risk_score=risk_score,
-                        severity='high',
-                        resolved=False
-                    )
-                    db.session.add(alert)
-
-                    room = f"exam_{exam_id}"
-                    emit('high_risk_alert', {
-                        'user_id': user_id,
-                        'session_id': session.id,
-                        'exam_id': exam_id,
-                        'risk_score': risk_score,
-                        'event_type': 'model_anomaly',
-                        'message': alert.message
-                    }, room=room)
-
-                # Also push generic risk_update for dashboard
-                room = f"exam_{exam_id}"
-                emit('risk_update', {
-                    'user_id': user_id,
-                    'session_id': session.id,
-                    'exam_id': exam_id,
-                    'risk_score': session.risk_score,
-                    'integrity_score': session.integrity_score,
-                    'raw_score': raw_score,
-                    'timestamp': datetime.utcnow().isoformat()
-                }, room=room)
-
+                model_risk, raw_score = model_service.score_session(session_data, user_id=session.user_id, exam_session=session)
             except Exception as model_err:
                 # Don't block submission if model fails — just log
                 print(f"Error scoring session with anomaly model: {model_err}")
 
+        result = submission.finalize_submission(
+            session,
+            answers=answers,
+            time_taken_seconds=time_taken,
+            current_behavior=submission.behavior_from_payload(data),
+            model_risk=model_risk
+        )
         db.session.commit()
 
+        room = f"exam_{exam_id}"
+        alert = result['alert']
+        if alert:
+            broadcaster.send_priority(exam_id, 'high_risk_alert', {
+                'user_id': user_id,
+                'session_id': session.id,
+                'exam_id': exam_id,
+                'risk_score': alert.risk_score,
+                'event_type': alert.alert_type,
+                'message': alert.message
+            })
+
+        # Also push generic risk_update for dashboard
+        emit('risk_update', {
+            'user_id': user_id,
+            'session_id': session.id,
+            'exam_id': exam_id,
+            'risk_score': session.risk_score,
+            'integrity_score': session.integrity_score,
+            'raw_score': raw_score,
+            'timestamp': datetime.utcnow().isoformat()
+        }, room=room)
+
         # Remove from active sessions
         if session.id in active_sessions:
             del active_sessions[session.id]
+        roster.student_left(exam_id, session.id, reason='submitted')
 
         emit('exam_submitted', {
             'message': 'Exam submitted successfully',
@@ -324,9 +378,12 @@ def handle_submit_exam(data):
         emit('error', {'message': str(e)})
 
 
-@socketio.on('get_active_students')
-def handle_get_active_students(data):
-    """Get list of active students in an exam (proctor only)"""
+@socketio.on('subscribe_roster')
+def handle_subscribe_roster(data):
+    """
+    Subscribe to the active-student roster of an exam (proctor only).
+    Replies with roster_snapshot; roster_delta events follow. Re-send to resync.
+    """
     try:
         exam_id = data.get('exam_id')
         
@@ -334,35 +391,31 @@ def handle_get_active_students(data):
             emit('error', {'message': 'Missing exam_id'})
             return
         
-        # Get all active sessions for this exam
-        sessions = ExamSession.query.filter_by(
-            exam_id=exam_id,
-            status='in_progress'
-        ).all()
+        # Deltas go to the proctor room, so join it before taking the snapshot
+        join_room(proctor_room(exam_id))
+        emit('roster_snapshot', roster.snapshot(exam_id))
         
-        active_students = []
-        for session in sessions:
-            if session.id in active_sessions:
-                student_data = {
-                    'user_id': session.user_id,
-                    'session_id': session.id,
-                    'risk_score': session.risk_score,
-                    'integrity_score': session.integrity_score,
-                    'incidents_count': session.flagged_incidents_count,
-                    'started_at': session.started_at.isoformat()
-                }
-                
-                # Add user info
-                if session.student:
-                    student_data['name'] = session.student.name
-                    student_data['roll_number'] = session.student.roll_number
-                
-                active_students.append(student_data)
+    except Exception as e:
+        print(f"Error in subscribe_roster: {e}")
+        emit('error', {'message': str(e)})
+
+
+@socketio.on('get_active_students')
+def handle_get_active_students(data):
+    """Get list of active students in an exam (proctor only); prefer subscribe_roster"""
+    try:
+        exam_id = data.get('exam_id')
+        
+        if not exam_id:
+            emit('error', {'message': 'Missing exam_id'})
+            return
         
+        snapshot = roster.snapshot(exam_id)
         emit('active_students', {
             'exam_id': exam_id,
-            'students': active_students,
-            'count': len(active_students)
+            'students': snapshot['students'],
+            'count': snapshot['count'],
+            'version': snapshot['version']
         })
         
     except Exception as e:
@@ -0,0 +1,194 @@
+# app/sockets/roster.py
+"""
+Active-student roster with versioned deltas
+
+Proctors subscribe once (`subscribe_roster`) and get a `roster_snapshot`
+carrying a version number. Every later change is pushed as a `roster_delta`
+with the next version:
+
+    {exam_id, version, changes: [
+        {op: 'joined', student: {...}},
+        {op: 'left', session_id, reason},
+        {op: 'risk', session_id, risk_score, integrity_score, incidents_count}
+    ]}
+
+A client that sees a version other than last + 1 re-subscribes for a fresh
+snapshot. The roster lives in memory next to handlers.active_sessions, so
+neither snapshots nor deltas touch the database.
+
+Joins and leaves go out at once. Risk moves are coalesced like the
+broadcaster's activity batches: the latest move per session is kept and
+every BROADCAST_INTERVAL_MS one delta per exam carries them all.
+
+Versions are assigned under the lock, but nothing is emitted while holding
+it (an emit can yield to the event loop under eventlet/gevent). Deltas are
+queued in version order and sent by whichever caller holds the send role.
+"""
+import os
+import threading
+
+from app import socketio
+from app.sockets.broadcaster import broadcaster, proctor_room, exam_key
+
+# Risk moves smaller than this are not worth a delta
+RISK_EPSILON = float(os.getenv('ROSTER_RISK_EPSILON', 0.01))
+
+
+class _ExamRoster:
+    __slots__ = ('exam_id', 'version', 'students', 'risk_moves')
+
+    def __init__(self, exam_id=None):
+        self.exam_id = exam_id
+        self.version = 0
+        self.students = {}    # {session_id: student entry}
+        self.risk_moves = {}  # {session_id: latest unsent 'risk' change}
+
+
+class RosterTracker:
+    def __init__(self, risk_epsilon=RISK_EPSILON, interval=None):
+        self.risk_epsilon = risk_epsilon
+        self.interval = interval or broadcaster.interval
+        self._lock = threading.Lock()
+        self._send_lock = threading.Lock()  # only ever acquired without blocking
+        self._exams = {}   # {exam key: _ExamRoster}
+        self._outbox = []  # [(exam_id, delta)] in version order
+        self._flusher_started = False
+
+    def snapshot(self, exam_id):
+        with self._lock:
+            roster = self._exams.get(exam_key(exam_id)) or _ExamRoster()
+            students = [dict(entry) for entry in roster.students.values()]
+            return {
+                'exam_id': exam_id,
+                'version': roster.version,
+                'students': students,
+                'count': len(students)
+            }
+
+    def student_joined(self, exam_id, session, user=None):
+        """Add (or refresh) a connected student. user defaults to session.student."""
+        user = user or session.student
+        entry = {
+            'user_id': session.user_id,
+            'session_id': session.id,
+            'name': user.name if user else None,
+            'roll_number': user.roll_number if user else None,
+            'risk_score': session.risk_score,
+            'integrity_score': session.integrity_score,
+            'incidents_count': session.flagged_incidents_count,
+            'started_at': session.started_at.isoformat() if session.started_at else None
+        }
+        with self._lock:
+            roster = self._roster(exam_id)
+            roster.students[session.id] = entry
+            roster.risk_moves.pop(session.id, None)  # the entry carries the latest risk
+            self._publish(exam_id, roster, [{'op': 'joined', 'student': dict(entry)}])
+        self._send()
+
+    def students_left(self, exam_id, session_ids, reason='disconnected'):
+        with self._lock:
+            roster = self._exams.get(exam_key(exam_id))
+            if not roster:
+                return
+            changes = []
+            for session_id in session_ids:
+                roster.risk_moves.pop(session_id, None)
+                if roster.students.pop(session_id, None) is not None:
+                    changes.append({'op': 'left', 'session_id': session_id, 'reason': reason})
+            if not changes:
+                return
+            self._publish(exam_id, roster, changes)
+        self._send()
+
+    def student_left(self, exam_id, session_id, reason='disconnected'):
+        self.students_left(exam_id, [session_id], reason)
+
+    def risk_changed(self, exam_id, session_id, risk_score, integrity_score, incidents_count):
+        """
+        Record the latest risk; moves of at least risk_epsilon are sent with the
+        exam's next coalesced risk delta.
+        """
+        self._ensure_flusher()
+        with self._lock:
+            roster = self._exams.get(exam_key(exam_id))
+            entry = roster.students.get(session_id) if roster else None
+            if entry is None:
+                return
+            previous = entry['risk_score'] or 0.0
+            entry['integrity_score'] = integrity_score
+            entry['incidents_count'] = incidents_count
+            if abs((risk_score or 0.0) - previous) < self.risk_epsilon:
+                return
+            entry['risk_score'] = risk_score
+            roster.risk_moves[session_id] = {
+                'op': 'risk',
+                'session_id': session_id,
+                'risk_score': risk_score,
+                'integrity_score': integrity_score,
+                'incidents_count': incidents_count
+            }
+
+    def flush(self):
+        """Send the pending risk moves, one delta per exam. Returns the number of deltas."""
+        sent = 0
+        with self._lock:
+            for roster in self._exams.values():
+                if roster.risk_moves:
+                    changes, roster.risk_moves = list(roster.risk_moves.values()), {}
+                    self._publish(roster.exam_id, roster, changes)
+                    sent += 1
+        self._send()
+        return sent
+
+    def _roster(self, exam_id):
+        roster = self._exams.get(exam_key(exam_id))
+        if roster is None:
+            roster = self._exams[exam_key(exam_id)] = _ExamRoster(exam_id)
+        return roster
+
+    def _publish(self, exam_id, roster, changes):
+        # Called with the lock held: versions are queued in order, sent by _send()
+        roster.version += 1
+        self._outbox.append((exam_id, {
+            'exam_id': exam_id,
+            'version': roster.version,
+            'changes': changes
+        }))
+
+    def _send(self):
+        """Emit queued deltas in order, unless another caller is already sending them"""
+        while self._send_lock.acquire(blocking=False):
+            try:
+                while True:
+                    with self._lock:
+                        outgoing, self._outbox = self._outbox, []
+                    if not outgoing:
+                        break
+                    for exam_id, delta in outgoing:
+                        socketio.emit('roster_delta', delta, to=proctor_room(exam_id))
+            finally:
+                self._send_lock.release()
+            # Deltas queued between the last check and the release would be
+            # left behind: go again if there are any
+            with self._lock:
+                if not self._outbox:
+                    return
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.interval)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"⚠️ Roster flush failed: {e}")
+
+
+# Global instance
+roster = RosterTracker()
@@ -0,0 +1,330 @@
+# app/sockets/scoring.py
+"""
+Asynchronous scoring of suspicious activity
+
+The socket handler only validates, classifies severity, enqueues and acks.
+A small pool of worker threads persists the event, runs the risk scorer and
+pushes high_risk_alert / student_activity updates to proctors. behavior_batch
+stores its samples on the handler thread and queues a 'rescore' job.
+
+- Jobs are sharded by (exam_id, user_id) onto per-worker bounded queues, so
+  one student's events are always scored in order
+- Load shedding, by total queue depth:
+    depth >= SCORING_SHED_DEPTH   low-severity events are stored without scoring
+    shard full                    low-severity events are dropped; medium/high
+                                  events are scored inline on the handler thread
+- Metrics: queue depth at enqueue and end-to-end detection latency
+  (handler receive -> proctors notified) histograms, plus shed counters
+- SCORING_WORKERS=0 scores everything inline (the old behaviour)
+- Live risk is scored on time-decayed incident counts (services/risk_decay.py)
+"""
+import os
+import queue
+import threading
+import time
+import zlib
+from datetime import datetime
+
+from app import socketio, db
+from app.models import ExamSession, Event, Alert, Baseline
+from app.services import analytics_rollup, submission
+from app.services.risk_decay import tracker as risk_tracker
+from app.services.exam_policy import policy_cache
+from app.services.metrics import Histogram
+from app.services.background import new_queue
+from app.services.risk_scorer import risk_scorer
+from app.sockets.broadcaster import broadcaster
+from app.sockets.roster import roster
+
+HIGH_RISK_THRESHOLD = 0.7
+
+# Scoring modes
+SCORE = 'score'
+RECORD_ONLY = 'record_only'
+
+
+def process_activity(job):
+    """
+    Persist one suspicious activity event, score the session and notify.
+    Runs inside an app context; returns False when the session is gone.
+    """
+    exam_id = job['exam_id']
+    user_id = job['user_id']
+    event_type = job['event_type']
+    severity = job['severity']
+    data = job['data']
+
+    session = ExamSession.query.filter_by(
+        exam_id=exam_id,
+        user_id=user_id,
+        status='in_progress'
+    ).first()
+
+    if not session:
+        socketio.emit('error', {'message': 'No active session found'}, to=job['sid'])
+        return False
+
+    # Load the session's decayed state before this event is added to the DB session
+    risk_tracker.ensure(session.id)
+
+    event = Event(
+        session_id=session.id,
+        event_type=event_type,
+        event_data=data,
+        timestamp=job['timestamp'],
+        severity=severity,
+        **Event.promoted_attributes(data)
+    )
+    db.session.add(event)
+    analytics_rollup.record_event(exam_id, severity, event.timestamp)
+
+    # Update incident count ('info' events are allowed by the exam's policy)
+    activities = []
+    if severity != 'info':
+        session.flagged_incidents_count += 1
+        activities.append((event_type, severity, event.timestamp))
+        risk_tracker.observe(session.id, [(event_type, severity, event.timestamp, event.duration)])
+
+    alert = _score_session(session, job, data, event_type) if job['mode'] == SCORE else None
+    db.session.commit()
+
+    _notify(session, job, alert, activities)
+    return True
+
+
+def rescore_session(job):
+    """
+    Score a session whose events were already stored (behavior_batch) and
+    notify proctors about the batch's suspicious samples.
+    """
+    session = db.session.get(ExamSession, job['session_id'])
+    if not session or session.status != 'in_progress':
+        return False
+
+    # A freshly rebuilt state already contains this batch's stored events
+    if not risk_tracker.ensure(session.id):
+        risk_tracker.observe(session.id, job.get('observations', []))
+
+    alert = None
+    if job['mode'] == SCORE:
+        event_type = job['suspicious'][-1][0] if job['suspicious'] else 'behavior_batch'
+        alert = _score_session(session, job, job['behavior'], event_type)
+    db.session.commit()
+
+    _notify(session, job, alert, job['suspicious'])
+    return True
+
+
+def _score_session(session, job, behavior, event_type):
+    """Recompute the session's risk from its stored events; returns the Alert created, if any"""
+    baseline = Baseline.query.filter_by(user_id=session.user_id).first()
+    if not baseline:
+        return None
+
+    policy = policy_cache.get(session.exam_id)
+    # Time-decayed incident counts (services/risk_decay.py), not all-time totals
+    summary = risk_tracker.summary(session.id)
+    if summary is None:
+        db.session.flush()
+        summary = submission.event_summaries([session.id])[session.id]
+    summary = policy.filter_summary(summary)
+
+    current_behavior = submission.behavior_from_payload(behavior)
+    risk_score = risk_scorer.calculate_risk_score(
+        current_behavior,
+        baseline,
+        summary,
+        policy.sensitivity
+    )
+    risk_tracker.record_risk(session.id, risk_score, current_behavior)
+
+    session.risk_score = risk_score
+    session.integrity_score = 1.0 - risk_score
+
+    # Create alert if risk is high
+    if risk_score <= HIGH_RISK_THRESHOLD:
+        return None
+    alert = Alert(
+        session_id=session.id,
+        alert_type=event_type,
+        message=f"High risk activity detected: {event_type}",
+        risk_score=risk_score,
+        severity='high',
+        resolved=False
+    )
+    db.session.add(alert)
+    analytics_rollup.record_alert(session.exam_id)
+    return alert
+
+
+def _notify(session, job, alert, activities):
+    """Push the committed outcome to proctors"""
+    exam_id = job['exam_id']
+    if alert:
+        broadcaster.send_priority(exam_id, 'high_risk_alert', {
+            'user_id': session.user_id,
+            'session_id': session.id,
+            'risk_score': alert.risk_score,
+            'event_type': alert.alert_type,
+            'message': alert.message
+        })
+
+    roster.risk_changed(
+        exam_id,
+        session.id,
+        session.risk_score,
+        session.integrity_score,
+        session.flagged_incidents_count
+    )
+
+    # Notify proctors (coalesced into the next student_activity_batch)
+    for event_type, severity, timestamp in activities:
+        broadcaster.publish_activity(
+            exam_id,
+            session.id,
+            session.user_id,
+            event_type,
+            severity,
+            session.risk_score,
+            timestamp
+        )
+
+
+class ScoringQueue:
+    def __init__(self, workers=None, max_depth=None, shed_depth=None):
+        self.workers = int(os.getenv('SCORING_WORKERS', 4)) if workers is None else workers
+        self.max_depth = max_depth or int(os.getenv('SCORING_QUEUE_MAX', 2000))
+        self.shed_depth = shed_depth or int(os.getenv('SCORING_SHED_DEPTH', self.max_depth // 2))
+
+        self.app = None
+        self._shards = []
+        self._started = False
+        self._lock = threading.Lock()
+        self._counters = {
+            'enqueued': 0,
+            'processed': 0,
+            'failed': 0,
+            'scored_inline': 0,
+            'shed_unscored': 0,
+            'shed_dropped': 0,
+        }
+        self.depth_histogram = Histogram([0, 1, 5, 10, 50, 100, 250, 500, 1000, 2000, 5000])
+        self.latency_histogram = Histogram([5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000])
+
+    def init_app(self, app):
+        self.app = app
+
+    def submit(self, job):
+        """
+        Enqueue a job built by the socket handler.
+        Returns 'queued', 'inline' or 'dropped'.
+        """
+        job.setdefault('received_at', time.perf_counter())
+        job.setdefault('timestamp', datetime.utcnow())
+        job.setdefault('mode', SCORE)
+
+        if self.workers <= 0:
+            self._run_inline(job)
+            return 'inline'
+
+        self._ensure_workers()
+        depth = self.depth()
+        self.depth_histogram.observe(depth)
+
+        if depth >= self.shed_depth and job['severity'] == 'low':
+            job['mode'] = RECORD_ONLY
+
+        shard = self._shards[self._shard_index(job)]
+        try:
+            shard.put_nowait(job)
+        except queue.Full:
+            if job['severity'] == 'low':
+                self._count('shed_dropped')
+                return 'dropped'
+            # Never lose a medium/high-severity signal: score it here instead
+            self._run_inline(job)
+            return 'inline'
+
+        self._count('enqueued')
+        if job['mode'] == RECORD_ONLY:
+            self._count('shed_unscored')
+        return 'queued'
+
+    def depth(self):
+        return sum(shard.qsize() for shard in self._shards)
+
+    def drain(self, timeout=10.0):
+        """Wait until every queued job has been processed (scripts and shutdown)"""
+        deadline = time.monotonic() + timeout
+        while self.depth() or self._busy():
+            if time.monotonic() > deadline:
+                return False
+            socketio.sleep(0.01)
+        return True
+
+    def _busy(self):
+        return any(shard.unfinished_tasks for shard in self._shards)
+
+    def _shard_index(self, job):
+        key = f"{job['exam_id']}:{job['user_id']}".encode()  # same worker for all of a student's jobs
+        return zlib.crc32(key) % len(self._shards)
+
+    def _ensure_workers(self):
+        with self._lock:
+            if self._started:
+                return
+            per_shard = max(1, self.max_depth // self.workers)
+            # Green-thread safe under eventlet/gevent (a queue.Queue.get() would block the hub)
+            self._shards = [new_queue(per_shard) for _ in range(self.workers)]
+            self._started = True
+        for shard in self._shards:
+            socketio.start_background_task(self._worker, shard)
+
+    def _worker(self, shard):
+        while True:
+            job = shard.get()
+            try:
+                self._process(job)
+            finally:
+                shard.task_done()
+
+    def _run_inline(self, job):
+        self._count('scored_inline')
+        self._process(job)
+
+    def _process(self, job):
+        with self.app.app_context():
+            try:
+                if job.get('kind') == 'rescore':
+                    rescore_session(job)
+                else:
+                    process_activity(job)
+                self._count('processed')
+            except Exception as e:
+                db.session.rollback()
+                self._count('failed')
+                print(f"Error scoring suspicious_activity: {e}")
+                socketio.emit('error', {'message': str(e)}, to=job['sid'])
+                return
+        self.latency_histogram.observe((time.perf_counter() - job['received_at']) * 1000)
+
+    def _count(self, name):
+        with self._lock:
+            self._counters[name] += 1
+
+    def metrics(self):
+        with self._lock:
+            counters = dict(self._counters)
+        counters.update({
+            'workers': self.workers,
+            'depth': self.depth(),
+            'max_depth': self.max_depth,
+            'shed_depth': self.shed_depth,
+            'queue_depth': self.depth_histogram.snapshot(),
+            'detection_latency_ms': self.latency_histogram.snapshot()
+        })
+        return counters
+
+
+# Global instance
+scoring_queue = ScoringQueue()
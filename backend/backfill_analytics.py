@@ -0,0 +1,28 @@
+# backfill_analytics.py
+"""
+Rebuilds the pre-aggregated exam analytics rollups from historical
+sessions, events and alerts
+"""
+import argparse
+
+from app import create_app, db
+from app.services.analytics_rollup import backfill_exam_analytics
+
+def backfill(exam_id=None):
+    """Recompute rollups for one exam, or for every exam"""
+    app = create_app()
+    
+    with app.app_context():
+        db.create_all()  # make sure the rollup tables exist
+        
+        scope = f"exam {exam_id}" if exam_id else "all exams"
+        print(f"Backfilling analytics rollups for {scope}...")
+        rebuilt = backfill_exam_analytics(exam_id)
+        print(f"✅ Rebuilt rollups for {rebuilt} exam(s)")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Backfill exam analytics rollups')
+    parser.add_argument('--exam-id', type=int, help='Only rebuild this exam')
+    args = parser.parse_args()
+    
+    backfill(args.exam_id)
@@ -0,0 +1,153 @@
+# bench_db_concurrency.py
+"""
+Concurrency benchmark for the database engine configuration
+
+Simulates N simultaneous socket handlers, each doing what
+handle_suspicious_activity does per event: look up the active session,
+insert an Event, bump the session's incident counter and commit.
+Runs once with SQLAlchemy's default engine settings and once with the
+settings from app/database.py, and prints write throughput, latency and
+failures ("database is locked", pool timeouts) for each.
+
+    python bench_db_concurrency.py                      # temp SQLite files
+    python bench_db_concurrency.py --handlers 500 --writes 5
+    python bench_db_concurrency.py --database-url postgresql://...  (uses scratch tables in that DB)
+"""
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine, select, update, insert
+from sqlalchemy.exc import OperationalError, TimeoutError as PoolTimeoutError
+
+from app import db
+from app.database import engine_options, configure_engine, describe_engine
+from app.models import User, Exam, ExamSession, Event
+
+
+def _prepare(engine, n_handlers):
+    """Create schema and one in-progress session per handler"""
+    db.metadata.drop_all(engine)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        conn.execute(insert(User.__table__), [
+            {'name': f'Student {i}', 'email': f'bench{i}@exampulse.ai', 'password_hash': 'x', 'role': 'student'}
+            for i in range(n_handlers)
+        ])
+        exam_id = conn.execute(insert(Exam.__table__).values(
+            name='Bench', duration_minutes=60, total_questions=10, created_by=1
+        )).inserted_primary_key[0]
+        user_ids = conn.execute(select(User.__table__.c.id)).scalars().all()
+        conn.execute(insert(ExamSession.__table__), [
+            {'exam_id': exam_id, 'user_id': uid, 'status': 'in_progress', 'started_at': datetime.utcnow(),
+             'flagged_incidents_count': 0}
+            for uid in user_ids
+        ])
+    return exam_id, user_ids
+
+
+def _handler(engine, exam_id, user_id, writes, barrier, latencies, errors, lock):
+    sessions = ExamSession.__table__
+    events = Event.__table__
+    barrier.wait()
+    for _ in range(writes):
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                session_id = conn.execute(
+                    select(sessions.c.id).where(
+                        sessions.c.exam_id == exam_id,
+                        sessions.c.user_id == user_id,
+                        sessions.c.status == 'in_progress'
+                    )
+                ).scalar()
+                conn.execute(insert(events).values(
+                    session_id=session_id, event_type='tab_switch', event_data={'count': 1},
+                    timestamp=datetime.utcnow(), severity='low', count=1
+                ))
+                conn.execute(update(sessions).where(sessions.c.id == session_id).values(
+                    flagged_incidents_count=sessions.c.flagged_incidents_count + 1
+                ))
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies.append(elapsed)
+        except (OperationalError, PoolTimeoutError) as e:
+            with lock:
+                errors.append(type(e).__name__ + ': ' + str(e.orig if hasattr(e, 'orig') else e).split('\n')[0])
+
+
+def run_benchmark(label, database_url, options, n_handlers, writes, configure=False):
+    engine = create_engine(database_url, **options)
+    if configure:
+        configure_engine(engine)
+    exam_id, user_ids = _prepare(engine, n_handlers)
+    settings = describe_engine(engine)
+
+    latencies, errors, lock = [], [], threading.Lock()
+    barrier = threading.Barrier(n_handlers)
+    threads = [
+        threading.Thread(target=_handler, args=(engine, exam_id, uid, writes, barrier, latencies, errors, lock))
+        for uid in user_ids
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    engine.dispose()
+
+    latencies.sort()
+    result = {
+        'label': label,
+        'settings': settings,
+        'ok': len(latencies),
+        'failed': len(errors),
+        'elapsed_s': elapsed,
+        'writes_per_s': len(latencies) / elapsed if elapsed else 0.0,
+        'p50_ms': statistics.median(latencies) * 1000 if latencies else None,
+        'p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else None,
+        'sample_error': errors[0] if errors else None,
+    }
+    return result
+
+
+def print_result(result, total):
+    print(f"\n{result['label']}")
+    print(f"  settings:    {result['settings']}")
+    print(f"  committed:   {result['ok']}/{total}  (failed: {result['failed']})")
+    print(f"  elapsed:     {result['elapsed_s']:.2f}s")
+    print(f"  throughput:  {result['writes_per_s']:.1f} writes/s")
+    if result['p50_ms'] is not None:
+        print(f"  latency:     p50 {result['p50_ms']:.1f} ms, p95 {result['p95_ms']:.1f} ms")
+    if result['sample_error']:
+        print(f"  first error: {result['sample_error']}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark concurrent handler writes')
+    parser.add_argument('--handlers', type=int, default=500, help='Simultaneous handlers (threads)')
+    parser.add_argument('--writes', type=int, default=5, help='Writes per handler')
+    parser.add_argument('--database-url', help='Benchmark this database instead of temp SQLite files')
+    args = parser.parse_args()
+
+    total = args.handlers * args.writes
+    print(f"Benchmarking {args.handlers} simultaneous handlers × {args.writes} writes = {total} commits")
+
+    results = []
+    with tempfile.TemporaryDirectory() as tmp:
+        for label, configured in (('Default engine settings', False), ('Configured (app/database.py)', True)):
+            url = args.database_url or f"sqlite:///{os.path.join(tmp, f'bench_{int(configured)}.db')}"
+            options = engine_options(url) if configured else {}
+            results.append(run_benchmark(label, url, options, args.handlers, args.writes, configure=configured))
+            print_result(results[-1], total)
+
+    baseline, tuned = results
+    if baseline['writes_per_s']:
+        print(f"\nSpeed-up: {tuned['writes_per_s'] / baseline['writes_per_s']:.2f}× throughput, "
+              f"{baseline['failed'] - tuned['failed']} fewer failed writes")
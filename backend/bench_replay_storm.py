@@ -0,0 +1,132 @@
+# bench_replay_storm.py
+"""
+Reconnect-storm benchmark for behavior_batch replays
+
+Simulates N students reconnecting at the same moment, each replaying an
+offline backlog of sequenced samples through the behavior_batch handler.
+Half of every backlog overlaps events the server already stored before the
+disconnect, so the handler has to skip them. Clients told to 'retry' back
+off for retry_after_ms and resend, like frontend/src/behavior/batcher.js.
+
+A second pass replays every backlog again to check deduplication: nothing
+new may be stored and the Event count must not change.
+
+    python bench_replay_storm.py                          # temp SQLite file
+    python bench_replay_storm.py --clients 1000 --backlog 600
+    DATABASE_URL=postgresql://... python bench_replay_storm.py  (uses that database's tables)
+"""
+import argparse
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+if not os.getenv('DATABASE_URL'):
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench_replay.db')
+
+from sqlalchemy import insert, select, func  # noqa: E402
+
+from app import create_app, db  # noqa: E402
+from app.models import User, Exam, ExamSession, Event  # noqa: E402
+from app.services.metrics import Histogram  # noqa: E402
+from app.sockets.handlers import handle_behavior_batch, REPLAY_CONCURRENCY  # noqa: E402
+
+LATENCY_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+def _prepare(n_clients, already_stored):
+    """One in-progress session per client whose first events are already on the server"""
+    db.drop_all()
+    db.create_all()
+    db.session.execute(insert(User), [
+        {'name': f'Student {i}', 'email': f'replay{i}@exampulse.ai', 'password_hash': 'x', 'role': 'student'}
+        for i in range(n_clients)
+    ])
+    exam = Exam(name='Replay bench', duration_minutes=60, total_questions=10, created_by=1)
+    db.session.add(exam)
+    db.session.flush()
+    user_ids = db.session.execute(select(User.id)).scalars().all()
+    db.session.execute(insert(ExamSession), [
+        {'exam_id': exam.id, 'user_id': uid, 'status': 'in_progress', 'started_at': datetime.utcnow(),
+         'flagged_incidents_count': 0, 'last_event_seq': already_stored}
+        for uid in user_ids
+    ])
+    db.session.commit()
+    return exam.id, user_ids
+
+
+def _backlog(n_samples):
+    now = int(time.time() * 1000)
+    return [['mouse', now + i * 50, {'x': i % 1280, 'y': i % 720}] for i in range(n_samples)]
+
+
+def _client(app, exam_id, user_id, samples, barrier, latency, totals, lock):
+    payload = {'user_id': user_id, 'exam_id': exam_id, 'first_seq': 1, 'samples': samples, 'replay': True}
+    retries = 0
+    barrier.wait()
+    start = time.perf_counter()
+    while True:
+        with app.test_request_context():
+            ack = handle_behavior_batch(payload)
+            db.session.remove()
+        if ack['status'] != 'retry':
+            break
+        retries += 1
+        time.sleep(ack['retry_after_ms'] / 1000.0)
+    latency.observe((time.perf_counter() - start) * 1000)
+    with lock:
+        totals['retries'] += retries
+        totals['events'] += ack.get('stored', 0)
+        totals['acks'][ack['status']] = totals['acks'].get(ack['status'], 0) + 1
+
+
+def run_pass(app, label, exam_id, user_ids, samples):
+    latency = Histogram(LATENCY_BOUNDS_MS)
+    totals, lock = {'retries': 0, 'events': 0, 'acks': {}}, threading.Lock()
+    barrier = threading.Barrier(len(user_ids))
+    threads = [
+        threading.Thread(target=_client, args=(app, exam_id, uid, samples, barrier, latency, totals, lock))
+        for uid in user_ids
+    ]
+
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    stats = latency.snapshot()
+    # Percentiles are bucket upper bounds; never report one above the observed max
+    p50, p95, p99 = (min(stats[p], stats['max']) for p in ('p50', 'p95', 'p99'))
+    print(f"\n{label}")
+    print(f"  acks:        {totals['acks']}  (retries: {totals['retries']})")
+    print(f"  stored:      {totals['events']} events in {elapsed:.2f}s "
+          f"({totals['events'] / elapsed if elapsed else 0:.0f} events/s)")
+    print(f"  replay time: p50 {p50:.0f} ms, p95 {p95:.0f} ms, p99 {p99:.0f} ms, "
+          f"max {stats['max']:.0f} ms")
+    return totals
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark simultaneous reconnect replays')
+    parser.add_argument('--clients', type=int, default=1000, help='Students reconnecting at once (threads)')
+    parser.add_argument('--backlog', type=int, default=400, help='Samples replayed per client')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        already_stored = args.backlog // 2
+        exam_id, user_ids = _prepare(args.clients, already_stored)
+        samples = _backlog(args.backlog)
+        expected = args.clients * (args.backlog - already_stored)
+
+        print(f"{args.clients} clients each replaying {args.backlog} samples "
+              f"({already_stored} already stored), REPLAY_CONCURRENCY={REPLAY_CONCURRENCY}")
+        first = run_pass(app, 'Reconnect storm', exam_id, user_ids, samples)
+        second = run_pass(app, 'Duplicate replay (dedupe check)', exam_id, user_ids, samples)
+
+        events = db.session.execute(select(func.count(Event.id))).scalar()
+        ok = first['events'] == expected and second['events'] == 0 and events == expected
+        print(f"\nEvents stored: {events} (expected {expected}) -> {'OK' if ok else 'MISMATCH'}")
@@ -0,0 +1,87 @@
+# bench_telemetry_codec.py
+"""
+Size and parse-time benchmark: JSON session_data vs the EPT1 binary format
+
+Generates synthetic sessions with ml-model's BehaviorDataGenerator, encodes
+each one as JSON, EPT1 and EPT1+zlib, and times decoding into NumPy arrays
+(json.loads + np.asarray per array vs telemetry_codec.decode_session_data).
+
+    python bench_telemetry_codec.py
+    python bench_telemetry_codec.py --sessions 200 --duration 7200
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from app.services.telemetry_codec import encode_session_data, decode_session_data
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ml-model'))
+from synthetic_data_generator import BehaviorDataGenerator  # noqa: E402
+
+USER_TYPES = ['normal', 'copy_paste_cheater', 'tab_switcher', 'bot_assisted', 'collaborative_cheater']
+
+
+def json_to_arrays(text):
+    """What the server does with a JSON payload before feature extraction"""
+    session_data = json.loads(text)
+
+    def walk(value):
+        for key, item in value.items():
+            if isinstance(item, dict):
+                walk(item)
+            elif isinstance(item, list):
+                value[key] = np.asarray(item, dtype=np.float64)
+
+    walk(session_data)
+    return session_data
+
+
+def time_per_call(fn, payloads, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for payload in payloads:
+            fn(payload)
+        best = min(best, time.perf_counter() - start)
+    return best / len(payloads)
+
+
+def run(n_sessions, duration, repeat):
+    generator = BehaviorDataGenerator()
+    generator.exam_duration = duration
+    sessions = [generator.generate_user_session(USER_TYPES[i % len(USER_TYPES)]) for i in range(n_sessions)]
+
+    encodings = {
+        'json': [json.dumps(s).encode() for s in sessions],
+        'ept1': [encode_session_data(s, compress=False) for s in sessions],
+        'ept1+zlib': [encode_session_data(s, compress=True) for s in sessions],
+    }
+    decoders = {
+        'json': json_to_arrays,
+        'ept1': decode_session_data,
+        'ept1+zlib': decode_session_data,
+    }
+
+    json_bytes = sum(len(p) for p in encodings['json']) / n_sessions
+    json_time = None
+    print(f"{n_sessions} sessions, ~{duration // 60} min each\n")
+    print(f"{'format':<10} {'avg bytes':>12} {'vs json':>9} {'parse µs':>10} {'speed-up':>9}")
+    for name, payloads in encodings.items():
+        avg_bytes = sum(len(p) for p in payloads) / n_sessions
+        parse = time_per_call(decoders[name], payloads, repeat)
+        json_time = json_time or parse
+        print(f"{name:<10} {avg_bytes:>12,.0f} {avg_bytes / json_bytes:>8.1%} "
+              f"{parse * 1e6:>10.1f} {json_time / parse:>8.1f}×")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark telemetry encodings')
+    parser.add_argument('--sessions', type=int, default=50)
+    parser.add_argument('--duration', type=int, default=3600, help='Exam duration in seconds')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+    run(args.sessions, args.duration, args.repeat)
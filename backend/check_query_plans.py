@@ -0,0 +1,137 @@
+# check_query_plans.py
+"""
+Query plan regression check for the hot lookups.
+
+Captures the EXPLAIN plan of each hot query on the configured database
+(SQLite or PostgreSQL) and fails if any of them falls back to a full table
+scan, or needs an explicit sort for an ORDER BY that an index should serve.
+
+    python check_query_plans.py            # exits 1 on regression
+    python check_query_plans.py --verbose  # also prints the captured plans
+
+On PostgreSQL sequential scans and sorts are disabled for the check, so an
+empty or tiny table still reports whether an index *can* serve the query.
+"""
+import argparse
+import json
+import sys
+
+from sqlalchemy import text
+
+from app import create_app, db
+from app.models import ExamSession, Event, Alert
+
+# (name, query builder, table that must be reached through an index, ORDER BY served by index?)
+HOT_QUERIES = [
+    ('session_lookup',
+     lambda: ExamSession.query.filter_by(exam_id=1, user_id=1, status='in_progress'),
+     'exam_sessions', False),
+    ('in_progress_sessions_for_exam',
+     lambda: ExamSession.query.filter_by(exam_id=1, status='in_progress'),
+     'exam_sessions', False),
+    ('events_by_session_time',
+     lambda: Event.query.filter_by(session_id=1).order_by(Event.timestamp),
+     'events', True),
+    ('alerts_by_session_created',
+     lambda: Alert.query.filter_by(session_id=1).order_by(Alert.created_at),
+     'alerts', True),
+    ('unresolved_alerts_for_session',
+     lambda: Alert.query.filter(Alert.session_id == 1, Alert.resolved == db.false()).order_by(Alert.created_at),
+     'alerts', True),
+]
+
+
+def explain_sqlite(conn, query):
+    # Keep parameters bound, as at runtime: SQLite plans partial indexes differently for literals
+    compiled = query.statement.compile(dialect=db.engine.dialect)
+    params = tuple(compiled.params[name] for name in compiled.positiontup)
+    rows = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}', params).fetchall()
+    return [row[-1] for row in rows]
+
+
+def explain_postgresql(conn, query):
+    # psycopg2 interpolates parameters client-side, so the server plans literals anyway
+    sql = str(query.statement.compile(dialect=db.engine.dialect, compile_kwargs={'literal_binds': True}))
+    conn.execute(text('SET LOCAL enable_seqscan = off'))
+    conn.execute(text('SET LOCAL enable_sort = off'))
+    raw = conn.exec_driver_sql(f'EXPLAIN (FORMAT JSON) {sql}').scalar()
+    plan = raw if isinstance(raw, list) else json.loads(raw)
+
+    lines = []
+
+    def walk(node, depth=0):
+        relation = node.get('Relation Name')
+        index = node.get('Index Name')
+        label = node['Node Type']
+        if relation:
+            label += f" on {relation}"
+        if index:
+            label += f" using {index}"
+        lines.append('  ' * depth + label)
+        for child in node.get('Plans', []):
+            walk(child, depth + 1)
+
+    walk(plan[0]['Plan'])
+    return lines
+
+
+def find_problems(dialect, plan_lines, table, ordered):
+    problems = []
+    for line in plan_lines:
+        step = line.strip()
+        if dialect == 'sqlite':
+            # "SCAN events" is a full scan; "SEARCH events USING INDEX ..." is fine
+            if step.startswith(f'SCAN {table}') and 'USING' not in step:
+                problems.append(f'full scan: {step}')
+            if ordered and 'TEMP B-TREE' in step:
+                problems.append(f'sort not served by index: {step}')
+        else:
+            if step.startswith('Seq Scan') and step.endswith(table):
+                problems.append(f'sequential scan: {step}')
+            if ordered and step.startswith(('Sort', 'Incremental Sort')):
+                problems.append(f'sort not served by index: {step}')
+    return problems
+
+
+def check_query_plans(verbose=False):
+    """Return {query_name: [problems]} for the configured database"""
+    dialect = db.engine.dialect.name
+    if dialect not in ('sqlite', 'postgresql'):
+        raise SystemExit(f"Unsupported database dialect: {dialect}")
+    explain = explain_sqlite if dialect == 'sqlite' else explain_postgresql
+
+    results = {}
+    for name, build, table, ordered in HOT_QUERIES:
+        with db.engine.begin() as conn:
+            plan_lines = explain(conn, build())
+        results[name] = find_problems(dialect, plan_lines, table, ordered)
+
+        status = '✅' if not results[name] else '❌'
+        print(f"{status} {name}")
+        if verbose or results[name]:
+            for line in plan_lines:
+                print(f"      {line}")
+        for problem in results[name]:
+            print(f"    → {problem}")
+
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Fail if hot queries regress to table scans')
+    parser.add_argument('--verbose', action='store_true', help='Print every captured plan')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        db.create_all()
+        print(f"Checking query plans ({db.engine.dialect.name})...")
+        results = check_query_plans(verbose=args.verbose)
+
+    failures = [name for name, problems in results.items() if problems]
+    if failures:
+        print(f"\n❌ {len(failures)} hot quer{'y' if len(failures) == 1 else 'ies'} regressed: {', '.join(failures)}")
+        print("Run `python migrate_indexes.py` if the database predates the composite indexes.")
+        sys.exit(1)
+
+    print("\n✅ All hot queries are served by indexes")
@@ -4,7 +4,7 @@ Database initialization script
 Creates all tables defined in models
 """
 from app import create_app, db
-from app.models import User, Exam, ExamSession, Event, Alert, Baseline
+from app.models import User, Exam, ExamSession, Event, Alert, Baseline, ExamAnalytics, ExamAnalyticsBucket
 
 def init_db():
     """Initialize database with all tables"""
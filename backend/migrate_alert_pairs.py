@@ -0,0 +1,58 @@
+# migrate_alert_pairs.py
+"""
+Adds alerts.related_session_id: the other session of a pair alert.
+
+answer_collusion alerts (app/services/answer_similarity.py) are deduplicated
+on (session_id, related_session_id). Existing answer_collusion alerts get it
+from their message ("... matches session #N ..."), so reruns of the analysis
+still skip their pairs.
+
+Safe to run more than once.
+"""
+import re
+
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+OTHER_SESSION = re.compile(r'session #(\d+)')
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating alerts pair column ({dialect})...")
+        with db.engine.begin() as conn:
+            existing = {c['name'] for c in inspect(conn).get_columns('alerts')}
+            if 'related_session_id' in existing:
+                print("  - alerts.related_session_id already exists")
+            else:
+                conn.execute(text(
+                    'ALTER TABLE alerts ADD COLUMN related_session_id INTEGER '
+                    'REFERENCES exam_sessions(id) ON DELETE SET NULL'
+                ))
+                print("  ✓ Added alerts.related_session_id")
+
+            rows = conn.execute(text(
+                "SELECT id, message FROM alerts "
+                "WHERE alert_type = 'answer_collusion' AND related_session_id IS NULL"
+            )).all()
+            updates = []
+            for alert_id, message in rows:
+                match = OTHER_SESSION.search(message or '')
+                if match:
+                    updates.append({'id': alert_id, 'related': int(match.group(1))})
+            if updates:
+                conn.execute(text('UPDATE alerts SET related_session_id = :related WHERE id = :id'), updates)
+            print(f"  ✓ Backfilled {len(updates)} answer_collusion alerts")
+
+        print("✅ Alert pair migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,59 @@
+# migrate_baseline_stats.py
+"""
+Adds baselines.feature_stats (Welford count / mean / M2 per feature) and
+backfills it from the existing means in features and the metric columns.
+Also adds baselines.feature_model (packed personal anomaly model, filled
+as users record baseline sessions).
+
+Existing baselines only stored means, so their spread starts unknown
+(spread_count = 0); standard deviations appear once enough new samples
+arrive (baseline_utils.MIN_SPREAD_SAMPLES).
+
+Safe to run more than once.
+"""
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+from app.models import Baseline
+
+BASELINE_COLUMNS = {
+    'feature_stats': {'postgresql': 'JSONB', 'sqlite': 'JSON'},
+    'feature_model': {'postgresql': 'BYTEA', 'sqlite': 'BLOB'},
+}
+BATCH_SIZE = 500
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating baselines statistics columns ({dialect})...")
+        with db.engine.begin() as conn:
+            existing = {c['name'] for c in inspect(conn).get_columns('baselines')}
+            for column, types in BASELINE_COLUMNS.items():
+                if column in existing:
+                    print(f"  - baselines.{column} already exists")
+                else:
+                    conn.execute(text(f'ALTER TABLE baselines ADD COLUMN {column} {types[dialect]}'))
+                    print(f"  ✓ Added baselines.{column}")
+
+        backfilled = 0
+        while True:
+            baselines = Baseline.query.filter(Baseline.feature_stats.is_(None)).limit(BATCH_SIZE).all()
+            if not baselines:
+                break
+            for baseline in baselines:
+                baseline.feature_stats = baseline.current_stats()
+            db.session.commit()
+            backfilled += len(baselines)
+        print(f"  ✓ Backfilled {backfilled} baselines")
+
+        print("✅ Baseline statistics migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
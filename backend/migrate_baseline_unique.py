@@ -0,0 +1,54 @@
+# migrate_baseline_unique.py
+"""
+Makes baselines.user_id unique, so concurrent calibration jobs and baseline
+posts for the same user cannot create two rows (services/baseline_capture.py
+creates a missing row and falls back to the existing one on a conflict).
+
+Users with several rows keep the one with the most samples (the newest on a
+tie); the others are deleted. Their calibration sessions stay in
+baseline_samples, so `/<user_id>/refit` can rebuild the personal model.
+
+Safe to run more than once.
+"""
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+INDEX_NAME = 'ix_baselines_user_id'
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating baselines.user_id to unique ({dialect})...")
+        with db.engine.begin() as conn:
+            indexes = {index['name']: index for index in inspect(conn).get_indexes('baselines')}
+            if indexes.get(INDEX_NAME, {}).get('unique'):
+                print(f"  - {INDEX_NAME} is already unique")
+                return
+
+            removed = conn.execute(text(
+                'DELETE FROM baselines WHERE id NOT IN ('
+                ' SELECT id FROM ('
+                '  SELECT id, ROW_NUMBER() OVER ('
+                '   PARTITION BY user_id ORDER BY sample_count DESC, updated_at DESC, id DESC'
+                '  ) AS row_rank FROM baselines'
+                ' ) ranked WHERE row_rank = 1'
+                ')'
+            )).rowcount
+            print(f"  ✓ Removed {removed} duplicate baselines")
+
+            conn.execute(text(f'DROP INDEX IF EXISTS {INDEX_NAME}'))
+            conn.execute(text(f'CREATE UNIQUE INDEX {INDEX_NAME} ON baselines (user_id)'))
+            print(f"  ✓ Created unique index {INDEX_NAME}")
+
+        print("✅ Baseline uniqueness migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,69 @@
+# migrate_indexes.py
+"""
+Adds the composite and partial indexes for the hot lookups and drops the
+single-column indexes they make redundant.
+
+PostgreSQL indexes are built CONCURRENTLY so the migration can run against
+a live database. Safe to run more than once.
+"""
+from sqlalchemy import text
+from sqlalchemy.schema import CreateIndex
+
+from app import create_app, db
+from app.models import ExamSession, Event, Alert
+
+NEW_INDEXES = [
+    'ix_exam_sessions_lookup',
+    'ix_exam_sessions_exam_in_progress',
+    'ix_events_session_time',
+    'ix_alerts_session_created',
+    'ix_alerts_unresolved',
+]
+
+# Leading columns of the composites above
+REDUNDANT_INDEXES = [
+    'ix_exam_sessions_exam_id',
+    'ix_events_session_id',
+    'ix_alerts_session_id',
+]
+
+
+def _indexes_by_name():
+    indexes = {}
+    for model in (ExamSession, Event, Alert):
+        for index in model.__table__.indexes:
+            indexes[index.name] = index
+    return indexes
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        indexes = _indexes_by_name()
+
+        print(f"Creating hot-path indexes ({dialect})...")
+        # CONCURRENTLY cannot run inside a transaction block
+        with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+            for name in NEW_INDEXES:
+                ddl = str(CreateIndex(indexes[name], if_not_exists=True).compile(dialect=db.engine.dialect))
+                if dialect == 'postgresql':
+                    ddl = ddl.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1)
+                conn.execute(text(ddl))
+                print(f"  ✓ {name}")
+
+            for name in REDUNDANT_INDEXES:
+                drop = 'DROP INDEX CONCURRENTLY IF EXISTS' if dialect == 'postgresql' else 'DROP INDEX IF EXISTS'
+                conn.execute(text(f'{drop} {name}'))
+                print(f"  ✓ Dropped {name} (if present)")
+
+            # Refresh planner statistics so the new indexes are costed correctly
+            conn.execute(text('ANALYZE'))
+
+        print("✅ Index migration complete")
+        print("Run `python check_query_plans.py` to verify the hot queries use them.")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -0,0 +1,97 @@
+# migrate_json_columns.py
+"""
+Migrates JSON payload columns to native JSON storage and promotes hot
+event attributes (duration, count) into typed columns.
+
+PostgreSQL: converts the TEXT columns to JSONB and adds a GIN index on
+events.event_data.
+SQLite: the columns keep their JSON text storage (SQLAlchemy's JSON type
+reads it as-is); only the promoted columns are added and backfilled.
+
+Safe to run more than once.
+"""
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+JSON_COLUMNS = [
+    ('users', 'accommodations'),
+    ('exams', 'questions'),
+    ('exam_sessions', 'answers'),
+    ('events', 'event_data'),
+    ('baselines', 'features'),
+]
+
+PROMOTED_COLUMNS = [
+    # (column, SQL type per dialect, JSON key)
+    ('duration', {'postgresql': 'DOUBLE PRECISION', 'sqlite': 'FLOAT'}, 'duration'),
+    ('count', {'postgresql': 'INTEGER', 'sqlite': 'INTEGER'}, 'count'),
+]
+
+
+def _convert_to_jsonb(conn, inspector):
+    for table, column in JSON_COLUMNS:
+        current = {c['name']: c for c in inspector.get_columns(table)}[column]
+        if current['type'].__class__.__name__.upper() == 'JSONB':
+            print(f"  - {table}.{column} already JSONB")
+            continue
+        # Empty strings are not valid JSON; treat them as NULL
+        conn.execute(text(
+            f'ALTER TABLE {table} ALTER COLUMN {column} TYPE JSONB '
+            f"USING NULLIF({column}, '')::jsonb"
+        ))
+        print(f"  ✓ {table}.{column} → JSONB")
+
+    conn.execute(text(
+        'CREATE INDEX IF NOT EXISTS ix_events_event_data_gin ON events USING gin (event_data)'
+    ))
+
+
+def _add_promoted_columns(conn, inspector, dialect):
+    existing = {c['name'] for c in inspector.get_columns('events')}
+    for column, sql_types, _ in PROMOTED_COLUMNS:
+        if column in existing:
+            print(f"  - events.{column} already exists")
+            continue
+        conn.execute(text(f'ALTER TABLE events ADD COLUMN "{column}" {sql_types[dialect]}'))
+        print(f"  ✓ Added events.{column}")
+
+
+def _backfill_promoted_columns(conn, dialect):
+    for column, sql_types, key in PROMOTED_COLUMNS:
+        if dialect == 'postgresql':
+            stmt = (
+                f'UPDATE events SET "{column}" = (event_data->>\'{key}\')::{sql_types[dialect]} '
+                f'WHERE "{column}" IS NULL AND jsonb_typeof(event_data->\'{key}\') = \'number\''
+            )
+        else:
+            stmt = (
+                f'UPDATE events SET "{column}" = json_extract(event_data, \'$.{key}\') '
+                f'WHERE "{column}" IS NULL AND json_valid(event_data) '
+                f'AND json_type(event_data, \'$.{key}\') IN (\'integer\', \'real\')'
+            )
+        result = conn.execute(text(stmt))
+        print(f"  ✓ Backfilled events.{column} for {result.rowcount} row(s)")
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating JSON columns ({dialect})...")
+        with db.engine.begin() as conn:
+            inspector = inspect(conn)
+            if dialect == 'postgresql':
+                _convert_to_jsonb(conn, inspector)
+            _add_promoted_columns(conn, inspector, dialect)
+            _backfill_promoted_columns(conn, dialect)
+
+        print("✅ JSON column migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
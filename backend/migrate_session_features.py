@@ -0,0 +1,46 @@
+# migrate_session_features.py
+"""
+Adds the scored-behavior columns to exam_sessions:
+
+- feature_vector: the session's 40 extractor features (float32)
+- answer_timings: seconds spent per question (float32)
+
+Both are written when a session is scored with full telemetry and feed the
+per-exam similarity index (app/services/similarity_index.py).
+
+Safe to run more than once.
+"""
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+SESSION_COLUMNS = [
+    # (column, SQL type per dialect)
+    ('feature_vector', {'postgresql': 'BYTEA', 'sqlite': 'BLOB'}),
+    ('answer_timings', {'postgresql': 'BYTEA', 'sqlite': 'BLOB'}),
+]
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating exam_sessions behavior columns ({dialect})...")
+        with db.engine.begin() as conn:
+            existing = {c['name'] for c in inspect(conn).get_columns('exam_sessions')}
+            for column, sql_types in SESSION_COLUMNS:
+                if column in existing:
+                    print(f"  - exam_sessions.{column} already exists")
+                    continue
+                conn.execute(text(f'ALTER TABLE exam_sessions ADD COLUMN {column} {sql_types[dialect]}'))
+                print(f"  ✓ Added exam_sessions.{column}")
+
+        print("✅ Session behavior migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
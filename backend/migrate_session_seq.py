@@ -0,0 +1,45 @@
+# migrate_session_seq.py
+"""
+Adds the delivery sequence columns to exam_sessions:
+
+- last_batch_seq: highest behavior_batch stored per session, used to skip
+  batches the client resends after a lost ack
+- last_event_seq: highest client event seq stored per session, used to drop
+  already-stored events from reconnect replays
+
+Safe to run more than once.
+"""
+from sqlalchemy import inspect, text
+
+from app import create_app, db
+
+SESSION_COLUMNS = [
+    # (column, SQL type per dialect)
+    ('last_batch_seq', {'postgresql': 'BIGINT', 'sqlite': 'BIGINT'}),
+    ('last_event_seq', {'postgresql': 'BIGINT', 'sqlite': 'BIGINT'}),
+]
+
+
+def migrate():
+    app = create_app()
+
+    with app.app_context():
+        dialect = db.engine.dialect.name
+        if dialect not in ('postgresql', 'sqlite'):
+            raise SystemExit(f"Unsupported database dialect: {dialect}")
+
+        print(f"Migrating exam_sessions sequence columns ({dialect})...")
+        with db.engine.begin() as conn:
+            existing = {c['name'] for c in inspect(conn).get_columns('exam_sessions')}
+            for column, sql_types in SESSION_COLUMNS:
+                if column in existing:
+                    print(f"  - exam_sessions.{column} already exists")
+                    continue
+                conn.execute(text(f'ALTER TABLE exam_sessions ADD COLUMN {column} {sql_types[dialect]}'))
+                print(f"  ✓ Added exam_sessions.{column}")
+
+        print("✅ Session sequence migration complete")
+
+
+if __name__ == '__main__':
+    migrate()
@@ -1,5 +1,6 @@
 // src/api.js
 import axios from "axios";
+import { encodeSessionData, CONTENT_TYPE as TELEMETRY_CONTENT_TYPE } from "./behavior/telemetryCodec";
 
 const API = import.meta.env.VITE_API_BASE_URL || "http://localhost:5000";
 
@@ -52,6 +53,19 @@ export async function mergeBaseline(userId, features) {
   return postJson(`/api/baselines/${userId}/merge`, { features });
 }
 
+/**
+ * Raw calibration telemetry (a practice test's session_data) as EPT1 binary.
+ * The server extracts the 40 behavioral features off the request thread and
+ * answers 202 with a job to poll at /api/baselines/calibration/<job_id>.
+ */
+export async function submitCalibration(sessionData, token = localStorage.getItem("token")) {
+  const body = await encodeSessionData(sessionData);
+  const headers = { "Content-Type": TELEMETRY_CONTENT_TYPE };
+  if (token) headers.Authorization = `Bearer ${token}`;
+  const res = await axios.post(`${API}/api/baselines/calibration`, body, { headers });
+  return res.data;
+}
+
 export async function getBaseline(userId) {
   const res = await axios.get(`${API}/api/baselines/${userId}`);
   return res.data;
@@ -68,6 +82,7 @@ export default {
   sendKey,
   createBaseline,
   mergeBaseline,
+  submitCalibration,
   getBaseline,
   listBaselines
 };
@@ -0,0 +1,255 @@
+// src/behavior/batcher.js
+// Batches behavioral samples into `behavior_batch` socket messages.
+//
+// Samples are compact [type, ts_ms, {fields}] arrays, numbered with a
+// monotonic seq and kept in a backlog until the server acks them. A batch is the contiguous run of backlog samples starting
+// at first_seq; it is sent every FLUSH_INTERVAL_MS, when MAX_BATCH_SAMPLES are
+// queued, or right away for suspicious events. One batch is in flight at a
+// time. The server acks with acked_through and skips any seq it already has,
+// so resends and replays never duplicate events.
+//
+// While offline the backlog keeps growing. After a reconnect (or a reload)
+// the whole backlog is replayed in large `replay` batches, after a random
+// delay so a classroom reconnecting at once does not arrive in one burst.
+//
+// The backlog is saved to localStorage at most every PERSIST_INTERVAL_MS and
+// when the page is hidden. Each save appends only the samples added since the
+// last one, as a new chunk; acks remove the chunks they cover. A reload
+// restores the unacked samples from the chunks.
+//
+// Before submit_exam, await drainBatcher() so the server has every sample
+// when it scores the session.
+
+import { socket } from "../socket";
+
+const FLUSH_INTERVAL_MS = 1000;
+const MAX_BATCH_SAMPLES = 200;
+const MAX_REPLAY_SAMPLES = 5000; // behavior_ingest.MAX_SAMPLES_PER_REPLAY
+const MAX_BACKLOG = 20000; // oldest telemetry is dropped beyond this
+const ACK_TIMEOUT_MS = 5000;
+const RETRY_DELAY_MS = 2000;
+const REPLAY_JITTER_MS = 3000;
+const DRAIN_TIMEOUT_MS = 10000;
+const PERSIST_INTERVAL_MS = 5000;
+const TELEMETRY_TYPES = new Set(["typing", "mouse"]);
+
+let backlog = []; // [[seq, sample], ...], contiguous seqs
+let lastSeq = 0;
+let inFlight = null; // { first_seq, count }
+let replaying = false;
+let timerId = null;
+let currentUserId = null;
+let currentExamId = null;
+let drainWaiters = []; // resolve callbacks of pending drainBatcher() calls
+
+// The stored backlog belongs to the user / exam it was restored for; an ack
+// can arrive after stopBatcher()
+let storedUserId = null;
+let storedExamId = null;
+let chunks = []; // [[first seq, last seq], ...] saved under storageKey(`chunk_${first seq}`)
+let storedThrough = 0; // last seq saved in a chunk
+let storedAcked = 0; // seqs up to this one are not restored
+let lastPersist = 0;
+
+// seqs must keep increasing across page reloads for the same exam
+function storageKey(name) {
+  return `behavior_${name}:${storedUserId}:${storedExamId}`;
+}
+
+function writeChunks() {
+  localStorage.setItem(storageKey("chunks"), JSON.stringify(chunks));
+}
+
+// Removes the saved chunks whose samples are all acked (or dropped)
+function forgetThrough(seq) {
+  if (!storedUserId || seq <= storedAcked) return;
+  storedAcked = seq;
+  try {
+    localStorage.setItem(storageKey("acked"), String(seq));
+    const done = chunks.filter(([, last]) => last <= seq);
+    if (done.length) {
+      done.forEach(([first]) => localStorage.removeItem(storageKey(`chunk_${first}`)));
+      chunks = chunks.filter(([, last]) => last > seq);
+      writeChunks();
+    }
+  } catch (err) {
+    // Storage unavailable: restore() skips acked seqs anyway
+  }
+}
+
+function persist() {
+  if (!storedUserId) return;
+  lastPersist = Date.now();
+  forgetThrough((backlog.length ? backlog[0][0] : lastSeq + 1) - 1);
+  const start = backlog.length ? Math.max(0, storedThrough + 1 - backlog[0][0]) : 0;
+  try {
+    if (start < backlog.length) {
+      const first = backlog[start][0];
+      localStorage.setItem(storageKey(`chunk_${first}`), JSON.stringify(backlog.slice(start)));
+      chunks.push([first, lastSeq]);
+      writeChunks();
+      storedThrough = lastSeq;
+    }
+    localStorage.setItem(storageKey("seq"), String(lastSeq));
+  } catch (err) {
+    // Storage full: the in-memory backlog still survives a reconnect
+  }
+}
+
+function onPageHide() {
+  persist();
+}
+
+function onVisibilityChange() {
+  if (document.visibilityState === "hidden") persist();
+}
+
+function restore() {
+  storedUserId = currentUserId;
+  storedExamId = currentExamId;
+  storedAcked = Number(localStorage.getItem(storageKey("acked")) || 0);
+  lastSeq = Math.max(Number(localStorage.getItem(storageKey("seq")) || 0), storedAcked);
+  storedThrough = lastSeq;
+  lastPersist = Date.now();
+  backlog = [];
+  try {
+    chunks = JSON.parse(localStorage.getItem(storageKey("chunks")) || "[]");
+    chunks.forEach(([first]) => {
+      const samples = JSON.parse(localStorage.getItem(storageKey(`chunk_${first}`)) || "[]");
+      samples.forEach((entry) => {
+        if (entry[0] > storedAcked) backlog.push(entry);
+      });
+    });
+  } catch (err) {
+    chunks = [];
+    backlog = [];
+  }
+  if (backlog.length > MAX_BACKLOG) backlog = backlog.slice(backlog.length - MAX_BACKLOG);
+}
+
+function ackThrough(seq) {
+  let i = 0;
+  while (i < backlog.length && backlog[i][0] <= seq) i += 1;
+  if (i) backlog = backlog.slice(i);
+  forgetThrough(seq);
+  if (!backlog.length) {
+    drainWaiters.forEach((resolve) => resolve(true));
+    drainWaiters = [];
+  }
+}
+
+function send() {
+  if (inFlight || !backlog.length || !socket.connected || !currentUserId) return;
+  const count = Math.min(backlog.length, replaying ? MAX_REPLAY_SAMPLES : MAX_BATCH_SAMPLES);
+  const batch = { first_seq: backlog[0][0], count };
+  const userId = currentUserId;
+  const examId = currentExamId;
+  inFlight = batch;
+
+  const retry = (delay) =>
+    setTimeout(() => {
+      if (inFlight === batch) inFlight = null;
+      send();
+    }, delay);
+
+  socket.timeout(ACK_TIMEOUT_MS).emit(
+    "behavior_batch",
+    {
+      user_id: userId,
+      exam_id: examId,
+      first_seq: batch.first_seq,
+      samples: backlog.slice(0, count).map(([, sample]) => sample),
+      replay: replaying
+    },
+    (err, ack) => {
+      if (inFlight !== batch) return;
+      if (err) {
+        // No ack (timeout or disconnect): resend from the backlog
+        retry(RETRY_DELAY_MS);
+        return;
+      }
+      if (ack.status === "retry") {
+        // Server busy with other replays: back off as told
+        retry(ack.retry_after_ms || RETRY_DELAY_MS);
+        return;
+      }
+      if (ack.status === "error") {
+        // Resending would not help
+        console.warn("[batcher] batch rejected", ack.message);
+        ackThrough(batch.first_seq + count - 1);
+      } else {
+        // stored or duplicate: everything through acked_through is on the server
+        ackThrough(ack.acked_through ?? batch.first_seq + count - 1);
+      }
+      inFlight = null;
+      if (backlog.length <= MAX_BATCH_SAMPLES) replaying = false;
+      if (backlog.length) send();
+    }
+  );
+}
+
+function onConnect() {
+  if (!backlog.length) return;
+  inFlight = null;
+  replaying = true;
+  setTimeout(send, Math.random() * REPLAY_JITTER_MS);
+}
+
+export function flush() {
+  if (Date.now() - lastPersist >= PERSIST_INTERVAL_MS) persist();
+  if (!replaying) send();
+}
+
+export function pushSample(type, fields = {}, ts = Date.now()) {
+  if (!currentUserId) return;
+  lastSeq += 1;
+  backlog.push([lastSeq, [type, ts, fields]]);
+  if (backlog.length > MAX_BACKLOG) backlog = backlog.slice(backlog.length - MAX_BACKLOG);
+  if (!TELEMETRY_TYPES.has(type) || backlog.length >= MAX_BATCH_SAMPLES) flush();
+}
+
+export function startBatcher({ user_id, exam_id }) {
+  if (user_id !== currentUserId || exam_id !== currentExamId) {
+    persist();
+    currentUserId = user_id;
+    currentExamId = exam_id;
+    inFlight = null;
+    restore();
+    replaying = backlog.length > 0;
+  }
+  if (!timerId) timerId = setInterval(flush, FLUSH_INTERVAL_MS);
+  // Once, however often the batcher is restarted
+  socket.off("connect", onConnect);
+  socket.on("connect", onConnect);
+  window.addEventListener("pagehide", onPageHide);
+  document.addEventListener("visibilitychange", onVisibilityChange);
+  if (replaying) onConnect();
+}
+
+// Sends what is queued and resolves true once the server has acked all of
+// it, or false after timeoutMs (e.g. offline; the backlog stays stored)
+export function drainBatcher(timeoutMs = DRAIN_TIMEOUT_MS) {
+  flush();
+  if (!backlog.length) return Promise.resolve(true);
+  return new Promise((resolve) => {
+    const done = (drained) => {
+      clearTimeout(timeoutId);
+      drainWaiters = drainWaiters.filter((waiter) => waiter !== done);
+      resolve(drained);
+    };
+    const timeoutId = setTimeout(() => done(false), timeoutMs);
+    drainWaiters.push(done);
+  });
+}
+
+export function stopBatcher() {
+  flush();
+  persist();
+  if (timerId) clearInterval(timerId);
+  timerId = null;
+  socket.off("connect", onConnect);
+  window.removeEventListener("pagehide", onPageHide);
+  document.removeEventListener("visibilitychange", onVisibilityChange);
+  currentUserId = null;
+  currentExamId = null;
+}
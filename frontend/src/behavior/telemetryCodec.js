@@ -0,0 +1,126 @@
+// src/behavior/telemetryCodec.js
+// EPT1 binary encoder for session_data (decoder: backend/app/services/telemetry_codec.py).
+//
+// Numeric arrays become typed arrays, timestamp series become int32
+// millisecond deltas from their first timestamp (kept in the directory entry
+// as base), and the body is optionally deflate-compressed. Values that do not
+// fit int32 are sent as float64.
+// Use negotiateTelemetry() once per connection; fall back to JSON when the
+// server does not offer "ept1".
+
+import { socket } from "../socket";
+
+const MAGIC = [0x45, 0x50, 0x54, 0x31]; // "EPT1"
+const VERSION = 1;
+const FLAG_ZLIB = 0x01;
+const DELTA_FIELDS = new Set(["mouse.timestamps", "keyboard.timestamps", "tabs.switch_times"]);
+const fitsInt32 = (v) => v >= -2147483648 && v <= 2147483647;
+
+export const CONTENT_TYPE = "application/vnd.exampulse.telemetry";
+
+let negotiated = { format: "json", compression: "none" };
+
+export async function negotiateTelemetry() {
+  const supportsCompression = typeof CompressionStream !== "undefined";
+  try {
+    negotiated = await socket.timeout(5000).emitWithAck("negotiate_telemetry", {
+      formats: ["ept1", "json"],
+      compressions: supportsCompression ? ["zlib", "none"] : ["none"]
+    });
+  } catch (err) {
+    negotiated = { format: "json", compression: "none" };
+  }
+  return negotiated;
+}
+
+// [dtype, typed array, base]; base (first timestamp in ms) only for dms series
+function typedArrayFor(path, values) {
+  if (DELTA_FIELDS.has(path)) {
+    const millis = values.map((v) => Math.round(v * 1000));
+    const base = millis.length ? millis[0] : 0;
+    const deltas = millis.map((ms, i) => ms - (i ? millis[i - 1] : base));
+    if (deltas.every(fitsInt32)) return ["dms", Int32Array.from(deltas), base];
+    return ["f8", Float64Array.from(values)];
+  }
+  if (values.every(Number.isInteger)) {
+    if (values.every((v) => v >= 0 && v <= 255)) return ["u1", Uint8Array.from(values)];
+    if (values.every(fitsInt32)) return ["i4", Int32Array.from(values)];
+    return ["f8", Float64Array.from(values)];
+  }
+  return ["f4", Float32Array.from(values)];
+}
+
+function pad8(length) {
+  return (8 - (length % 8)) % 8;
+}
+
+async function deflate(bytes) {
+  // "deflate" here is the zlib-wrapped format Python's zlib.decompress expects
+  const stream = new Blob([bytes]).stream().pipeThrough(new CompressionStream("deflate"));
+  return new Uint8Array(await new Response(stream).arrayBuffer());
+}
+
+// Typed arrays use the platform byte order, which is little-endian in every browser we support
+export async function encodeSessionData(sessionData, { compress = true } = {}) {
+  const scalars = {};
+  const arrays = [];
+
+  const walk = (prefix, value) => {
+    if (Array.isArray(value) || ArrayBuffer.isView(value)) {
+      arrays.push([prefix, Array.from(value)]);
+    } else if (value !== null && typeof value === "object") {
+      Object.entries(value).forEach(([key, item]) => walk(prefix ? `${prefix}.${key}` : key, item));
+    } else {
+      scalars[prefix] = value;
+    }
+  };
+  walk("", sessionData);
+
+  const directory = [];
+  const chunks = [];
+  let offset = 0;
+  for (const [path, values] of arrays) {
+    const [dtype, typed, base] = typedArrayFor(path, values);
+    const bytes = new Uint8Array(typed.buffer, typed.byteOffset, typed.byteLength);
+    const entry = [path, dtype, typed.length, offset];
+    directory.push(base === undefined ? entry : [...entry, base]);
+    chunks.push(bytes, new Uint8Array(pad8(bytes.length)));
+    offset += bytes.length + pad8(bytes.length);
+  }
+
+  let meta = new TextEncoder().encode(JSON.stringify({ scalars, arrays: directory }));
+  const metaPadding = pad8(4 + meta.length);
+  if (metaPadding) {
+    const padded = new Uint8Array(meta.length + metaPadding).fill(0x20);
+    padded.set(meta);
+    meta = padded;
+  }
+
+  let body = new Uint8Array(4 + meta.length + offset);
+  new DataView(body.buffer).setUint32(0, meta.length, true);
+  body.set(meta, 4);
+  let position = 4 + meta.length;
+  for (const chunk of chunks) {
+    body.set(chunk, position);
+    position += chunk.length;
+  }
+
+  let flags = 0;
+  if (compress && typeof CompressionStream !== "undefined") {
+    body = await deflate(body);
+    flags |= FLAG_ZLIB;
+  }
+
+  const out = new Uint8Array(8 + body.length);
+  out.set(MAGIC, 0);
+  out[4] = VERSION;
+  out[5] = flags;
+  out.set(body, 8);
+  return out.buffer;
+}
+
+// session_data in whichever form was negotiated
+export async function packSessionData(sessionData) {
+  if (!sessionData || negotiated.format !== "ept1") return sessionData;
+  return encodeSessionData(sessionData, { compress: negotiated.compression === "zlib" });
+}
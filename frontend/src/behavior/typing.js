@@ -1,8 +1,7 @@
 // src/behavior/typing.js
 // Plain JS typing tracker (copy exactly)
 
-import { socket } from "../socket";
-import api from "../api";
+import { pushSample } from "./batcher";
 
 const SEND_INTERVAL_MS = 3000;
 const IDLE_TIMEOUT_MS = 2000;
@@ -49,30 +48,9 @@ async function sendTypingSample(){
   if (!running && idle) return;
 
   const wpm = computeWPM(WINDOW_MS);
-  const payload = {
-    user_id: currentUserId,
-    exam_id: currentExamId,
-    wpm,
-    ts: now(),
-    sample_window_ms: WINDOW_MS,
-    buffer_size: charBuffer.length
-  };
-
-  try {
-    if (socket && socket.connected) {
-      socket.emit("behavior_event", {
-        user_id: currentUserId,
-        exam_id: currentExamId,
-        event_type: "typing",
-        payload,
-        ts: payload.ts
-      });
-    } else if (api && typeof api.sendKey === "function"){
-      await api.sendKey({ user_id: currentUserId, exam_id: currentExamId, wpm, ts: payload.ts });
-    }
-  } catch (err) {
-    console.warn("typing send failed", err);
-  }
+
+  // Batched with the other behavioral samples (see batcher.js)
+  pushSample("typing", { wpm, sample_window_ms: WINDOW_MS, buffer_size: charBuffer.length });
 
   if (idle) running = false;
 }
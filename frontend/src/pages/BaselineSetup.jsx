@@ -2,6 +2,7 @@
 import React, { useState } from "react";
 import { useNavigate } from "react-router-dom";
 import Header from "../components/Header"; // Assuming Header is a DaisyUI-styled component
+import { submitCalibration } from "../api";
 
 export default function BaselineSetup() {
     const navigate = useNavigate();
@@ -13,6 +14,11 @@ export default function BaselineSetup() {
 
         // Mock test simulation
         setTimeout(() => {
+            // Send the practice test's raw telemetry for feature extraction (if a tracker produced one)
+            if (window.__examBehaviorSnapshot__) {
+                submitCalibration(window.__examBehaviorSnapshot__)
+                    .catch(err => console.warn("Calibration upload failed", err));
+            }
             setTestsCompleted(prev => prev + 1);
             setCurrentTest(null);
 
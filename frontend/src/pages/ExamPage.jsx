@@ -3,6 +3,8 @@ import React, { useState, useEffect } from "react";
 import { useNavigate } from "react-router-dom";
 import { socket } from "../socket";
 import { startTypingTracker, stopTypingTracker } from "../behavior/typing";
+import { startBatcher, stopBatcher, drainBatcher, pushSample } from "../behavior/batcher";
+import { negotiateTelemetry, packSessionData } from "../behavior/telemetryCodec";
 
 const MOCK_QUESTIONS = [
   {
@@ -63,6 +65,10 @@ export default function ExamPage() {
   session_data: window.__examBehaviorSnapshot__ // for example – whatever your tracker produces
 });
 
+    // Behavioral samples go out in acked batches
+    startBatcher({ user_id: userId, exam_id: examId });
+    negotiateTelemetry();
+
     // 🔥 START TYPING TRACKER
     startTypingTracker({
       user_id: userId,
@@ -91,23 +97,8 @@ export default function ExamPage() {
         setIncidents(prev => [...prev, incident]);
         setTabSwitches(prev => prev + 1);
 
-        // Emit via socket
-        socket.emit("suspicious_activity", {
-          user_id: userId,
-          exam_id: examId,
-          type: "tab_switch",
-          count: tabSwitches + 1,
-          timestamp: incident.timestamp
-        });
-
-        // Also emit as behavior_event for consistency
-        socket.emit("behavior_event", {
-          user_id: userId,
-          exam_id: examId,
-          event_type: "tab_switch",
-          payload: { count: tabSwitches + 1 },
-          ts: Date.now()
-        });
+        // Batched and acked (flushed right away for suspicious events)
+        pushSample("tab_switch", { count: tabSwitches + 1 });
 
         if (tabSwitches + 1 === 3) {
           // Use a DaisyUI alert or toast later, but keeping the alert for now
@@ -125,13 +116,7 @@ export default function ExamPage() {
       };
       setIncidents(prev => [...prev, incident]);
 
-      socket.emit("behavior_event", {
-        user_id: userId,
-        exam_id: examId,
-        event_type: "right_click",
-        payload: {},
-        ts: Date.now()
-      });
+      pushSample("right_click");
 
       alert("Right-click is disabled during the exam.");
     };
@@ -145,13 +130,7 @@ export default function ExamPage() {
       };
       setIncidents(prev => [...prev, incident]);
 
-      socket.emit("behavior_event", {
-        user_id: userId,
-        exam_id: examId,
-        event_type: "copy_attempt",
-        payload: {},
-        ts: Date.now()
-      });
+      pushSample("copy_attempt");
 
       alert("⚠️ Copy operations are not allowed during the exam.");
     };
@@ -165,13 +144,7 @@ export default function ExamPage() {
       };
       setIncidents(prev => [...prev, incident]);
 
-      socket.emit("behavior_event", {
-        user_id: userId,
-        exam_id: examId,
-        event_type: "paste_attempt",
-        payload: {},
-        ts: Date.now()
-      });
+      pushSample("paste_attempt");
 
       alert("⚠️ Paste operations are not allowed during the exam.");
     };
@@ -189,6 +162,7 @@ export default function ExamPage() {
       // 🔥 STOP TYPING TRACKER
       stopTypingTracker();
       console.log("✅ Typing tracker stopped");
+      stopBatcher();
 
       // Remove event listeners
       document.removeEventListener("visibilitychange", handleVisibilityChange);
@@ -221,12 +195,15 @@ export default function ExamPage() {
     setFlagged(newFlagged);
   };
 
-  const handleSubmit = () => {
+  const handleSubmit = async () => {
     // Close modal if open
     document.getElementById('submit_modal').close();
 
-    // Stop typing tracker before submitting
+    // Stop typing tracker before submitting; the server must have every
+    // queued sample (acked) before it scores the submission
     stopTypingTracker();
+    await drainBatcher();
+    stopBatcher();
 
     socket.emit("submit_exam", {
       user_id: userId,
@@ -235,7 +212,8 @@ export default function ExamPage() {
       incidents,
       time_taken: 1800 - timeLeft,
       timestamp: new Date().toISOString(),
-      session_data: window.__examBehaviorSnapshot__ // for example – whatever your tracker produces
+      // binary EPT1 when the server negotiated it (see telemetryCodec.js)
+      session_data: await packSessionData(window.__examBehaviorSnapshot__)
     });
 
     navigate("/exam-submitted");
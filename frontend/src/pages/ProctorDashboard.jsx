@@ -3,6 +3,7 @@ import React, { useState, useEffect } from "react";
 import Header from "../components/Header";
 import RiskScoreIndicator from "../components/RiskScoreIndicator"; // Assuming this component is styled appropriately or uses generic classes
 import { socket } from "../socket";
+import { subscribeRoster } from "../roster";
 
 const MOCK_STUDENTS = [
     { id: 1, name: "Alice Johnson", progress: 75, riskScore: 0.12, incidents: 0, status: "normal" },
@@ -18,13 +19,43 @@ export default function ProctorDashboard() {
     useEffect(() => {
         socket.emit("join_exam", { user_id: "proctor_1", exam_id: "exam_123", role: "proctor" });
 
-        socket.on("student_alert", (data) => {
+        const onStudentAlert = (data) => {
             console.log("Alert received:", data);
-        });
+        };
 
-        socket.on("risk_update", (data) => {
+        const onRiskUpdate = (data) => {
             console.log("Risk update:", data);
+        };
+
+        // Coalesced activity: one batch per interval with only the changed sessions.
+        // Acking lets the server send the next batch (per-client backpressure).
+        const onActivityBatch = (batch, ack) => {
+            console.log("Activity batch:", batch.seq, batch.sessions);
+            if (ack) ack(batch.seq);
+        };
+
+        const onHighRiskAlert = (data) => {
+            console.log("High risk alert:", data);
+        };
+
+        socket.on("student_alert", onStudentAlert);
+        socket.on("risk_update", onRiskUpdate);
+        socket.on("student_activity_batch", onActivityBatch);
+        socket.on("high_risk_alert", onHighRiskAlert);
+
+        // Live roster: one snapshot, then deltas (joined / left / risk changed)
+        const unsubscribeRoster = subscribeRoster("exam_123", (roster) => {
+            console.log("Active students:", roster.length);
         });
+
+        // StrictMode runs the effect twice: without these, every batch would be handled (and acked) twice
+        return () => {
+            socket.off("student_alert", onStudentAlert);
+            socket.off("risk_update", onRiskUpdate);
+            socket.off("student_activity_batch", onActivityBatch);
+            socket.off("high_risk_alert", onHighRiskAlert);
+            unsubscribeRoster();
+        };
     }, []);
     // ----------------------------------------
 
@@ -0,0 +1,64 @@
+// src/roster.js
+import { socket } from "./socket";
+
+// Subscribe to an exam's active-student roster.
+// The server sends one roster_snapshot, then versioned roster_delta events;
+// on a version gap we re-subscribe for a fresh snapshot.
+// onChange receives the current list of students. Returns an unsubscribe function.
+export function subscribeRoster(examId, onChange) {
+  let version = null;
+  let students = new Map();
+
+  const publish = () => onChange(Array.from(students.values()));
+
+  const resync = () => {
+    version = null;
+    socket.emit("subscribe_roster", { exam_id: examId });
+  };
+
+  const onSnapshot = (snapshot) => {
+    if (String(snapshot.exam_id) !== String(examId)) return;
+    version = snapshot.version;
+    students = new Map(snapshot.students.map((s) => [s.session_id, s]));
+    publish();
+  };
+
+  const onDelta = (delta) => {
+    if (String(delta.exam_id) !== String(examId) || version === null) return;
+    if (delta.version <= version) return; // already covered by the snapshot
+    if (delta.version !== version + 1) {
+      resync();
+      return;
+    }
+    version = delta.version;
+    for (const change of delta.changes) {
+      if (change.op === "joined") {
+        students.set(change.student.session_id, change.student);
+      } else if (change.op === "left") {
+        students.delete(change.session_id);
+      } else if (change.op === "risk") {
+        const student = students.get(change.session_id);
+        if (student) {
+          students.set(change.session_id, {
+            ...student,
+            risk_score: change.risk_score,
+            integrity_score: change.integrity_score,
+            incidents_count: change.incidents_count
+          });
+        }
+      }
+    }
+    publish();
+  };
+
+  socket.on("roster_snapshot", onSnapshot);
+  socket.on("roster_delta", onDelta);
+  socket.on("connect", resync);
+  resync();
+
+  return () => {
+    socket.off("roster_snapshot", onSnapshot);
+    socket.off("roster_delta", onDelta);
+    socket.off("connect", resync);
+  };
+}
@@ -7,7 +7,12 @@ const WS_BASE = import.meta.env.VITE_WS_URL || "http://localhost:5000";
 export const socket = io(WS_BASE, {
   transports: ["websocket", "polling"],
   autoConnect: true,
-  reconnectionAttempts: 3
+  // Keep retrying through long outages; the randomized, capped backoff spreads
+  // a room's reconnects out instead of having every client retry in lockstep
+  reconnectionAttempts: Infinity,
+  reconnectionDelay: 1000,
+  reconnectionDelayMax: 30000,
+  randomizationFactor: 0.5
 });
 
 socket.on("connect", () => console.log("[socket] connected", socket.id));
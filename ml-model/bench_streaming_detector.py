@@ -0,0 +1,99 @@
+"""
+Streaming Detector Benchmark
+Compares HalfSpaceTrees with the Isolation Forest on the synthetic cheater types:
+ROC-AUC per type, training time, scoring time, cost of one incremental update
+and model size
+
+    python bench_streaming_detector.py [--normal 1500] [--per-type 100]
+"""
+
+import argparse
+import io
+import time
+
+import joblib
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from feature_extractor import BehaviorFeatureExtractor
+from model_trainer import AnomalyDetectionTrainer, DETECTORS
+from production_retrain import CHEATER_TYPES
+from synthetic_data_generator import BehaviorDataGenerator
+
+
+def features(generator: BehaviorDataGenerator, user_type: str, n: int) -> np.ndarray:
+    extractor = BehaviorFeatureExtractor()
+    return np.nan_to_num(np.array(
+        [extractor.extract_all_features(generator.generate_user_session(user_type)) for _ in range(n)]
+    ))
+
+
+def model_size(model) -> int:
+    buffer = io.BytesIO()
+    joblib.dump(model, buffer)
+    return buffer.tell()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark HalfSpaceTrees against IsolationForest')
+    parser.add_argument('--normal', type=int, default=1500, help='Normal training sessions')
+    parser.add_argument('--per-type', type=int, default=100, help='Test sessions per cheater type')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f"Generating {args.normal} normal training sessions, {args.normal // 4} normal test sessions "
+          f"and {args.per_type} per cheater type...")
+    start = time.perf_counter()
+    generator = BehaviorDataGenerator(seed=args.seed)
+    X_train = features(generator, 'normal', args.normal)
+    X_normal = features(generator, 'normal', args.normal // 4)
+    X_cheaters = {t: features(generator, t, args.per_type) for t in CHEATER_TYPES}
+    print(f"✓ Features extracted in {time.perf_counter() - start:.1f}s")
+
+    rows = {}
+    for detector in DETECTORS:
+        trainer = AnomalyDetectionTrainer(contamination=0.05, random_state=args.seed, detector=detector)
+        start = time.perf_counter()
+        trainer.model.fit(trainer.scaler.fit_transform(X_train))
+        fit_seconds = time.perf_counter() - start
+
+        X_all = np.vstack([X_normal] + list(X_cheaters.values()))
+        start = time.perf_counter()
+        scores = -trainer.model.score_samples(trainer.scaler.transform(X_all))
+        score_us = (time.perf_counter() - start) / len(X_all) * 1e6
+        normal_scores, offset = scores[:len(X_normal)], len(X_normal)
+
+        aucs = {}
+        for user_type, X in X_cheaters.items():
+            cheater_scores = scores[offset:offset + len(X)]
+            offset += len(X)
+            labels = np.r_[np.zeros(len(normal_scores)), np.ones(len(cheater_scores))]
+            aucs[user_type] = roc_auc_score(labels, np.r_[normal_scores, cheater_scores])
+
+        # One session at a time, as the backend learns after each submission
+        update_us = None
+        if hasattr(trainer.model, 'partial_fit'):
+            start = time.perf_counter()
+            for vector in X_normal:
+                trainer.update(vector.reshape(1, -1))
+            update_us = (time.perf_counter() - start) / len(X_normal) * 1e6
+
+        rows[detector] = dict(aucs, fit=fit_seconds, score_us=score_us, update_us=update_us,
+                              size_kb=model_size(trainer.model) / 1024)
+
+    print()
+    print(f"{'':30s}" + ''.join(f"{d:>20s}" for d in DETECTORS))
+    for user_type in CHEATER_TYPES:
+        print(f"ROC-AUC {user_type:22s}" + ''.join(f"{rows[d][user_type]:20.3f}" for d in DETECTORS))
+    mean_auc = {d: np.mean([rows[d][t] for t in CHEATER_TYPES]) for d in DETECTORS}
+    print(f"{'ROC-AUC mean':30s}" + ''.join(f"{mean_auc[d]:20.3f}" for d in DETECTORS))
+    print(f"{'fit (s)':30s}" + ''.join(f"{rows[d]['fit']:20.2f}" for d in DETECTORS))
+    print(f"{'score (µs/session)':30s}" + ''.join(f"{rows[d]['score_us']:20.1f}" for d in DETECTORS))
+    print(f"{'update (µs/session)':30s}" + ''.join(
+        f"{rows[d]['update_us']:20.1f}" if rows[d]['update_us'] is not None else f"{'retrain':>20s}"
+        for d in DETECTORS))
+    print(f"{'model size (KB)':30s}" + ''.join(f"{rows[d]['size_kb']:20.0f}" for d in DETECTORS))
+
+
+if __name__ == "__main__":
+    main()
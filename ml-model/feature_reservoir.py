@@ -0,0 +1,166 @@
+"""
+Feature Reservoir for Production Retraining
+Bounded, memory-mapped reservoir sample of session feature vectors on disk
+"""
+
+import os
+import struct
+from typing import Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one writer process only
+    fcntl = None
+
+
+MAGIC = b'EFR1'
+# magic, version, n_features, capacity, feature layout id, sessions seen
+HEADER = struct.Struct('<4sHHIIQ')
+HEADER_SIZE = 64  # rows start here (room to grow the header)
+SEEN_OFFSET = struct.calcsize('<4sHHII')
+
+
+class FeatureReservoir:
+    """
+    Uniform sample of at most `capacity` feature vectors out of every vector
+    ever added (reservoir sampling, Algorithm R), kept in one file:
+
+        64-byte header | capacity x (n_features + 1) float32 rows
+
+    The extra column holds a per-session value stored with the vector (the
+    backend uses the final risk score, nan if unknown). Rows are read and
+    written through np.memmap, so adding a vector is a single row store and
+    the file never has to fit in memory. The count of vectors seen lives in
+    the header, so sampling continues correctly across restarts and across
+    the processes that share the file (writes are serialized with flock).
+    """
+
+    def __init__(self, path: str, n_features: int, capacity: int = 100000,
+                 layout_id: int = 0, readonly: bool = False, seed: Optional[int] = None):
+        """
+        Args:
+            path: Reservoir file; created if missing (unless readonly)
+            n_features: Feature vector length
+            capacity: Maximum number of rows kept
+            layout_id: Identifies the feature order; a file with another layout is rejected
+            readonly: Open for reading only (training)
+            seed: Random seed for replacement positions
+        """
+        self.path = path
+        self.readonly = readonly
+        self.rng = np.random.default_rng(seed)
+
+        if not os.path.exists(path):
+            if readonly:
+                raise FileNotFoundError(path)
+            self._create(path, n_features, capacity, layout_id)
+
+        with open(path, 'rb') as f:
+            magic, _, n_file, capacity_file, layout_file, _ = HEADER.unpack(f.read(HEADER.size))
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a feature reservoir")
+        if n_file != n_features or layout_file != layout_id:
+            raise ValueError(f"{path} holds another feature layout ({n_file} features, layout {layout_file})")
+
+        self.n_features = n_file
+        self.capacity = capacity_file
+        self.layout_id = layout_file
+        mode = 'r' if readonly else 'r+'
+        self._rows = np.memmap(path, dtype='<f4', mode=mode, offset=HEADER_SIZE,
+                               shape=(self.capacity, self.n_features + 1))
+        self._seen = np.memmap(path, dtype='<u8', mode=mode, offset=SEEN_OFFSET, shape=(1,))
+        self._lock_file = None if readonly else open(path, 'rb')
+
+    @staticmethod
+    def _create(path: str, n_features: int, capacity: int, layout_id: int):
+        """Write the header and size the file (sparse where the filesystem allows)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(HEADER.pack(MAGIC, 1, n_features, capacity, layout_id, 0).ljust(HEADER_SIZE, b'\0'))
+            f.truncate(HEADER_SIZE + capacity * (n_features + 1) * 4)
+        # Another process may have created it meanwhile; keep the first one
+        if os.path.exists(path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, path)
+
+    @property
+    def seen(self) -> int:
+        """Vectors ever added"""
+        return int(self._seen[0])
+
+    def __len__(self) -> int:
+        return min(self.seen, self.capacity)
+
+    def add(self, vectors: np.ndarray, values: Optional[np.ndarray] = None) -> int:
+        """
+        Offer vectors (one row each) to the sample.
+
+        Returns:
+            Number of vectors stored (the rest were not sampled)
+        """
+        vectors = np.atleast_2d(np.asarray(vectors, dtype=np.float32))
+        if vectors.shape[1] != self.n_features:
+            raise ValueError(f"expected {self.n_features} features, got {vectors.shape[1]}")
+        values = np.full(len(vectors), np.nan, dtype=np.float32) if values is None else np.asarray(values, dtype=np.float32)
+
+        self._lock()
+        try:
+            seen = self.seen
+            stored = 0
+            for vector, value in zip(vectors, values):
+                # Algorithm R: the n-th vector (0-based) replaces a random row
+                # with probability capacity / (n + 1)
+                slot = seen if seen < self.capacity else int(self.rng.integers(0, seen + 1))
+                if slot < self.capacity:
+                    self._rows[slot, :-1] = vector
+                    self._rows[slot, -1] = value
+                    stored += 1
+                seen += 1
+            self._seen[0] = seen
+        finally:
+            self._unlock()
+        return stored
+
+    def rows(self) -> np.ndarray:
+        """Filled rows as a read-through memmap view, features then value column (no copy)"""
+        return self._rows[:len(self)]
+
+    def features(self) -> np.ndarray:
+        """Feature columns of the filled rows (memmap view, no copy)"""
+        return self._rows[:len(self), :-1]
+
+    def values(self) -> np.ndarray:
+        return self._rows[:len(self), -1]
+
+    def flush(self):
+        if not self.readonly:
+            self._rows.flush()
+            self._seen.flush()
+
+    def close(self):
+        self.flush()
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+
+    def _lock(self):
+        if fcntl is not None and self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+
+    def _unlock(self):
+        if fcntl is not None and self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def stats(self) -> dict:
+        return {
+            'path': self.path,
+            'capacity': self.capacity,
+            'rows': len(self),
+            'seen': self.seen,
+            'n_features': self.n_features,
+            'size_mb': round(os.path.getsize(self.path) / 1e6, 2)
+        }
@@ -1,6 +1,7 @@
 """
 Model Trainer for Behavioral Anomaly Detection
-Trains Isolation Forest on synthetic data and provides evaluation metrics
+Trains Isolation Forest (or streaming Half-Space Trees) on synthetic data
+and provides evaluation metrics
 """
 
 import numpy as np
@@ -16,40 +17,67 @@ from sklearn.metrics import (
     precision_recall_curve,
     auc
 )
-from typing import Dict, Tuple
-import matplotlib
-matplotlib.use('Agg')  # Non-interactive backend
-import matplotlib.pyplot as plt
+from typing import Dict, Iterable, Iterator, Optional, Tuple
+try:
+    import matplotlib
+    matplotlib.use('Agg')  # Non-interactive backend
+    import matplotlib.pyplot as plt
+except ImportError:  # plotting is optional; the backend's retraining process runs without it
+    plt = None
 
 from synthetic_data_generator import BehaviorDataGenerator
 from feature_extractor import BehaviorFeatureExtractor
+from streaming_detector import HalfSpaceTrees
+
+DETECTORS = ('isolation_forest', 'half_space_trees')
+
+# Out-of-core training: rows scaled and scored at a time, and the most rows
+# the detector is fitted on (the Isolation Forest draws 256 per tree)
+CHUNK_ROWS = 65536
+FIT_ROWS = 200000
 
 
 class AnomalyDetectionTrainer:
     """
     Trains and evaluates an Isolation Forest model for detecting cheating behavior.
+    With detector='half_space_trees' it trains the streaming HalfSpaceTrees
+    ensemble instead, which can keep learning afterwards through update().
     """
     
-    def __init__(self, contamination: float = 0.15, random_state: int = 42):
+    def __init__(self, contamination: float = 0.15, random_state: int = 42,
+                 detector: str = 'isolation_forest'):
         """
         Args:
             contamination: Expected proportion of anomalies in dataset
             random_state: Random seed for reproducibility
+            detector: 'isolation_forest' or 'half_space_trees'
         """
+        if detector not in DETECTORS:
+            raise ValueError(f"Unknown detector {detector!r}, expected one of {DETECTORS}")
         self.contamination = contamination
         self.random_state = random_state
+        self.detector = detector
         
         self.scaler = StandardScaler()
-        self.model = IsolationForest(
-            contamination=contamination,
-            random_state=random_state,
-            n_estimators=150,
-            max_samples='auto',
-            max_features=1.0,
-            bootstrap=False,
-            n_jobs=-1,
-            verbose=0
-        )
+        if detector == 'half_space_trees':
+            self.model = HalfSpaceTrees(
+                n_estimators=25,
+                max_depth=10,
+                window_size=256,
+                contamination=contamination,
+                random_state=random_state
+            )
+        else:
+            self.model = IsolationForest(
+                contamination=contamination,
+                random_state=random_state,
+                n_estimators=150,
+                max_samples='auto',
+                max_features=1.0,
+                bootstrap=False,
+                n_jobs=-1,
+                verbose=0
+            )
         
         self.feature_extractor = BehaviorFeatureExtractor()
         self.feature_names = []
@@ -81,10 +109,106 @@ class AnomalyDetectionTrainer:
         
         return X, y, user_ids
     
-    def train(self, X_train: np.ndarray, y_train: np.ndarray) -> Dict:
+    def prepare_memmap(self, sessions: Iterable[Dict], n_sessions: int,
+                       features_path: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Extract features from a stream of sessions straight into a float32
+        .npy file on disk, for datasets too large for prepare_data. Only one
+        session is in memory at a time; the matrix is returned memory-mapped
+        (reopen it later with np.load(features_path, mmap_mode='r')).
+        
+        Args:
+            sessions: Iterable of labeled sessions (e.g. BehaviorDataGenerator.iter_dataset)
+            n_sessions: Number of sessions the iterable yields
+            features_path: Output .npy file
+        
+        Returns:
+            X: Memory-mapped feature matrix (float32)
+            y: Labels (0=normal, 1=anomaly)
+        """
+        print("\n" + "="*60)
+        print("DATA PREPARATION (out-of-core)")
+        print("="*60)
+        
+        X = None
+        y = np.zeros(n_sessions, dtype=np.int8)
+        n = 0
+        for n, session in enumerate(sessions):
+            features = self.feature_extractor.extract_all_features(session)
+            if X is None:
+                X = np.lib.format.open_memmap(features_path, mode='w+', dtype=np.float32,
+                                              shape=(n_sessions, len(features)))
+            X[n] = features
+            y[n] = session['label']
+            if (n + 1) % 100000 == 0:
+                print(f"  Processed {n + 1}/{n_sessions} sessions")
+        if X is None or n + 1 != n_sessions:
+            raise ValueError(f"expected {n_sessions} sessions, got {0 if X is None else n + 1}")
+        X.flush()
+        self.feature_names = self.feature_extractor.get_feature_names()
+        
+        print(f"\n✓ Prepared data: {X.shape[0]} samples, {X.shape[1]} features in {features_path}")
+        print(f"  - Normal samples: {np.sum(y == 0)}")
+        print(f"  - Anomalous samples: {np.sum(y == 1)}")
+        
+        return X, y
+    
+    def _chunks(self, X: np.ndarray, rows: Optional[np.ndarray] = None,
+                scale: bool = True) -> Iterator[np.ndarray]:
+        """
+        Rows of X (all, or the given row indices) in float32 chunks of
+        CHUNK_ROWS, scaled unless scale=False. Only one chunk is in memory at
+        a time, so X can be a memmap larger than RAM.
+        """
+        n = len(X) if rows is None else len(rows)
+        for start in range(0, n, CHUNK_ROWS):
+            if rows is None:
+                chunk = np.asarray(X[start:start + CHUNK_ROWS], dtype=np.float32)
+            else:
+                chunk = np.asarray(X[rows[start:start + CHUNK_ROWS]], dtype=np.float32)
+            chunk = np.nan_to_num(chunk)
+            yield self.scaler.transform(chunk) if scale else chunk
+    
+    def fit(self, X: np.ndarray, rows: Optional[np.ndarray] = None):
+        """
+        Fit the scaler and the detector out-of-core.
+        
+        The scaler is fitted with partial_fit, chunk by chunk. The detector is
+        fitted on a random subset of at most FIT_ROWS scaled rows, in random
+        order: the Isolation Forest only draws max_samples (256) rows per tree
+        anyway, and Half-Space Trees keep only their last window, which must
+        not depend on how the dataset happens to be sorted.
+        
+        Args:
+            X: Feature matrix (array or memmap)
+            rows: Indices of the training rows (default: all); sorted keeps reads sequential
+        """
+        self.scaler = StandardScaler()
+        for chunk in self._chunks(X, rows, scale=False):
+            self.scaler.partial_fit(chunk)
+        
+        n = len(X) if rows is None else len(rows)
+        rng = np.random.default_rng(self.random_state)
+        positions = rng.permutation(n)[:FIT_ROWS]
+        subset = positions if rows is None else np.asarray(rows)[positions]
+        self.model.fit(self.scaler.transform(np.nan_to_num(np.asarray(X[subset], dtype=np.float32))))
+    
+    def anomaly_scores(self, X: np.ndarray, rows: Optional[np.ndarray] = None) -> np.ndarray:
+        """Anomaly scores (higher = more anomalous), computed in chunks"""
+        return -np.concatenate([self.model.score_samples(chunk) for chunk in self._chunks(X, rows)])
+    
+    def _predictions(self, scores: np.ndarray) -> np.ndarray:
+        """1 = anomaly; equivalent to model.predict without a second pass over the data"""
+        return (-scores < self.model.offset_).astype(int)
+    
+    def train(self, X_train: np.ndarray, y_train: np.ndarray,
+              rows: Optional[np.ndarray] = None) -> Dict:
         """
         Train the Isolation Forest model.
         
+        Args:
+            rows: Indices of the training rows of X_train and y_train (default: all)
+        
         Returns:
             Training metrics
         """
@@ -92,22 +216,17 @@ class AnomalyDetectionTrainer:
         print("MODEL TRAINING")
         print("="*60)
         
-        # Standardize features
-        print("Standardizing features...")
-        X_train_scaled = self.scaler.fit_transform(X_train)
-        
-        # Train model
-        print(f"Training Isolation Forest (n_estimators=150, contamination={self.contamination})...")
-        self.model.fit(X_train_scaled)
+        # Standardize features and train model
+        print(f"Training {type(self.model).__name__} (n_estimators={self.model.n_estimators}, "
+              f"contamination={self.contamination})...")
+        self.fit(X_train, rows)
         
-        # Get predictions on training set
-        y_pred_train = self.model.predict(X_train_scaled)
-        y_pred_train = np.where(y_pred_train == -1, 1, 0)  # Convert -1/1 to 1/0
-        
-        # Get anomaly scores
-        scores_train = -self.model.score_samples(X_train_scaled)  # Higher = more anomalous
+        # Get anomaly scores and predictions on training set
+        scores_train = self.anomaly_scores(X_train, rows)  # Higher = more anomalous
+        y_pred_train = self._predictions(scores_train)
         
         # Calculate metrics
+        y_train = y_train if rows is None else y_train[rows]
         train_metrics = self._calculate_metrics(y_train, y_pred_train, scores_train)
         
         print(f"\n✓ Training completed")
@@ -118,10 +237,24 @@ class AnomalyDetectionTrainer:
         
         return train_metrics
     
-    def evaluate(self, X_test: np.ndarray, y_test: np.ndarray) -> Dict:
+    def update(self, X_new: np.ndarray):
+        """
+        Keep learning from new (unlabeled) sessions without retraining.
+        Only the streaming detector supports this; the scaler stays as fitted.
+        """
+        if not hasattr(self.model, 'partial_fit'):
+            raise TypeError(f"{type(self.model).__name__} cannot learn incrementally; retrain it instead")
+        for chunk in self._chunks(X_new):
+            self.model.partial_fit(chunk)
+    
+    def evaluate(self, X_test: np.ndarray, y_test: np.ndarray,
+                 rows: Optional[np.ndarray] = None) -> Dict:
         """
         Evaluate model on test set.
         
+        Args:
+            rows: Indices of the test rows of X_test and y_test (default: all)
+        
         Returns:
             Test metrics
         """
@@ -129,17 +262,12 @@ class AnomalyDetectionTrainer:
         print("MODEL EVALUATION")
         print("="*60)
         
-        # Standardize features
-        X_test_scaled = self.scaler.transform(X_test)
-        
-        # Get predictions
-        y_pred = self.model.predict(X_test_scaled)
-        y_pred = np.where(y_pred == -1, 1, 0)
-        
-        # Get anomaly scores
-        scores = -self.model.score_samples(X_test_scaled)
+        # Get anomaly scores and predictions, chunk by chunk
+        scores = self.anomaly_scores(X_test, rows)
+        y_pred = self._predictions(scores)
         
         # Calculate metrics
+        y_test = y_test if rows is None else y_test[rows]
         test_metrics = self._calculate_metrics(y_test, y_pred, scores)
         
         # Print results
@@ -188,29 +316,40 @@ class AnomalyDetectionTrainer:
         return metrics
     
     def get_feature_importance(self, X: np.ndarray, y: np.ndarray, 
-                              top_n: int = 15) -> Dict:
+                              top_n: int = 15, rows: Optional[np.ndarray] = None,
+                              max_samples: int = 50000) -> Dict:
         """
         Calculate feature importance using permutation method.
         
+        Args:
+            rows: Indices of the rows of X and y to use (default: all)
+            max_samples: Use a random subset of at most this many rows
+        
         Returns:
             Dictionary of feature names and importance scores
         """
         print("\nCalculating feature importance...")
         
-        X_scaled = self.scaler.transform(X)
+        rng = np.random.default_rng(self.random_state)
+        rows = np.arange(len(X)) if rows is None else np.asarray(rows)
+        if len(rows) > max_samples:
+            rows = np.sort(rng.choice(rows, max_samples, replace=False))
+        X_scaled = np.concatenate(list(self._chunks(X, rows)))
+        y = y[rows]
         base_score = -self.model.score_samples(X_scaled)
         base_auc = roc_auc_score(y, base_score)
         
         importances = []
         
         for i, feature_name in enumerate(self.feature_names):
-            # Permute feature
-            X_permuted = X_scaled.copy()
-            np.random.shuffle(X_permuted[:, i])
+            # Permute feature in place, then put it back (no copy of the matrix)
+            original = X_scaled[:, i].copy()
+            X_scaled[:, i] = rng.permutation(original)
             
             # Calculate score with permuted feature
-            permuted_score = -self.model.score_samples(X_permuted)
+            permuted_score = -self.model.score_samples(X_scaled)
             permuted_auc = roc_auc_score(y, permuted_score)
+            X_scaled[:, i] = original
             
             # Importance = drop in performance
             importance = base_auc - permuted_auc
@@ -246,7 +385,7 @@ class AnomalyDetectionTrainer:
             'feature_names': self.feature_names,
             'contamination': self.contamination,
             'n_features': len(self.feature_names),
-            'model_type': 'IsolationForest',
+            'model_type': type(self.model).__name__,
             'n_estimators': self.model.n_estimators
         }
         
@@ -270,47 +409,62 @@ class AnomalyDetectionTrainer:
         print(f"  - Model: {metadata['model_type']}")
 
 
-def train_complete_model():
-    """Complete training pipeline."""
+def train_complete_model(detector: str = 'isolation_forest', scale: int = 1,
+                         features_path: Optional[str] = None):
+    """
+    Complete training pipeline.
+    
+    Args:
+        detector: 'isolation_forest' or 'half_space_trees'
+        scale: Multiplies the number of generated sessions of every type
+        features_path: Train out-of-core: stream the features into this .npy
+            memmap instead of holding the dataset and matrix in memory
+            (the dataset JSON is not written)
+    """
     print("\n" + "="*60)
     print("BEHAVIORAL ANOMALY DETECTION - TRAINING PIPELINE")
     print("="*60)
     
-    # Step 1: Generate synthetic data
-    print("\nStep 1: Generating synthetic data...")
+    counts = dict(n_normal=1200 * scale, n_copy_paste=80 * scale, n_tab_switch=80 * scale,
+                  n_bot=70 * scale, n_collab=70 * scale)
     generator = BehaviorDataGenerator(seed=42)
-    dataset = generator.generate_dataset(
-        n_normal=1200,
-        n_copy_paste=80,
-        n_tab_switch=80,
-        n_bot=70,
-        n_collab=70
-    )
-    
-    # Save dataset
-    generator.save_dataset(dataset, 'synthetic_exam_data.json')
+    trainer = AnomalyDetectionTrainer(contamination=0.15, detector=detector)
     
-    # Step 2: Prepare data
-    trainer = AnomalyDetectionTrainer(contamination=0.15)
-    X, y, user_ids = trainer.prepare_data(dataset)
+    if features_path:
+        # Steps 1-2: Generate sessions and extract features on the fly, to disk
+        print("\nStep 1: Generating synthetic data and features...")
+        X, y = trainer.prepare_memmap(generator.iter_dataset(**counts), sum(counts.values()), features_path)
+    else:
+        # Step 1: Generate synthetic data
+        print("\nStep 1: Generating synthetic data...")
+        dataset = generator.generate_dataset(**counts)
+        
+        # Save dataset
+        generator.save_dataset(dataset, 'synthetic_exam_data.json')
+        
+        # Step 2: Prepare data
+        X, y, user_ids = trainer.prepare_data(dataset)
+        del dataset
     
-    # Step 3: Split data
-    X_train, X_test, y_train, y_test = train_test_split(
-        X, y, test_size=0.2, random_state=42, stratify=y
+    # Step 3: Split data (row indices, so neither part is copied out of X)
+    train_rows, test_rows = train_test_split(
+        np.arange(len(X)), test_size=0.2, random_state=42, stratify=y
     )
+    train_rows.sort()
+    test_rows.sort()
     
     print(f"\nData split:")
-    print(f"  - Training: {X_train.shape[0]} samples")
-    print(f"  - Testing: {X_test.shape[0]} samples")
+    print(f"  - Training: {len(train_rows)} samples")
+    print(f"  - Testing: {len(test_rows)} samples")
     
     # Step 4: Train model
-    train_metrics = trainer.train(X_train, y_train)
+    train_metrics = trainer.train(X, y, rows=train_rows)
     
     # Step 5: Evaluate model
-    test_metrics = trainer.evaluate(X_test, y_test)
+    test_metrics = trainer.evaluate(X, y, rows=test_rows)
     
     # Step 6: Feature importance
-    importance = trainer.get_feature_importance(X_test, y_test, top_n=15)
+    importance = trainer.get_feature_importance(X, y, top_n=15, rows=test_rows)
     
     # Step 7: Save model
     trainer.save_model()
@@ -329,7 +483,7 @@ def train_complete_model():
     print("TRAINING COMPLETED SUCCESSFULLY!")
     print("="*60)
     print("\nFiles generated:")
-    print("  1. synthetic_exam_data.json - Training dataset")
+    print(f"  1. {features_path or 'synthetic_exam_data.json'} - Training " + ("features" if features_path else "dataset"))
     print("  2. anomaly_detector.joblib - Trained model")
     print("  3. feature_scaler.joblib - Feature scaler")
     print("  4. model_metadata.json - Model configuration")
@@ -340,4 +494,11 @@ def train_complete_model():
 
 
 if __name__ == "__main__":
-    trainer, metrics = train_complete_model()
\ No newline at end of file
+    import argparse
+    parser = argparse.ArgumentParser(description='Train the behavioral anomaly detector')
+    parser.add_argument('--detector', choices=DETECTORS, default='isolation_forest')
+    parser.add_argument('--scale', type=int, default=1, help='Multiply the generated dataset size')
+    parser.add_argument('--features-path', help='Train out-of-core from this float32 .npy memmap')
+    args = parser.parse_args()
+    trainer, metrics = train_complete_model(detector=args.detector, scale=args.scale,
+                                            features_path=args.features_path)
\ No newline at end of file
@@ -0,0 +1,186 @@
+"""
+Production Retraining
+Retrains the anomaly detector on real sessions from the feature reservoir
+and publishes it as a new model version
+
+Run by the backend in a separate, low-priority process (see
+backend/app/services/model_retrainer.py), or by hand:
+
+    python production_retrain.py --reservoir production/reservoir.f32 --models-dir production/models
+
+Versions are directories models-dir/v0001, v0002, ... holding the same
+artifacts as model_trainer.py (anomaly_detector.joblib, feature_scaler.joblib,
+model_metadata.json). A version is written under a temporary name and renamed
+when complete, then models-dir/CURRENT is replaced atomically to point at it,
+so a reader never sees a half-written model.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+import zlib
+from datetime import datetime
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+
+from feature_reservoir import FeatureReservoir
+from model_trainer import AnomalyDetectionTrainer, DETECTORS
+from synthetic_data_generator import BehaviorDataGenerator
+from feature_extractor import BehaviorFeatureExtractor
+
+CURRENT_FILE = 'CURRENT'
+CHEATER_TYPES = ('copy_paste_cheater', 'tab_switcher', 'bot_assisted', 'collaborative_cheater')
+
+EXIT_NOT_ENOUGH_DATA = 3
+EXIT_REJECTED = 4
+
+
+def current_version(models_dir: str):
+    """Name of the published version, or None"""
+    try:
+        with open(os.path.join(models_dir, CURRENT_FILE)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def next_version(models_dir: str) -> str:
+    numbers = [int(name[1:]) for name in os.listdir(models_dir)
+               if name.startswith('v') and name[1:].isdigit()]
+    return f"v{max(numbers, default=0) + 1:04d}"
+
+
+def publish(models_dir: str, version: str):
+    """Point CURRENT at version (atomic replace)"""
+    tmp_path = os.path.join(models_dir, f"{CURRENT_FILE}.tmp{os.getpid()}")
+    with open(tmp_path, 'w') as f:
+        f.write(version + '\n')
+    os.replace(tmp_path, os.path.join(models_dir, CURRENT_FILE))
+
+
+def prune(models_dir: str, keep: int):
+    """Delete all but the newest `keep` versions (never the published one)"""
+    current = current_version(models_dir)
+    versions = sorted(name for name in os.listdir(models_dir)
+                      if name.startswith('v') and name[1:].isdigit())
+    for name in versions[:-keep] if keep > 0 else []:
+        if name != current:
+            shutil.rmtree(os.path.join(models_dir, name), ignore_errors=True)
+
+
+def synthetic_cheaters(n_per_type: int, seed: int):
+    """
+    Feature vectors of generated cheating sessions (the promotion check's
+    positives) and the extractor's feature names.
+    """
+    generator = BehaviorDataGenerator(seed=seed)
+    extractor = BehaviorFeatureExtractor()
+    sessions = [generator.generate_user_session(t) for t in CHEATER_TYPES for _ in range(n_per_type)]
+    X = np.array([extractor.extract_all_features(s) for s in sessions], dtype=np.float32)
+    return X, extractor.get_feature_names()
+
+
+def retrain(reservoir_path: str, models_dir: str, n_features: int, layout_id: int,
+            min_samples: int = 500, max_risk: float = 0.7, contamination: float = 0.05,
+            min_auc: float = 0.75, keep: int = 5, seed: int = 42,
+            detector: str = 'isolation_forest') -> int:
+    """
+    Train on the reservoir and publish a new version if it passes the check.
+
+    Returns:
+        Process exit code (0 = published)
+    """
+    start = time.time()
+    reservoir = FeatureReservoir(reservoir_path, n_features, layout_id=layout_id, readonly=True)
+    # Train straight from the memmap, chunk by chunk, without copying the
+    # reservoir. Writers keep replacing rows meanwhile; a replaced row is
+    # just another uniformly sampled session.
+    features = reservoir.features()
+    seen = reservoir.seen
+
+    # Sessions that ended high-risk are likely cheaters; keep them out of "normal"
+    risk = np.array(reservoir.values())
+    normal_rows = np.flatnonzero(np.isnan(risk) | (risk < max_risk))
+    print(f"✓ Reservoir: {len(features)} rows of {seen} sessions seen, {len(normal_rows)} below risk {max_risk}")
+    if len(normal_rows) < min_samples:
+        print(f"Not enough sessions to retrain ({len(normal_rows)} < {min_samples})")
+        return EXIT_NOT_ENOUGH_DATA
+
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(normal_rows)
+    n_holdout = max(1, len(order) // 5)
+    holdout_rows, train_rows = np.sort(order[:n_holdout]), np.sort(order[n_holdout:])
+
+    cheaters, feature_names = synthetic_cheaters(max(25, min(n_holdout, 20000) // 8), seed)
+    if layout_id and zlib.crc32(','.join(feature_names).encode()) != layout_id:
+        print("Rejected: the reservoir was written with another feature layout than this extractor's")
+        return EXIT_REJECTED
+
+    trainer = AnomalyDetectionTrainer(contamination=contamination, random_state=seed, detector=detector)
+    trainer.feature_names = feature_names
+    trainer.fit(features, train_rows)
+
+    # Promotion check: held-out real sessions vs generated cheaters
+    scores = np.r_[trainer.anomaly_scores(features, holdout_rows), trainer.anomaly_scores(cheaters)]
+    labels = np.r_[np.zeros(len(holdout_rows)), np.ones(len(cheaters))]
+    holdout_auc = float(roc_auc_score(labels, scores))
+    print(f"✓ Trained on {len(train_rows)} sessions, holdout ROC-AUC vs synthetic cheaters {holdout_auc:.3f}")
+    if holdout_auc < min_auc:
+        print(f"Rejected: ROC-AUC {holdout_auc:.3f} < {min_auc}")
+        return EXIT_REJECTED
+
+    os.makedirs(models_dir, exist_ok=True)
+    version = next_version(models_dir)
+    tmp_dir = os.path.join(models_dir, f".{version}.tmp{os.getpid()}")
+    os.makedirs(tmp_dir)
+    trainer.save_model(
+        model_path=os.path.join(tmp_dir, 'anomaly_detector.joblib'),
+        scaler_path=os.path.join(tmp_dir, 'feature_scaler.joblib'),
+        metadata_path=os.path.join(tmp_dir, 'model_metadata.json')
+    )
+    with open(os.path.join(tmp_dir, 'training_info.json'), 'w') as f:
+        json.dump({
+            'version': version,
+            'trained_at': datetime.utcnow().isoformat(),
+            'source': 'production',
+            'reservoir_rows': int(len(features)),
+            'reservoir_seen': seen,
+            'train_samples': int(len(train_rows)),
+            'holdout_samples': int(len(holdout_rows)),
+            'holdout_auc': holdout_auc,
+            'contamination': contamination,
+            'detector': detector,
+            'max_risk': max_risk,
+            'layout_id': layout_id,
+            'seconds': round(time.time() - start, 1)
+        }, f, indent=2)
+    os.rename(tmp_dir, os.path.join(models_dir, version))
+    publish(models_dir, version)
+    prune(models_dir, keep)
+    print(f"✓ Published model {version}")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Retrain the anomaly detector on production sessions')
+    parser.add_argument('--reservoir', required=True, help='Feature reservoir file')
+    parser.add_argument('--models-dir', required=True, help='Directory of model versions')
+    parser.add_argument('--n-features', type=int, default=40)
+    parser.add_argument('--layout-id', type=int, default=0)
+    parser.add_argument('--min-samples', type=int, default=500)
+    parser.add_argument('--max-risk', type=float, default=0.7, help='Leave out sessions at or above this final risk')
+    parser.add_argument('--contamination', type=float, default=0.05)
+    parser.add_argument('--min-auc', type=float, default=0.75, help='Publish only at this holdout ROC-AUC or better')
+    parser.add_argument('--keep', type=int, default=5, help='Model versions to keep on disk')
+    parser.add_argument('--detector', choices=DETECTORS, default='isolation_forest')
+    args = parser.parse_args()
+
+    sys.exit(retrain(
+        args.reservoir, args.models_dir, args.n_features, args.layout_id,
+        min_samples=args.min_samples, max_risk=args.max_risk, contamination=args.contamination,
+        min_auc=args.min_auc, keep=args.keep, detector=args.detector
+    ))
@@ -1,12 +1,41 @@
 """
 Main Execution Script
 Runs the complete behavioral analytics pipeline
+
+Each phase is a cached stage (see stage_cache.py). A stage is rerun only when
+its parameters, its inputs or its source code (the modules listed below and
+its stage function here) change, and a rerun stage invalidates every stage
+after it:
+
+    generate  (seed, dataset size; synthetic_data_generator.py)
+      -> features  (feature_extractor.py)
+        -> train  (detector, contamination, split; model_trainer.py, streaming_detector.py)
+
+The trained model is then published next to this script, where the backend
+loads it (anomaly_detector.joblib, feature_scaler.joblib, model_metadata.json).
 """
 
+import json
 import os
+import shutil
 import sys
 import time
 
+import joblib
+import numpy as np
+
+from stage_cache import StageCache
+
+ML_MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+CACHE_DIR = os.path.join(ML_MODEL_DIR, '.pipeline_cache')
+STAGES = ('generate', 'features', 'train')
+MODEL_FILES = ('anomaly_detector.joblib', 'feature_scaler.joblib', 'model_metadata.json', 'training_results.json')
+USER_TYPES = ('normal', 'copy_paste_cheater', 'tab_switcher', 'bot_assisted', 'collaborative_cheater')
+
+
+def source(name):
+    return os.path.join(ML_MODEL_DIR, name)
+
 
 def print_banner():
     """Print startup banner"""
@@ -31,229 +60,242 @@ def print_phase(phase_num, phase_name, description):
     print(f"→ {description}\n")
 
 
-def run_pipeline(skip_data_gen=False, skip_training=False):
+def print_cached(result):
+    print(f"✓ Cache hit ({result.key[:12]}) - reusing outputs from {result.manifest['created']}, "
+          f"{result.saved_seconds:.1f}s saved")
+
+
+# ---- stages: each writes its outputs into out_dir ----
+
+def pack_session(session):
+    """Store the session's lists as float arrays (pickled as one buffer instead of per float)"""
+    return {key: {k: np.asarray(v, dtype=np.float64) if isinstance(v, list) else v for k, v in value.items()}
+            if isinstance(value, dict) else value
+            for key, value in session.items()}
+
+
+def generate_stage(params):
+    def run(out_dir, inputs):
+        from synthetic_data_generator import BehaviorDataGenerator
+
+        generator = BehaviorDataGenerator(seed=params['seed'])
+        sessions = [pack_session(s) for s in generator.generate_dataset(**params['counts'])]
+        joblib.dump(sessions, os.path.join(out_dir, 'sessions.joblib'))
+        return {'sessions': len(sessions)}
+    return run
+
+
+def features_stage(out_dir, inputs):
+    from feature_extractor import BehaviorFeatureExtractor
+
+    sessions = joblib.load(inputs['generate'].file('sessions.joblib'))
+    extractor = BehaviorFeatureExtractor()
+    X = None
+    for i, session in enumerate(sessions):
+        features = extractor.extract_all_features(session)
+        if X is None:
+            X = np.lib.format.open_memmap(os.path.join(out_dir, 'features.npy'), mode='w+',
+                                          dtype=np.float32, shape=(len(sessions), len(features)))
+        X[i] = features
+    X.flush()
+    np.save(os.path.join(out_dir, 'labels.npy'), np.array([s['label'] for s in sessions], dtype=np.int8))
+    with open(os.path.join(out_dir, 'feature_names.json'), 'w') as f:
+        json.dump(extractor.get_feature_names(), f)
+    return {'samples': int(X.shape[0]), 'features': int(X.shape[1])}
+
+
+def train_stage(params):
+    def run(out_dir, inputs):
+        from sklearn.model_selection import train_test_split
+        from model_trainer import AnomalyDetectionTrainer
+
+        features = inputs['features']
+        X = np.load(features.file('features.npy'), mmap_mode='r')
+        y = np.load(features.file('labels.npy'))
+
+        trainer = AnomalyDetectionTrainer(contamination=params['contamination'],
+                                          random_state=params['seed'], detector=params['detector'])
+        with open(features.file('feature_names.json')) as f:
+            trainer.feature_names = json.load(f)
+
+        train_rows, test_rows = train_test_split(
+            np.arange(len(X)), test_size=params['test_size'], random_state=params['seed'], stratify=y
+        )
+        train_rows.sort()
+        test_rows.sort()
+
+        train_metrics = trainer.train(X, y, rows=train_rows)
+        test_metrics = trainer.evaluate(X, y, rows=test_rows)
+        importance = trainer.get_feature_importance(X, y, top_n=10, rows=test_rows)
+
+        trainer.save_model(
+            model_path=os.path.join(out_dir, 'anomaly_detector.joblib'),
+            scaler_path=os.path.join(out_dir, 'feature_scaler.joblib'),
+            metadata_path=os.path.join(out_dir, 'model_metadata.json')
+        )
+        with open(os.path.join(out_dir, 'training_results.json'), 'w') as f:
+            json.dump({
+                'train_metrics': train_metrics,
+                'test_metrics': test_metrics,
+                'feature_importance': importance
+            }, f, indent=2)
+        return {'roc_auc': test_metrics['roc_auc'], 'f1': test_metrics['f1']}
+    return run
+
+
+def publish(result):
+    """Copy the trained model next to this script, replacing each file atomically"""
+    for name in MODEL_FILES:
+        target = os.path.join(ML_MODEL_DIR, name)
+        tmp_path = f"{target}.tmp{os.getpid()}"
+        shutil.copyfile(result.file(name), tmp_path)
+        os.replace(tmp_path, target)
+
+
+def run_pipeline(seed=42, scale=1, detector='isolation_forest', contamination=0.15,
+                 force=(), use_cache=True, keep=3):
     """
     Run the complete pipeline
-    
+
     Args:
-        skip_data_gen: Skip data generation if data already exists
-        skip_training: Skip training if model already exists
+        seed: Random seed for data generation, split and model
+        scale: Multiplies the number of generated sessions of every type
+        detector: 'isolation_forest' or 'half_space_trees'
+        contamination: Expected proportion of anomalies
+        force: Stages to rerun even if cached (the stages after them rerun too)
+        use_cache: If False, rerun every stage
+        keep: Cache entries to keep per stage
+
+    Returns:
+        Cache report (stages, hits, saved_seconds)
     """
+    import sklearn
+
     start_time = time.time()
-    
+    cache = StageCache(CACHE_DIR, enabled=use_cache)
+    forced = False
+
     print_banner()
-    
+
     # Phase 1: Data Generation
-    if not skip_data_gen or not os.path.exists('synthetic_exam_data.npy'):
-        print_phase(1, "SYNTHETIC DATA GENERATION", 
-                   "Creating realistic behavioral data with normal and cheating patterns")
-        
-        from synthetic_data_generator import BehavioralDataGenerator
-        
-        generator = BehavioralDataGenerator(seed=42)
-        sessions = generator.generate_dataset(n_normal=1200, n_cheating_per_type=60)
-        generator.save_dataset(sessions, 'synthetic_exam_data.npy')
-        
-        print(f"\n✓ Phase 1 complete: Generated {len(sessions)} sessions")
-    else:
-        print_phase(1, "SYNTHETIC DATA GENERATION", "SKIPPED - Data already exists")
-    
+    print_phase(1, "SYNTHETIC DATA GENERATION",
+               "Creating realistic behavioral data with normal and cheating patterns")
+    forced = forced or 'generate' in force
+    counts = dict(n_normal=1200 * scale, n_copy_paste=80 * scale, n_tab_switch=80 * scale,
+                  n_bot=70 * scale, n_collab=70 * scale)
+    generated = cache.run('generate', generate_stage({'seed': seed, 'counts': counts}),
+                          params={'seed': seed, 'counts': counts},
+                          code=[source('synthetic_data_generator.py'), generate_stage, pack_session],
+                          force=forced)
+    if generated.hit:
+        print_cached(generated)
+    print(f"\n✓ Phase 1 complete: {generated.manifest['summary']['sessions']} sessions")
+
     # Phase 2: Feature Extraction
-    if not skip_data_gen or not os.path.exists('features_X.npy'):
-        print_phase(2, "FEATURE EXTRACTION",
-                   "Extracting 40+ behavioral features from raw data")
-        
-        import numpy as np
-        from feature_extractor import BehavioralFeatureExtractor
-        
-        sessions = np.load('synthetic_exam_data.npy', allow_pickle=True)
-        extractor = BehavioralFeatureExtractor()
-        
-        X = extractor.extract_features_batch(sessions)
-        y = np.array([s['label'] for s in sessions])
-        
-        np.save('features_X.npy', X)
-        np.save('labels_y.npy', y)
-        
-        print(f"\n✓ Phase 2 complete: Extracted {X.shape[1]} features from {X.shape[0]} sessions")
-    else:
-        print_phase(2, "FEATURE EXTRACTION", "SKIPPED - Features already exist")
-    
+    print_phase(2, "FEATURE EXTRACTION",
+               "Extracting 40 behavioral features from raw data")
+    forced = forced or 'features' in force
+    features = cache.run('features', features_stage, params={},
+                         inputs={'generate': generated},
+                         code=[source('feature_extractor.py'), features_stage], force=forced)
+    if features.hit:
+        print_cached(features)
+    summary = features.manifest['summary']
+    print(f"\n✓ Phase 2 complete: Extracted {summary['features']} features from {summary['samples']} sessions")
+
     # Phase 3: Model Training
-    if not skip_training or not os.path.exists('anomaly_detection_model.joblib'):
-        print_phase(3, "MODEL TRAINING",
-                   "Training Isolation Forest for global anomaly detection")
-        
-        import numpy as np
-        from model_trainer import AnomalyDetectionModel
-        from feature_extractor import BehavioralFeatureExtractor
-        
-        X = np.load('features_X.npy')
-        y = np.load('labels_y.npy')
-        
-        sessions = np.load('synthetic_exam_data.npy', allow_pickle=True)
-        extractor = BehavioralFeatureExtractor()
-        _ = extractor.extract_all_features(sessions[0])
-        feature_names = extractor.get_feature_names()
-        
-        model = AnomalyDetectionModel(contamination=0.2, random_state=42)
-        X_train, X_test, y_train, y_test = model.prepare_data(X, y, test_size=0.2)
-        model.train(X_train, feature_names)
-        
-        metrics, predictions, scores = model.evaluate(X_test, y_test)
-        model.plot_score_distribution(scores, y_test)
-        model.plot_roc_curve(y_test, scores)
-        
-        print("\n→ Computing feature importance...")
-        importances, top_features = model.get_feature_importance(X_test, y_test, n_top=10)
-        
-        model.save_model('anomaly_detection_model.joblib')
-        
-        print(f"\n✓ Phase 3 complete: Model trained with {metrics['roc_auc']:.3f} ROC AUC")
-    else:
-        print_phase(3, "MODEL TRAINING", "SKIPPED - Model already exists")
-    
-    # Phase 4: Baseline Profiling Demo
-    print_phase(4, "BASELINE PROFILING & RISK SCORING",
-               "Demonstrating personalized anomaly detection")
-    
-    from baseline_profiler import UserBaselineProfiler, HybridRiskScorer
-    from feature_extractor import BehavioralFeatureExtractor
-    from synthetic_data_generator import BehavioralDataGenerator
-    import numpy as np
-    
-    generator = BehavioralDataGenerator(seed=42)
-    extractor = BehavioralFeatureExtractor()
-    
-    # Generate sample sessions
-    mock_test = generator.generate_session(duration_seconds=120, session_type='normal')
-    normal_exam = generator.generate_session(duration_seconds=3600, session_type='normal')
-    cheating_exam = generator.generate_session(duration_seconds=3600, session_type='cheating_copy_paste')
-    
-    # Create baseline
-    profiler = UserBaselineProfiler()
-    baseline = profiler.create_baseline_profile(mock_test, extractor)
-    profiler.save_baseline(baseline, 'demo_user_baseline.joblib')
-    
-    # Initialize scorer and evaluate
-    scorer = HybridRiskScorer('anomaly_detection_model.joblib')
-    
-    print("\n→ Evaluating normal exam session:")
-    normal_risk = scorer.compute_risk_score(normal_exam, baseline, extractor)
-    print(f"   Risk Score: {normal_risk['hybrid_risk_score']:.3f} [{normal_risk['risk_level']}]")
-    
-    print("\n→ Evaluating cheating exam session:")
-    cheating_risk = scorer.compute_risk_score(cheating_exam, baseline, extractor)
-    print(f"   Risk Score: {cheating_risk['hybrid_risk_score']:.3f} [{cheating_risk['risk_level']}]")
-    
-    print(f"\n✓ Phase 4 complete: Baseline profiling demonstrated")
-    
-    # Phase 5: Integration Demo
-    print_phase(5, "INTEGRATION & API DEMO",
-               "Running integration examples for teammates")
-    
-    print("\n→ Running integration examples...")
-    print("   (See integration_demo.py for detailed examples)")
-    
-    from integration_demo import BehavioralAnalyticsAPI
-    
-    api = BehavioralAnalyticsAPI('anomaly_detection_model.joblib')
-    
-    # Create a quick demo baseline
-    mock_data = {
-        'mouse': {
-            'timestamps': np.linspace(0, 120, 1200),
-            'x': np.cumsum(np.random.randn(1200) * 10),
-            'y': np.cumsum(np.random.randn(1200) * 10),
-            'velocities': np.abs(np.random.randn(1200) * 50),
-            'clicks': np.random.randint(0, 2, 1200)
-        },
-        'keystroke': {
-            'timestamps': np.sort(np.random.uniform(0, 120, 200)),
-            'intervals': np.random.gamma(2, 100, 200),
-            'backspace_indices': np.random.choice(200, 10, replace=False),
-            'paste_timestamps': np.array([20, 60]),
-            'n_keystrokes': 200,
-            'n_paste': 2
-        },
-        'tab_switch': {
-            'switch_times': np.array([30, 90]),
-            'away_durations': np.array([2, 3]),
-            'n_switches': 2,
-            'total_time_away': 5
-        },
-        'duration': 120
+    print_phase(3, "MODEL TRAINING",
+               f"Training {detector} for global anomaly detection")
+    forced = forced or 'train' in force
+    train_params = {
+        'seed': seed,
+        'detector': detector,
+        'contamination': contamination,
+        'test_size': 0.2,
+        'sklearn': sklearn.__version__,
+        'numpy': np.__version__
     }
-    
-    baseline = api.create_user_baseline(mock_data, user_id='demo_user')
-    api.save_user_baseline(baseline, 'api_demo_baseline.joblib')
-    
-    print("   ✓ API examples ready")
-    print(f"\n✓ Phase 5 complete: Integration demonstrated")
-    
+    trained = cache.run('train', train_stage(train_params), params=train_params,
+                        inputs={'features': features},
+                        code=[source('model_trainer.py'), source('streaming_detector.py'), train_stage],
+                        force=forced)
+    if trained.hit:
+        print_cached(trained)
+    publish(trained)
+    print(f"\n✓ Phase 3 complete: Model trained with {trained.manifest['summary']['roc_auc']:.3f} ROC AUC "
+          f"and published to {ML_MODEL_DIR}")
+
+    # Phase 4: Risk Scoring Demo
+    print_phase(4, "RISK SCORING",
+               "Scoring fresh sessions of each type with the published model")
+
+    from synthetic_data_generator import BehaviorDataGenerator
+    from feature_extractor import BehaviorFeatureExtractor
+
+    model = joblib.load(os.path.join(ML_MODEL_DIR, 'anomaly_detector.joblib'))
+    scaler = joblib.load(os.path.join(ML_MODEL_DIR, 'feature_scaler.joblib'))
+    generator = BehaviorDataGenerator(seed=seed + 1)
+    extractor = BehaviorFeatureExtractor()
+    for user_type in USER_TYPES:
+        vector = np.nan_to_num(extractor.extract_all_features(generator.generate_user_session(user_type)))
+        score = float(model.decision_function(scaler.transform(vector.reshape(1, -1)))[0])
+        risk = 1.0 / (1.0 + np.exp(score * 5))  # same mapping as the backend
+        print(f"   {user_type:<24} risk {risk:.3f}")
+
+    print("\n✓ Phase 4 complete: Risk scoring demonstrated")
+
     # Summary
+    report = cache.report()
+    cache.prune(keep)
+
     elapsed_time = time.time() - start_time
     minutes = int(elapsed_time // 60)
     seconds = int(elapsed_time % 60)
-    
+
     print("\n" + "="*70)
     print("PIPELINE EXECUTION COMPLETE")
     print("="*70)
     print(f"\n⏱️  Total execution time: {minutes}m {seconds}s\n")
-    
-    print("📦 Generated Files:")
-    files = [
-        ('synthetic_exam_data.npy', 'Raw synthetic behavioral data'),
-        ('features_X.npy', 'Extracted feature matrix'),
-        ('labels_y.npy', 'Labels (0=normal, 1=cheating)'),
-        ('anomaly_detection_model.joblib', 'Trained Isolation Forest model'),
-        ('score_distribution.png', 'Visualization of anomaly scores'),
-        ('roc_curve.png', 'ROC curve for model performance'),
-        ('demo_user_baseline.joblib', 'Example user baseline profile'),
-        ('api_demo_baseline.joblib', 'API demo baseline')
-    ]
-    
-    for filename, description in files:
-        if os.path.exists(filename):
-            print(f"   ✓ {filename:<35} - {description}")
-    
-    print("\n🚀 Next Steps:")
-    print("   1. Review model performance in score_distribution.png and roc_curve.png")
-    print("   2. Run integration_demo.py for detailed usage examples")
-    print("   3. Share these files with your teammates:")
-    print("      • anomaly_detection_model.joblib")
-    print("      • feature_extractor.py")
-    print("      • baseline_profiler.py")
-    print("      • integration_demo.py")
-    print("   4. Your teammates can use BehavioralAnalyticsAPI for integration")
-    
-    print("\n📖 Documentation:")
-    print("   • README.md - Complete project documentation")
-    print("   • integration_demo.py - Integration guide with examples")
-    
+
+    print("📦 Published Files:")
+    descriptions = {
+        'anomaly_detector.joblib': 'Trained anomaly detection model',
+        'feature_scaler.joblib': 'Feature scaler',
+        'model_metadata.json': 'Model configuration',
+        'training_results.json': 'Performance metrics'
+    }
+    for filename in MODEL_FILES:
+        print(f"   ✓ {filename:<35} - {descriptions[filename]}")
+    print(f"\n   Stage outputs are cached in {CACHE_DIR}")
+
     print("\n" + "="*70)
     print("✅ ALL SYSTEMS READY FOR HACKATHON DEMO!")
     print("="*70 + "\n")
 
+    return report
+
 
 if __name__ == "__main__":
     import argparse
-    
+
     parser = argparse.ArgumentParser(description='Run behavioral analytics pipeline')
-    parser.add_argument('--skip-data', action='store_true',
-                       help='Skip data generation if data exists')
-    parser.add_argument('--skip-training', action='store_true',
-                       help='Skip model training if model exists')
-    parser.add_argument('--quick', action='store_true',
-                       help='Skip both data generation and training if files exist')
-    
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--scale', type=int, default=1, help='Multiply the generated dataset size')
+    parser.add_argument('--detector', choices=('isolation_forest', 'half_space_trees'), default='isolation_forest')
+    parser.add_argument('--contamination', type=float, default=0.15)
+    parser.add_argument('--force', action='append', choices=STAGES, default=[],
+                       help='Rerun this stage (and the ones after it) even if cached')
+    parser.add_argument('--no-cache', action='store_true',
+                       help='Rerun every stage')
+    parser.add_argument('--keep', type=int, default=3,
+                       help='Cache entries to keep per stage')
+
     args = parser.parse_args()
-    
-    skip_data = args.skip_data or args.quick
-    skip_training = args.skip_training or args.quick
-    
+
     try:
-        run_pipeline(skip_data_gen=skip_data, skip_training=skip_training)
+        run_pipeline(seed=args.seed, scale=args.scale, detector=args.detector,
+                     contamination=args.contamination, force=tuple(args.force),
+                     use_cache=not args.no_cache, keep=args.keep)
     except KeyboardInterrupt:
         print("\n\n⚠️  Pipeline interrupted by user")
         sys.exit(1)
@@ -261,4 +303,4 @@ if __name__ == "__main__":
         print(f"\n\n❌ Error during execution: {str(e)}")
         import traceback
         traceback.print_exc()
-        sys.exit(1)
\ No newline at end of file
+        sys.exit(1)
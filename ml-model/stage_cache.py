@@ -0,0 +1,187 @@
+"""
+Stage Cache for the Training Pipeline
+Content-addressed cache of pipeline stage outputs: a stage is rerun only when
+its inputs, parameters or code change
+"""
+
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Union
+
+CACHE_VERSION = 1
+MANIFEST = 'manifest.json'
+
+
+class StageResult:
+    """Outcome of one stage: where its outputs are and whether they came from the cache"""
+    
+    def __init__(self, stage: str, key: str, path: str, hit: bool, seconds: float, manifest: Dict):
+        self.stage = stage
+        self.key = key
+        self.path = path
+        self.hit = hit
+        self.seconds = seconds
+        self.manifest = manifest
+        # A hit saves the time the stage took when it was cached
+        self.saved_seconds = max(0.0, manifest.get('seconds', 0.0) - seconds) if hit else 0.0
+    
+    def file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+
+def file_digest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class StageCache:
+    """
+    Stores each stage's output files in cache_dir/<stage>/<key>/, where key is
+    a SHA-256 over:
+
+    - the stage name and its parameters (canonical JSON)
+    - the keys of the stages it reads from
+    - the source of the files and functions that implement it
+
+    Any change to one of these gives a new key, so a stale entry is never
+    reused. Because a stage's key contains its inputs' keys, a change
+    upstream also gives new keys to every stage downstream of it. Entries are
+    written to a temporary directory and renamed when complete, so an
+    interrupted run leaves no half-written entry behind. Each entry's manifest
+    records how long the stage took, which is the time a later hit saves.
+    """
+
+    def __init__(self, cache_dir: str = '.pipeline_cache', enabled: bool = True):
+        """
+        Args:
+            cache_dir: Directory holding the cached stage outputs
+            enabled: If False every stage runs (outputs are still cached for later runs)
+        """
+        self.cache_dir = cache_dir
+        self.enabled = enabled
+        self.results: List[StageResult] = []
+        self._code_digests: Dict[str, str] = {}
+
+    @staticmethod
+    def code_name(code: Union[str, Callable]) -> str:
+        return os.path.basename(code) if isinstance(code, str) else code.__qualname__
+
+    def code_digest(self, code: Union[str, Callable]) -> str:
+        """SHA-256 of a source file, or of a function's source"""
+        if not isinstance(code, str):
+            return hashlib.sha256(inspect.getsource(code).encode()).hexdigest()
+        if code not in self._code_digests:
+            self._code_digests[code] = file_digest(code)
+        return self._code_digests[code]
+
+    def code_digests(self, code: List[Union[str, Callable]]) -> Dict[str, str]:
+        return {self.code_name(c): self.code_digest(c) for c in code}
+
+    def key(self, stage: str, params: Dict, inputs: Dict[str, StageResult],
+            code: List[Union[str, Callable]]) -> str:
+        description = {
+            'cache_version': CACHE_VERSION,
+            'stage': stage,
+            'params': params,
+            'inputs': {name: result.key for name, result in sorted(inputs.items())},
+            'code': self.code_digests(code)
+        }
+        return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+    def run(self, stage: str, fn: Callable[[str, Dict[str, StageResult]], Optional[Dict]],
+            params: Dict, inputs: Optional[Dict[str, StageResult]] = None,
+            code: Optional[List[Union[str, Callable]]] = None, force: bool = False) -> StageResult:
+        """
+        Return the stage's cached outputs, or run fn(out_dir, inputs) to produce them.
+
+        Args:
+            stage: Stage name
+            fn: Writes the stage's output files into out_dir; may return a dict of
+                summary values to keep in the manifest
+            params: Everything besides inputs and code that affects the outputs
+            inputs: Results of the stages this one reads
+            code: Source files and functions whose changes invalidate the outputs
+            force: Run even on a cache hit (and replace the entry)
+
+        Returns:
+            StageResult
+        """
+        inputs = inputs or {}
+        key = self.key(stage, params, inputs, code or [])
+        path = os.path.join(self.cache_dir, stage, key)
+        manifest_path = os.path.join(path, MANIFEST)
+
+        start = time.time()
+        if self.enabled and not force and os.path.exists(manifest_path):
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            os.utime(path)  # most recently used, for prune()
+            result = StageResult(stage, key, path, hit=True, seconds=time.time() - start,
+                                 manifest=manifest)
+            self.results.append(result)
+            return result
+
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+        try:
+            summary = fn(tmp_path, inputs) or {}
+        except BaseException:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            raise
+        manifest = {
+            'stage': stage,
+            'key': key,
+            'params': params,
+            'inputs': {name: result.key for name, result in inputs.items()},
+            'code': self.code_digests(code or []),
+            'files': sorted(name for name in os.listdir(tmp_path)),
+            'summary': summary,
+            'seconds': round(time.time() - start, 3),
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        with open(os.path.join(tmp_path, MANIFEST), 'w') as f:
+            json.dump(manifest, f, indent=2, default=str)
+        shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmp_path, path)
+
+        result = StageResult(stage, key, path, hit=False, seconds=time.time() - start, manifest=manifest)
+        self.results.append(result)
+        return result
+
+    def prune(self, keep: int = 3):
+        """Delete all but the `keep` most recently used entries of each stage (never this run's)"""
+        if not os.path.isdir(self.cache_dir):
+            return
+        in_use = {result.path for result in self.results}
+        for stage in os.listdir(self.cache_dir):
+            stage_dir = os.path.join(self.cache_dir, stage)
+            entries = sorted((os.path.join(stage_dir, name) for name in os.listdir(stage_dir)),
+                             key=os.path.getmtime, reverse=True)
+            for entry in entries[keep:]:
+                if entry not in in_use:
+                    shutil.rmtree(entry, ignore_errors=True)
+
+    def report(self) -> Dict:
+        """Print which stages were cache hits and the time they saved"""
+        print(f"\n{'Stage':<12} {'Result':<8} {'Key':<14} {'Time':>9} {'Saved':>9}")
+        for result in self.results:
+            status = 'hit' if result.hit else 'run'
+            saved = f"{result.saved_seconds:8.1f}s" if result.hit else f"{'-':>9}"
+            print(f"{result.stage:<12} {status:<8} {result.key[:12]:<14} {result.seconds:8.1f}s {saved}")
+        hits = sum(result.hit for result in self.results)
+        saved = sum(result.saved_seconds for result in self.results)
+        print(f"\n✓ {hits}/{len(self.results)} stages from cache, {saved:.1f}s saved")
+        return {
+            'stages': [{'stage': r.stage, 'hit': r.hit, 'key': r.key, 'seconds': round(r.seconds, 3),
+                        'saved_seconds': round(r.saved_seconds, 3)} for r in self.results],
+            'hits': hits,
+            'saved_seconds': round(saved, 3)
+        }
@@ -0,0 +1,226 @@
+"""
+Streaming Anomaly Detector
+Half-Space Trees (Tan, Ting & Liu, 2011): an ensemble that learns incrementally
+with partial_fit, in constant memory, as an alternative to Isolation Forest
+"""
+
+import numpy as np
+from typing import Optional
+
+# Samples scored at a time: bounds the (batch, n_estimators, max_depth + 1) path arrays
+SCORE_BATCH = 2048
+
+
+class HalfSpaceTrees:
+    """
+    Ensemble of random half-space trees over a fixed-size, streaming window.
+
+    Each tree is a complete binary tree of depth max_depth. A node splits its
+    region of the feature space in half along a random feature. The trees are
+    built once from random choices and never depend on the data. Learning
+    only counts how many samples fall in each node ("mass"):
+
+    - samples update the latest window's masses (every node on their path)
+    - after window_size samples, the latest masses become the reference
+      profile and counting restarts, so the model follows drift
+    - a sample's score is, per tree, the reference mass of the deepest node
+      on its path that still holds at least size_limit samples, times 2^depth.
+      Dense regions score high. Anomalies land in sparse nodes early.
+
+    The trees live in NumPy arrays (split feature and value per node, two
+    mass arrays per tree), so memory is fixed by n_estimators and max_depth.
+    An update or a score costs n_estimators * max_depth array steps for a
+    whole batch, however many samples were seen.
+
+    Features are mapped into the unit cube first with streaming statistics:
+    a logistic of the z-score, which bounds the space the trees split
+    without a fixed min/max. The interface follows scikit-learn's outlier
+    detectors (fit, partial_fit, score_samples, decision_function, predict),
+    so the trainer and the backend scorer use it like IsolationForest.
+    """
+
+    def __init__(self, n_estimators: int = 25, max_depth: int = 10, window_size: int = 256,
+                 size_limit: Optional[float] = None, contamination: float = 0.15,
+                 random_state: Optional[int] = None):
+        """
+        Args:
+            n_estimators: Number of trees
+            max_depth: Depth of every tree (memory is n_estimators * 2^(max_depth+1) nodes)
+            window_size: Samples per window; the reference profile is the last full window
+            size_limit: Minimum reference mass for a node to be scored (default 0.1 * window_size)
+            contamination: Expected share of anomalies; sets the decision threshold
+            random_state: Random seed for the tree structure
+        """
+        self.n_estimators = n_estimators
+        self.max_depth = max_depth
+        self.window_size = window_size
+        self.size_limit = size_limit
+        self.contamination = contamination
+        self.random_state = random_state
+
+    # ---- structure ----
+
+    def _init_trees(self, n_features: int):
+        rng = np.random.default_rng(self.random_state)
+        n_internal = 2 ** self.max_depth - 1
+        n_nodes = 2 ** (self.max_depth + 1) - 1
+
+        self.n_features_in_ = n_features
+        self.split_features_ = np.empty((self.n_estimators, n_internal), dtype=np.int32)
+        self.split_values_ = np.empty((self.n_estimators, n_internal), dtype=np.float32)
+        for t in range(self.n_estimators):
+            # Random work space around [0, 1] (the paper's construction), split level by level
+            s = rng.random(n_features)
+            half = 2 * np.maximum(s, 1 - s)
+            lo, hi = (s - half)[None, :], (s + half)[None, :]
+            for depth in range(self.max_depth):
+                first = 2 ** depth - 1
+                n_level = 2 ** depth
+                features = rng.integers(0, n_features, n_level)
+                rows = np.arange(n_level)
+                mid = (lo[rows, features] + hi[rows, features]) / 2
+                self.split_features_[t, first:first + n_level] = features
+                self.split_values_[t, first:first + n_level] = mid
+                # Children (left, right) of every node of this level, in order
+                lo, hi = np.repeat(lo, 2, axis=0), np.repeat(hi, 2, axis=0)
+                hi[0::2][rows, features] = mid
+                lo[1::2][rows, features] = mid
+
+        self.node_depth_ = np.floor(np.log2(np.arange(n_nodes) + 1)).astype(np.int32)
+        self.reference_mass_ = np.zeros((self.n_estimators, n_nodes), dtype=np.float32)
+        self.latest_mass_ = np.zeros((self.n_estimators, n_nodes), dtype=np.float32)
+        self._window = np.empty((self.window_size, n_features), dtype=np.float32)
+        self._window_fill = 0
+        self.windows_seen_ = 0
+
+        self.n_samples_seen_ = 0
+        self.mean_ = np.zeros(n_features)
+        self.m2_ = np.zeros(n_features)
+        self.offset_ = -0.5
+
+    def _paths(self, U: np.ndarray) -> np.ndarray:
+        """(n, n_estimators, max_depth + 1) node index of each sample at each depth"""
+        n = len(U)
+        trees = np.arange(self.n_estimators)[None, :]
+        rows = np.arange(n)[:, None]
+        paths = np.zeros((n, self.n_estimators, self.max_depth + 1), dtype=np.int32)
+        node = np.zeros((n, self.n_estimators), dtype=np.int32)
+        for depth in range(self.max_depth):
+            feature = self.split_features_[trees, node]
+            right = U[rows, feature] > self.split_values_[trees, node]
+            node = 2 * node + 1 + right
+            paths[:, :, depth + 1] = node
+        return paths
+
+    # ---- feature normalization ----
+
+    def _update_stats(self, X: np.ndarray):
+        """Chan's parallel update of the running mean and M2 with a batch"""
+        n = len(X)
+        batch_mean = X.mean(axis=0)
+        batch_m2 = ((X - batch_mean) ** 2).sum(axis=0)
+        total = self.n_samples_seen_ + n
+        delta = batch_mean - self.mean_
+        self.mean_ = self.mean_ + delta * (n / total)
+        self.m2_ = self.m2_ + batch_m2 + delta ** 2 * (self.n_samples_seen_ * n / total)
+        self.n_samples_seen_ = total
+
+    def _to_unit(self, X: np.ndarray) -> np.ndarray:
+        std = np.sqrt(self.m2_ / max(self.n_samples_seen_ - 1, 1))
+        z = (X - self.mean_) / np.where(std > 0, std, 1.0)
+        return (1.0 / (1.0 + np.exp(-np.clip(z, -30, 30)))).astype(np.float32)
+
+    # ---- learning ----
+
+    def fit(self, X: np.ndarray, y=None) -> 'HalfSpaceTrees':
+        """Learn from scratch on X (streamed through the windows in order)"""
+        X = np.asarray(X, dtype=np.float64)
+        self._init_trees(X.shape[1])
+        self.partial_fit(X)
+        if not self.windows_seen_:
+            self._rotate()  # fewer samples than one window: use what there is
+        return self
+
+    def partial_fit(self, X: np.ndarray, y=None) -> 'HalfSpaceTrees':
+        """Update the model with a batch of new samples"""
+        X = np.atleast_2d(np.asarray(X, dtype=np.float64))
+        if not hasattr(self, 'split_features_'):
+            self._init_trees(X.shape[1])
+        if not len(X):
+            return self
+        self._update_stats(X)
+
+        n_nodes = self.latest_mass_.shape[1]
+        tree_offsets = (np.arange(self.n_estimators) * n_nodes)[None, :, None]
+        start = 0
+        while start < len(X):
+            take = min(len(X) - start, self.window_size - self._window_fill)
+            chunk = X[start:start + take]
+            U = self._to_unit(chunk)
+            paths = self._paths(U)
+            nodes = (paths.astype(np.int64) + tree_offsets).ravel()
+            if len(nodes) * 8 < self.latest_mass_.size:
+                # Small batch (a single session): touch only the nodes on its paths
+                np.add.at(self.latest_mass_.reshape(-1), nodes, 1)
+            else:
+                counts = np.bincount(nodes, minlength=self.latest_mass_.size)
+                self.latest_mass_ += counts.reshape(self.latest_mass_.shape).astype(np.float32)
+            self._window[self._window_fill:self._window_fill + take] = chunk
+            self._window_fill += take
+            start += take
+            if self._window_fill == self.window_size:
+                self._rotate()
+        return self
+
+    def _rotate(self):
+        """The latest window becomes the reference profile; the threshold follows it"""
+        # A fresh array rather than zeroing the old reference in place: a scorer
+        # on another thread may still be reading it
+        self.reference_mass_, self.latest_mass_ = self.latest_mass_, np.zeros_like(self.latest_mass_)
+        window = self._window[:self._window_fill]
+        self._window_fill = 0
+        self.windows_seen_ += 1
+        if len(window):
+            scores = self.score_samples(window)
+            self.offset_ = float(np.percentile(scores, 100.0 * self.contamination))
+
+    # ---- scoring ----
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """
+        Normality score in [-1, 0] (higher = more normal), on the same scale
+        and sign convention as IsolationForest.score_samples.
+        """
+        X = np.atleast_2d(X)
+        if len(X) > SCORE_BATCH:
+            return np.concatenate([self.score_samples(X[i:i + SCORE_BATCH])
+                                   for i in range(0, len(X), SCORE_BATCH)])
+        U = self._to_unit(np.asarray(X, dtype=np.float64))
+        paths = self._paths(U)
+        mass = self.reference_mass_[np.arange(self.n_estimators)[None, :, None], paths]
+
+        size_limit = self.size_limit if self.size_limit is not None else 0.1 * self.window_size
+        # Deepest node on the path still holding size_limit samples (the root always counts)
+        holds = mass >= size_limit
+        holds[:, :, 0] = True
+        depth = self.max_depth - np.argmax(holds[:, :, ::-1], axis=2)
+        terminal = np.take_along_axis(mass, depth[:, :, None], axis=2)[:, :, 0]
+
+        score = np.log2(1.0 + terminal * np.exp2(depth))
+        best = np.log2(1.0 + self.window_size * 2.0 ** self.max_depth)
+        return score.mean(axis=1) / best - 1.0
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Negative for outliers, like IsolationForest.decision_function"""
+        return self.score_samples(X) - self.offset_
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        """-1 for outliers, 1 for inliers"""
+        return np.where(self.decision_function(X) < 0, -1, 1)
+
+    @property
+    def memory_bytes(self) -> int:
+        """Size of the model's arrays; fixed, whatever the number of samples seen"""
+        arrays = (self.split_features_, self.split_values_, self.reference_mass_,
+                  self.latest_mass_, self._window, self.node_depth_)
+        return int(sum(a.nbytes for a in arrays))
@@ -4,7 +4,7 @@ Generates realistic exam-taking behavior with normal and cheating patterns
 """
 
 import numpy as np
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Tuple
 import json
 
 class BehaviorDataGenerator:
@@ -279,14 +279,27 @@ class BehaviorDataGenerator:
         print(f"  - Bot-assisted: {n_bot}")
         print(f"  - Collaborative cheaters: {n_collab}")
         
-        dataset = []
+        dataset = list(self.iter_dataset(n_normal, n_copy_paste, n_tab_switch, n_bot, n_collab))
         
+        print(f"✓ Generated {len(dataset)} total sessions")
+        return dataset
+    
+    def iter_dataset(self,
+                     n_normal: int = 1200,
+                     n_copy_paste: int = 80,
+                     n_tab_switch: int = 80,
+                     n_bot: int = 70,
+                     n_collab: int = 70) -> Iterator[Dict]:
+        """
+        Yield the sessions of generate_dataset one at a time, in the same order,
+        so a large dataset never has to be held in memory.
+        """
         # Generate normal users
         for i in range(n_normal):
             session = self.generate_user_session('normal')
             session['label'] = 0  # Normal
             session['user_id'] = f"normal_{i}"
-            dataset.append(session)
+            yield session
         
         # Generate cheating patterns
         cheating_types = [
@@ -301,10 +314,7 @@ class BehaviorDataGenerator:
                 session = self.generate_user_session(cheat_type)
                 session['label'] = 1  # Anomaly
                 session['user_id'] = f"{cheat_type}_{i}"
-                dataset.append(session)
-        
-        print(f"✓ Generated {len(dataset)} total sessions")
-        return dataset
+                yield session
     
     def save_dataset(self, dataset: List[Dict], filepath: str):
         """Save dataset to JSON file."""